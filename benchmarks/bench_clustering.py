@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 2026
+Copyright (C) 2017
+@author: Derek Pisner (dPys)
+
+Speed and stability benchmark for pynets.fmri.clustools.
+
+Generates synthetic BOLD volumes with planted parcels at several mask sizes, times the local connectivity
+estimators, the normalized cut eigendecomposition and discretisation and every clustering type, scores each
+parcellation against the planted parcels by adjusted Rand index (ARI) and across repeats by their mutual ARI, and
+stores the results as JSON so that runs from different commits can be compared:
+
+    python -m benchmarks.bench_clustering --sizes 10 16 24 --out clust_new.json --compare clust_old.json
+"""
+import warnings
+import numpy as np
+import nibabel as nib
+warnings.filterwarnings("ignore")
+
+SIZES = [10, 16, 24]
+
+
+def synthetic_bold(size, n_splits=2, n_timepoints=100, noise=0.75, seed=42):
+    """
+    Generate a 4D BOLD image with planted parcels: the mask, a cube of `size` voxels per side, is divided into
+    n_splits ** 3 blocks, and every voxel of a block follows the block's latent time-series plus Gaussian noise.
+
+    Parameters
+    ----------
+    size : int
+        Number of voxels per side of the mask.
+    n_splits : int
+        Number of blocks per side of the mask. Default is 2.
+    n_timepoints : int
+        Number of volumes. Default is 100.
+    noise : float
+        Standard deviation of the voxel noise, relative to the unit variance latent signals. Default is 0.75.
+    seed : int
+        Random seed. Default is 42.
+
+    Returns
+    -------
+    func_img : Nifti1Image
+        4D Nifti1Image of shape (size + 2) ** 3 x n_timepoints, with a one voxel border outside of the mask.
+    mask_img : Nifti1Image
+        3D Nifti1Image of the mask.
+    truth : array
+        Planted parcel label of each mask voxel, in C order.
+    """
+    rng = np.random.RandomState(seed)
+    affine = np.diag([2., 2., 2., 1.])
+    block = np.minimum(np.arange(size) * n_splits // size, n_splits - 1)
+    parcels = (block[:, None, None] * n_splits + block[None, :, None]) * n_splits + block[None, None, :]
+
+    mskdat = np.zeros((size + 2,) * 3, dtype='uint8')
+    mskdat[1:-1, 1:-1, 1:-1] = 1
+    truth = parcels.ravel()
+    latent = rng.randn(n_splits ** 3, n_timepoints)
+    data = np.zeros(mskdat.shape + (n_timepoints,), dtype='float32')
+    data[mskdat > 0] = 100 + latent[truth] + noise * rng.randn(len(truth), n_timepoints)
+    return nib.Nifti1Image(data, affine), nib.Nifti1Image(mskdat, affine), truth
+
+
+def _prepare(size, tmp_dir, r_thresh=0.5):
+    """
+    Synthetic data and the intermediate results consumed by each benchmarked stage at one mask size.
+    """
+    from pynets.fmri.clustools import make_local_connectivity_tcorr, ncut
+    from pynets.fmri.fmri_utils import bold_voxel_matrix
+    from pynets.fmri.estimation import clean_node_signals
+
+    func_img, mask_img, truth = synthetic_bold(size)
+    k = int(truth.max()) + 1
+    mskdat = np.asarray(mask_img.dataobj) > 0
+    features = clean_node_signals(bold_voxel_matrix(func_img, np.flatnonzero(mskdat)).T, None, True, None, None).T
+    data_path = "%s%s%s%s" % (tmp_dir, '/voxels_', size, '.npy')
+    np.save(data_path, features.astype('float32'))
+    W = make_local_connectivity_tcorr(func_img, mask_img, r_thresh)
+    return {'func_img': func_img, 'mask_img': mask_img, 'mskdat': mskdat, 'truth': truth, 'k': k,
+            'r_thresh': r_thresh, 'features': features, 'data_path': data_path, 'W': W,
+            'eigen_vec': ncut(W, k)[1]}
+
+
+def _atlas_labels(out_img, mskdat):
+    return np.asarray(out_img.dataobj)[mskdat]
+
+
+def get_methods():
+    """
+    Clustering stages to time, each as a callable of the data prepared by `_prepare` that returns the cluster label
+    of every mask voxel, or None for stages that do not parcellate.
+    """
+    from sklearn.feature_extraction.image import grid_to_graph
+    from pynets.fmri import clustools
+
+    def _hierarchical(linkage):
+        return lambda d: clustools.hierarchical_parcellations(d['features'], [d['k']],
+                                                              connectivity=grid_to_graph(*d['mskdat'].shape,
+                                                                                         mask=d['mskdat']),
+                                                              linkage=linkage)[0]
+
+    def _component(clust_type):
+        return lambda d: clustools._cluster_component(d['data_path'], np.arange(len(d['truth'])), d['mskdat'],
+                                                      d['mask_img'].affine, d['k'], clust_type)
+
+    def _unlabelled(func):
+        def _run(d):
+            func(d)
+        return _run
+
+    methods = {
+        'local_conn_tcorr': _unlabelled(lambda d: clustools.make_local_connectivity_tcorr(d['func_img'], d['mask_img'],
+                                                                                          d['r_thresh'])),
+        'local_conn_scorr': _unlabelled(lambda d: clustools.make_local_connectivity_scorr(d['func_img'], d['mask_img'],
+                                                                                          d['r_thresh'])),
+        'ncut_arpack': _unlabelled(lambda d: clustools.ncut(d['W'], d['k'], solver='arpack')),
+        'ncut_lobpcg': _unlabelled(lambda d: clustools.ncut(d['W'], d['k'], solver='lobpcg')),
+        'discretisation': lambda d: np.asarray(clustools.discretisation(d['eigen_vec']).argmax(axis=1)).ravel(),
+        'clust_ncut': lambda d: _atlas_labels(clustools.parcellate_ncut_k_list(d['W'], [d['k']], d['mask_img'])[0],
+                                              d['mskdat']),
+        'clust_kmeans': _component('kmeans'),
+        'clust_rena': _component('rena'),
+    }
+    for linkage in ['ward', 'complete', 'average', 'single']:
+        methods["%s%s" % ('clust_', linkage)] = _hierarchical(linkage)
+    return methods
+
+
+def _time_call(func, data, repeats):
+    import io
+    import time
+    from contextlib import redirect_stdout
+
+    times = []
+    labels = []
+    for _ in range(repeats):
+        with redirect_stdout(io.StringIO()):
+            start_time = time.perf_counter()
+            out = func(data)
+            times.append(time.perf_counter() - start_time)
+        labels.append(out)
+    return min(times), labels
+
+
+def score_labels(labels, truth):
+    """
+    Adjusted Rand index of the first labelling against the planted parcels, and the lowest adjusted Rand index
+    between the first labelling and any repeat (1 for a reproducible method).
+
+    Returns
+    -------
+    ari : float
+        Agreement with the planted parcels, or None if the stage does not parcellate.
+    stability : float
+        Agreement across repeats, or None if the stage does not parcellate or ran once.
+    """
+    from sklearn.metrics import adjusted_rand_score
+
+    if labels[0] is None:
+        return None, None
+    ari = float(adjusted_rand_score(truth, labels[0]))
+    stability = min([float(adjusted_rand_score(labels[0], repeat)) for repeat in labels[1:]]) if \
+        len(labels) > 1 else None
+    return ari, stability
+
+
+def run_benchmarks(sizes=SIZES, methods=None, repeats=3, time_budget=600):
+    """
+    Time and score each clustering stage at each mask size.
+
+    Parameters
+    ----------
+    sizes : list
+        Numbers of voxels per side of the synthetic masks.
+    methods : list
+        Names of the stages to time. Default is all.
+    repeats : int
+        Number of timed repeats; the fastest is reported. Default is 3.
+    time_budget : int
+        Seconds allowed per stage and size before it is recorded as timed out. Default is 600.
+
+    Returns
+    -------
+    results : list
+        One dictionary per stage and size, with keys `method`, `n_voxels`, `seconds`, `ari`, `stability` and
+        `status`.
+    """
+    import io
+    import shutil
+    import tempfile
+    from contextlib import redirect_stdout
+    from pynets.core.utils import timeout
+
+    all_methods = get_methods()
+    results = []
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for size in sizes:
+            with redirect_stdout(io.StringIO()):
+                data = _prepare(size, tmp_dir)
+            n_voxels = len(data['truth'])
+            for name in (methods or sorted(all_methods.keys())):
+                result = {'method': name, 'n_voxels': int(n_voxels), 'seconds': None, 'ari': None,
+                          'stability': None, 'status': 'ok'}
+                try:
+                    result['seconds'], labels = timeout(int(time_budget))(_time_call)(all_methods[name], data,
+                                                                                      repeats)
+                    result['ari'], result['stability'] = score_labels(labels, data['truth'])
+                except Exception as e:
+                    result['status'] = 'timeout' if type(e).__name__ == 'TimeoutError' else "%s%s%s" % (
+                        type(e).__name__, ': ', e)
+                print("%s%s%s%s%s%s%s" % (name, ' @ ', n_voxels, ' voxels: ',
+                                          "%.4fs" % result['seconds'] if result['seconds'] is not None else '',
+                                          " ARI %.3f" % result['ari'] if result['ari'] is not None else '',
+                                          '' if result['status'] == 'ok' else result['status']))
+                results.append(result)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+def _environment():
+    import os
+    import platform
+    import subprocess
+    import scipy
+    import sklearn
+    import nilearn
+
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'cpu_count': os.cpu_count(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+            'sklearn': sklearn.__version__, 'nilearn': nilearn.__version__}
+
+
+def compare(results, baseline):
+    """
+    Ratio of the timings in `results` to those of a `baseline` run, and change of their ARI against the planted
+    parcels, keyed by (method, n_voxels). Ratios above 1 are slowdowns and negative changes are losses of accuracy.
+    """
+    base = {(r['method'], r['n_voxels']): r for r in baseline['timings']}
+    changes = {}
+    for r in results['timings']:
+        key = (r['method'], r['n_voxels'])
+        if key not in base:
+            continue
+        ratio = r['seconds'] / base[key]['seconds'] if r['seconds'] is not None and base[key]['seconds'] else None
+        ari_change = r['ari'] - base[key]['ari'] if r['ari'] is not None and base[key]['ari'] is not None else None
+        changes["%s%s%s" % (key[0], '@', key[1])] = (ratio, ari_change)
+    return changes
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Benchmark PyNets clustering speed and stability.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help='Numbers of voxels per side of the synthetic masks.')
+    parser.add_argument('--methods', nargs='+', default=None, help='Subset of stages to time.')
+    parser.add_argument('--repeats', type=int, default=3, help='Timed repeats per stage and size.')
+    parser.add_argument('--time-budget', type=int, default=600, help='Seconds allowed per stage and size.')
+    parser.add_argument('--out', default='bench_clustering.json', help='Output JSON file.')
+    parser.add_argument('--compare', default=None, help='A previous output JSON file to compare against.')
+    args = parser.parse_args(argv)
+
+    output = {'environment': _environment(),
+              'timings': run_benchmarks(args.sizes, args.methods, args.repeats, args.time_budget)}
+    with open(args.out, 'w') as f:
+        json.dump(output, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            for key, (ratio, ari_change) in sorted(compare(output, json.load(f)).items()):
+                print("%s%s%s%s" % (key, ': ', "%.2fx" % ratio if ratio is not None else '-',
+                                    " ARI %+.3f" % ari_change if ari_change is not None else ''))
+
+    return 1 if any(r['status'] != 'ok' for r in output['timings']) else 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 2026
+Copyright (C) 2017
+@author: Derek Pisner (dPys)
+
+Benchmark and equivalence harness for pynets.core.thresholding.
+
+Times every thresholding method on synthetic symmetric connectivity matrices of increasing size, checks that
+optimized implementations return the same masks as their reference versions, and stores the results as JSON so
+that runs from different commits can be compared:
+
+    python -m benchmarks.bench_thresholding --sizes 100 400 1000 2000 --out thr_new.json --compare thr_old.json
+"""
+import warnings
+import numpy as np
+import networkx as nx
+warnings.filterwarnings("ignore")
+
+SIZES = [100, 400, 1000, 2000]
+
+
+def synthetic_conn_matrix(n_nodes, n_timepoints=200, n_communities=8, seed=42):
+    """
+    Generate a symmetric correlation matrix with modular structure from synthetic time-series.
+
+    Parameters
+    ----------
+    n_nodes : int
+        Number of nodes.
+    n_timepoints : int
+        Number of time-points in the synthetic time-series. Default is 200.
+    n_communities : int
+        Number of communities sharing a latent signal. Default is 8.
+    seed : int
+        Random seed. Default is 42.
+
+    Returns
+    -------
+    conn_matrix : array
+        Symmetric NxN correlation matrix with a zero diagonal.
+    """
+    rng = np.random.RandomState(seed)
+    latent = rng.randn(n_timepoints, n_communities)
+    membership = rng.randint(0, n_communities, n_nodes)
+    ts = latent[:, membership] + 2 * rng.randn(n_timepoints, n_nodes)
+    conn_matrix = np.corrcoef(ts.T)
+    np.fill_diagonal(conn_matrix, 0)
+    return conn_matrix
+
+
+def _knn_reference(conn_matrix, k):
+    """Row-by-row k-nearest neighbour graph, as originally implemented in thresholding.knn."""
+    gra = nx.Graph()
+    nodes = list(range(len(conn_matrix[0])))
+    gra.add_nodes_from(nodes)
+    for i in nodes:
+        line = np.ma.masked_array(conn_matrix[i, :], mask=np.isnan(conn_matrix[i]))
+        line.mask[i] = True
+        for _ in range(k):
+            node = np.argmax(line)
+            if not np.isnan(conn_matrix[i, node]):
+                gra.add_edge(i, node)
+            line.mask[node] = True
+    return gra
+
+
+def _weight_to_distance_reference(G):
+    """Per-edge weight-to-distance conversion, as originally implemented in thresholding.weight_to_distance."""
+    edge_list = [v[2]['weight'] for v in G.edges(data=True)]
+    emax = np.max(edge_list) + 1 / float(G.number_of_nodes())
+    for edge in G.edges():
+        G.edges[edge[0], edge[1]]['distance'] = emax - G.edges[edge[0], edge[1]]['weight']
+    return G
+
+
+def _invert_reference(W):
+    """Fancy-indexed inversion, as originally implemented in thresholding.invert."""
+    W = W.copy()
+    E = np.where(W)
+    W[E] = 1. / W[E]
+    return W
+
+
+def _graph_to_array(G, n_nodes, weight='weight'):
+    return nx.to_numpy_array(G, nodelist=list(range(n_nodes)), weight=weight)
+
+
+def get_methods():
+    """
+    Thresholding methods to time, each as a callable of a raw connectivity matrix.
+    """
+    from pynets.core import thresholding
+
+    return {
+        'threshold_absolute': lambda W: thresholding.threshold_absolute(W, 0.2),
+        'threshold_proportional': lambda W: thresholding.threshold_proportional(W, 0.1),
+        'density_thresholding': lambda W: thresholding.density_thresholding(W.copy(), 0.1),
+        'local_thresholding_prop': lambda W: thresholding.local_thresholding_prop(W, list(range(len(W))),
+                                                                                  list(range(len(W))), 0.1),
+        'disparity_filter': lambda W: thresholding.disparity_filter(nx.from_numpy_array(np.abs(W))),
+        'knn_mask': lambda W: thresholding.knn_mask(W, 5),
+        'threshold_family': lambda W: thresholding.ThresholdFamily(W).materialize(0.1),
+        'distance_transform': lambda W: thresholding.distance_transform(np.abs(W), method='emax'),
+    }
+
+
+def get_equivalence_checks():
+    """
+    Pairs of (reference, candidate) callables of a raw connectivity matrix, each returning an NxN array. An
+    optimized implementation is equivalent to its reference if both arrays have identical non-zero masks and
+    numerically equal values.
+    """
+    from pynets.core import thresholding
+
+    return {
+        'knn': (lambda W: _graph_to_array(_knn_reference(W, 5), len(W)),
+                lambda W: thresholding.knn_mask(W, 5, sparse=False).astype('float64')),
+        'knn_graph': (lambda W: _graph_to_array(_knn_reference(W, 5), len(W)),
+                      lambda W: _graph_to_array(thresholding.knn(W, 5), len(W))),
+        'weight_to_distance': (lambda W: _graph_to_array(_weight_to_distance_reference(
+                                   nx.from_numpy_array(np.abs(W))), len(W), weight='distance'),
+                               lambda W: _graph_to_array(thresholding.weight_to_distance(
+                                   nx.from_numpy_array(np.abs(W))), len(W), weight='distance')),
+        'invert': (_invert_reference, lambda W: thresholding.invert(W, copy=True)),
+        'threshold_family': (lambda W: thresholding.threshold_proportional(W, 0.1),
+                             lambda W: thresholding.ThresholdFamily(W).materialize(0.1)),
+    }
+
+
+def _time_call(func, conn_matrix, repeats):
+    import io
+    import time
+    from contextlib import redirect_stdout
+
+    times = []
+    for _ in range(repeats):
+        with redirect_stdout(io.StringIO()):
+            start_time = time.perf_counter()
+            func(conn_matrix.copy())
+            times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+def check_equivalence(sizes=(100,), checks=None):
+    """
+    Run every equivalence check at each matrix size.
+
+    Parameters
+    ----------
+    sizes : list
+        Numbers of nodes of the synthetic matrices.
+    checks : list
+        Names of the equivalence checks to run. Default is all.
+
+    Returns
+    -------
+    results : list
+        One dictionary per check and size, with keys `check`, `n_nodes`, `identical_mask` and `max_abs_diff`.
+    """
+    import io
+    from contextlib import redirect_stdout
+
+    all_checks = get_equivalence_checks()
+    results = []
+    for n_nodes in sizes:
+        conn_matrix = synthetic_conn_matrix(n_nodes)
+        for name in (checks or sorted(all_checks.keys())):
+            reference, candidate = all_checks[name]
+            with redirect_stdout(io.StringIO()):
+                ref_out = np.asarray(reference(conn_matrix.copy()), dtype='float64')
+                cand_out = np.asarray(candidate(conn_matrix.copy()), dtype='float64')
+            results.append({'check': name, 'n_nodes': int(n_nodes),
+                            'identical_mask': bool(np.array_equal(ref_out != 0, cand_out != 0)),
+                            'max_abs_diff': float(np.max(np.abs(ref_out - cand_out))) if ref_out.size else 0.})
+    return results
+
+
+def run_benchmarks(sizes=SIZES, methods=None, repeats=3, time_budget=600):
+    """
+    Time each thresholding method at each matrix size.
+
+    Parameters
+    ----------
+    sizes : list
+        Numbers of nodes of the synthetic matrices.
+    methods : list
+        Names of the methods to time. Default is all.
+    repeats : int
+        Number of timed repeats; the fastest is reported. Default is 3.
+    time_budget : int
+        Seconds allowed per method and size before it is recorded as timed out. Default is 600.
+
+    Returns
+    -------
+    results : list
+        One dictionary per method and size, with keys `method`, `n_nodes`, `seconds` and `status`.
+    """
+    from pynets.core.utils import timeout
+
+    all_methods = get_methods()
+    results = []
+    for n_nodes in sizes:
+        conn_matrix = synthetic_conn_matrix(n_nodes)
+        for name in (methods or sorted(all_methods.keys())):
+            result = {'method': name, 'n_nodes': int(n_nodes), 'seconds': None, 'status': 'ok'}
+            try:
+                result['seconds'] = timeout(int(time_budget))(_time_call)(all_methods[name], conn_matrix,
+                                                                           repeats)
+            except Exception as e:
+                result['status'] = 'timeout' if type(e).__name__ == 'TimeoutError' else "%s%s%s" % (
+                    type(e).__name__, ': ', e)
+            print("%s%s%s%s%s%s" % (name, ' @ ', n_nodes, ' nodes: ',
+                                    "%.4fs" % result['seconds'] if result['seconds'] is not None else '',
+                                    '' if result['status'] == 'ok' else result['status']))
+            results.append(result)
+    return results
+
+
+def _environment():
+    import os
+    import platform
+    import subprocess
+    import scipy
+
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'cpu_count': os.cpu_count(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+            'networkx': nx.__version__}
+
+
+def compare(results, baseline):
+    """
+    Ratio of the timings in `results` to those of a `baseline` run, keyed by (method, n_nodes). Ratios above
+    1 are slowdowns.
+    """
+    base = {(r['method'], r['n_nodes']): r['seconds'] for r in baseline['timings']}
+    ratios = {}
+    for r in results['timings']:
+        key = (r['method'], r['n_nodes'])
+        if r['seconds'] is not None and base.get(key):
+            ratios["%s%s%s" % (key[0], '@', key[1])] = r['seconds'] / base[key]
+    return ratios
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Benchmark PyNets thresholding methods.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='Numbers of nodes to benchmark.')
+    parser.add_argument('--methods', nargs='+', default=None, help='Subset of methods to time.')
+    parser.add_argument('--repeats', type=int, default=3, help='Timed repeats per method and size.')
+    parser.add_argument('--time-budget', type=int, default=600, help='Seconds allowed per method and size.')
+    parser.add_argument('--check-sizes', type=int, nargs='+', default=[100, 400],
+                        help='Numbers of nodes at which to check equivalence against reference versions.')
+    parser.add_argument('--out', default='bench_thresholding.json', help='Output JSON file.')
+    parser.add_argument('--compare', default=None, help='A previous output JSON file to compare against.')
+    args = parser.parse_args(argv)
+
+    output = {'environment': _environment(),
+              'equivalence': check_equivalence(args.check_sizes),
+              'timings': run_benchmarks(args.sizes, args.methods, args.repeats, args.time_budget)}
+    with open(args.out, 'w') as f:
+        json.dump(output, f, indent=2)
+
+    failed = [r for r in output['equivalence'] if not r['identical_mask']]
+    for r in failed:
+        print("%s%s%s%s" % ('Equivalence FAILED: ', r['check'], ' @ ', r['n_nodes']))
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            for key, ratio in sorted(compare(output, json.load(f)).items()):
+                print("%s%s%.2fx" % (key, ': ', ratio))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -315,6 +315,12 @@ def get_parser():
                         help='Optionally use this flag if you wish to apply local thresholding via the Minimum '
                              'Spanning Tree approach. -thr values in this case correspond to a target density (if the '
                              '-dt flag is also included), otherwise a target proportional threshold.\n')
+    parser.add_argument('-thr_family',
+                        default=False,
+                        action='store_true',
+                        help='Optionally use this flag if you wish to store every proportional threshold of a graph '
+                             'in a single threshold family file, from which each thresholded graph is materialized '
+                             'on demand, instead of saving one graph per threshold.\n')
     parser.add_argument('-p',
                         metavar='Pruning strategy',
                         default=1,
@@ -528,6 +534,7 @@ def build_workflow(args, retval):
     dens_thresh = args.dt
     min_span_tree = args.mst
     disp_filt = args.df
+    thr_family = args.thr_family
     clust_type = args.ct
     if clust_type:
         if (type(clust_type) is list) and len(clust_type) > 1:
@@ -717,6 +724,11 @@ def build_workflow(args, retval):
             nilearn_parc_atlases = hardcoded_params['nilearn_parc_atlases']
             nilearn_coord_atlases = hardcoded_params['nilearn_coord_atlases']
             nilearn_prob_atlases = hardcoded_params['nilearn_prob_atlases']
+            # The BOLD cache is configured through the environment, so that it reaches every node process. Variables
+            # that are already set take precedence.
+            if hardcoded_params['bold_cache_dir'][0]:
+                os.environ.setdefault('PYNETS_BOLD_CACHE', str(hardcoded_params['bold_cache_dir'][0]))
+            os.environ.setdefault('PYNETS_BOLD_CACHE_GB', str(hardcoded_params['bold_cache_gb'][0]))
             runtime_dict = {}
             execution_dict = {}
             for i in range(len(hardcoded_params['resource_dict'])):
@@ -1502,7 +1514,7 @@ def build_workflow(args, retval):
                                curv_thr_list, step_list, overlap_thr, track_type, min_length, maxcrossing, directget,
                                tiss_class, runtime_dict, execution_dict, embed, multi_directget, multimodal, hpass,
                                hpass_list, template, template_mask, vox_size, multiplex, waymask, local_corr,
-                               min_length_list):
+                               min_length_list, thr_family=False):
         """A function interface for generating a single-subject workflow"""
         import warnings
         warnings.filterwarnings("ignore")
@@ -1564,7 +1576,7 @@ def build_workflow(args, retval):
                                         track_type, min_length, maxcrossing, directget, tiss_class, runtime_dict,
                                         execution_dict, embed, multi_directget, multimodal, hpass, hpass_list,
                                         template, template_mask, vox_size, multiplex, waymask, local_corr,
-                                        min_length_list)
+                                        min_length_list, thr_family=thr_family)
             meta_wf._n_procs = procmem[0]
             meta_wf._mem_gb = procmem[1]
             meta_wf.n_procs = procmem[0]
@@ -1686,7 +1698,7 @@ def build_workflow(args, retval):
                          binary, fbval, fbvec, target_samples, curv_thr_list, step_list, overlap_thr, track_type,
                          min_length, maxcrossing, directget, tiss_class, runtime_dict, execution_dict, embed,
                          multi_directget, multimodal, hpass, hpass_list, template, template_mask, vox_size, multiplex,
-                         waymask, local_corr, min_length_list):
+                         waymask, local_corr, min_length_list, thr_family=False):
         """A function interface for generating multiple single-subject workflows -- i.e. a 'multi-subject' workflow"""
         import warnings
         warnings.filterwarnings("ignore")
@@ -1744,7 +1756,7 @@ def build_workflow(args, retval):
                 directget=directget, tiss_class=tiss_class, runtime_dict=runtime_dict, execution_dict=execution_dict,
                 embed=embed, multi_directget=multi_directget, multimodal=multimodal, hpass=hpass, hpass_list=hpass_list,
                 template=template, template_mask=template_mask, vox_size=vox_size, multiplex=multiplex, waymask=waymask,
-                local_corr=local_corr, min_length_list=min_length_list)
+                local_corr=local_corr, min_length_list=min_length_list, thr_family=thr_family)
             wf_single_subject._n_procs = procmem[0]
             wf_single_subject._mem_gb = procmem[1]
             wf_single_subject.n_procs = procmem[0]
@@ -1825,7 +1837,8 @@ def build_workflow(args, retval):
                                     block_size, mask, norm, binary, fbval, fbvec, target_samples, curv_thr_list,
                                     step_list, overlap_thr, track_type, min_length, maxcrossing, directget, tiss_class,
                                     runtime_dict, execution_dict, embed, multi_directget, multimodal, hpass, hpass_list,
-                                    template, template_mask, vox_size, multiplex, waymask, local_corr, min_length_list)
+                                    template, template_mask, vox_size, multiplex, waymask, local_corr, min_length_list,
+                                    thr_family=thr_family)
         import warnings
         warnings.filterwarnings("ignore")
         import shutil
@@ -1916,7 +1929,8 @@ def build_workflow(args, retval):
                                     norm, binary, fbval, fbvec, target_samples, curv_thr_list, step_list, overlap_thr,
                                     track_type, min_length, maxcrossing, directget, tiss_class, runtime_dict,
                                     execution_dict, embed, multi_directget, multimodal, hpass, hpass_list, template,
-                                    template_mask, vox_size, multiplex, waymask, local_corr, min_length_list)
+                                    template_mask, vox_size, multiplex, waymask, local_corr, min_length_list,
+                                    thr_family=thr_family)
         import warnings
         warnings.filterwarnings("ignore")
         import shutil
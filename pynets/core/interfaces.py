@@ -15,7 +15,8 @@ class NetworkAnalysisInputSpec(BaseInterfaceInputSpec):
     network = traits.Any(mandatory=False)
     thr = traits.Any(mandatory=True)
     conn_model = traits.Str(mandatory=True)
-    est_path = File(exists=True, mandatory=True)
+    # Not required to exist, since graphs kept in a threshold family store are materialized on demand
+    est_path = File(exists=False, mandatory=True)
     roi = traits.Any(mandatory=False)
     prune = traits.Any(mandatory=False)
     norm = traits.Any(mandatory=False)
@@ -99,6 +100,8 @@ class _IndividualClusteringInputSpec(BaseInterfaceInputSpec):
     vox_size = traits.Str('2mm', mandatory=True, usedefault=True)
     local_corr = traits.Str('allcorr', mandatory=True, usedefault=True)
     mask = traits.Any(mandatory=False)
+    k_list = traits.Any(mandatory=False)
+    nthreads = traits.Int(1, usedefault=True)
 
 
 class _IndividualClusteringOutputSpec(TraitedSpec):
@@ -118,7 +121,7 @@ class IndividualClustering(SimpleInterface):
 
     def _run_interface(self, runtime):
         import gc
-        from nipype.utils.filemanip import fname_presuffix, copyfile
+        from pynets.core.utils import stage_input
         from pynets.fmri import clustools
         from pynets.registration.reg_utils import check_orient_and_dims
 
@@ -128,17 +131,14 @@ class IndividualClustering(SimpleInterface):
                                                      outdir=runtime.cwd)
 
         if self.inputs.mask:
-            out_name_mask = fname_presuffix(self.inputs.mask, suffix='_tmp', newpath=runtime.cwd)
-            copyfile(self.inputs.mask, out_name_mask, copy=True, use_hardlink=False)
+            out_name_mask = stage_input(self.inputs.mask, runtime.cwd)
         else:
             out_name_mask = None
 
-        out_name_func_file = fname_presuffix(self.inputs.func_file, suffix='_tmp', newpath=runtime.cwd)
-        copyfile(self.inputs.func_file, out_name_func_file, copy=True, use_hardlink=False)
+        out_name_func_file = stage_input(self.inputs.func_file, runtime.cwd)
 
         if self.inputs.conf:
-            out_name_conf = fname_presuffix(self.inputs.conf, suffix='_tmp', newpath=runtime.cwd)
-            copyfile(self.inputs.conf, out_name_conf, copy=True, use_hardlink=False)
+            out_name_conf = stage_input(self.inputs.conf, runtime.cwd)
         else:
             out_name_conf = None
 
@@ -148,13 +148,14 @@ class IndividualClustering(SimpleInterface):
                                      clust_type=self.inputs.clust_type,
                                      local_corr=self.inputs.local_corr,
                                      conf=out_name_conf,
-                                     mask=out_name_mask)
+                                     mask=out_name_mask,
+                                     k_list=self.inputs.k_list if self.inputs.k_list else None)
 
         atlas = nip.create_clean_mask()
-        nip.create_local_clustering(overwrite=True, r_thresh=0.4)
+        nip.create_local_clustering(overwrite=False, r_thresh=0.4)
 
         if self.inputs.clust_type in clust_list:
-            uatlas = nip.parcellate()
+            uatlas = nip.parcellate(n_jobs=self.inputs.nthreads)
         else:
             raise ValueError('Clustering method not recognized. '
                              'See: https://nilearn.github.io/modules/generated/nilearn.regions.Parcellations.'
@@ -215,26 +216,21 @@ class ExtractTimeseries(SimpleInterface):
 
     def _run_interface(self, runtime):
         import gc
-        from nipype.utils.filemanip import fname_presuffix, copyfile
+        from pynets.core.utils import stage_input
         from pynets.fmri import estimation
 
         if self.inputs.net_parcels_nii_path:
-            out_name_net_parcels_nii_path = fname_presuffix(self.inputs.net_parcels_nii_path, suffix='_tmp',
-                                                            newpath=runtime.cwd)
-            copyfile(self.inputs.net_parcels_nii_path, out_name_net_parcels_nii_path, copy=True, use_hardlink=False)
+            out_name_net_parcels_nii_path = stage_input(self.inputs.net_parcels_nii_path, runtime.cwd)
         else:
             out_name_net_parcels_nii_path = None
         if self.inputs.mask:
-            out_name_mask = fname_presuffix(self.inputs.mask, suffix='_tmp', newpath=runtime.cwd)
-            copyfile(self.inputs.mask, out_name_mask, copy=True, use_hardlink=False)
+            out_name_mask = stage_input(self.inputs.mask, runtime.cwd)
         else:
             out_name_mask = None
-        out_name_func_file = fname_presuffix(self.inputs.func_file, suffix='_tmp', newpath=runtime.cwd)
-        copyfile(self.inputs.func_file, out_name_func_file, copy=True, use_hardlink=False)
+        out_name_func_file = stage_input(self.inputs.func_file, runtime.cwd)
 
         if self.inputs.conf:
-            out_name_conf = fname_presuffix(self.inputs.conf, suffix='_tmp', newpath=runtime.cwd)
-            copyfile(self.inputs.conf, out_name_conf, copy=True, use_hardlink=False)
+            out_name_conf = stage_input(self.inputs.conf, runtime.cwd)
         else:
             out_name_conf = None
 
@@ -459,19 +455,15 @@ class RegisterDWI(SimpleInterface):
         import gc
         import os.path as op
         from pynets.registration import register
-        from nipype.utils.filemanip import fname_presuffix, copyfile
+        from pynets.core.utils import stage_input
 
-        anat_file_tmp_path = fname_presuffix(self.inputs.anat_file, suffix='_tmp', newpath=runtime.cwd)
-        copyfile(self.inputs.anat_file, anat_file_tmp_path, copy=True, use_hardlink=False)
+        anat_file_tmp_path = stage_input(self.inputs.anat_file, runtime.cwd)
 
-        fa_tmp_path = fname_presuffix(self.inputs.fa_path, suffix='_tmp', newpath=runtime.cwd)
-        copyfile(self.inputs.fa_path, fa_tmp_path, copy=True, use_hardlink=False)
+        fa_tmp_path = stage_input(self.inputs.fa_path, runtime.cwd)
 
-        ap_tmp_path = fname_presuffix(self.inputs.ap_path, suffix='_tmp', newpath=runtime.cwd)
-        copyfile(self.inputs.ap_path, ap_tmp_path, copy=True, use_hardlink=False)
+        ap_tmp_path = stage_input(self.inputs.ap_path, runtime.cwd)
 
-        B0_mask_tmp_path = fname_presuffix(self.inputs.B0_mask, suffix='_tmp', newpath=runtime.cwd)
-        copyfile(self.inputs.B0_mask, B0_mask_tmp_path, copy=True, use_hardlink=False)
+        B0_mask_tmp_path = stage_input(self.inputs.B0_mask, runtime.cwd)
 
         reg = register.DmriReg(basedir_path=runtime.cwd,
                                fa_path=fa_tmp_path,
@@ -543,13 +535,11 @@ class RegisterFunc(SimpleInterface):
         import gc
         import os.path as op
         from pynets.registration import register
-        from nipype.utils.filemanip import fname_presuffix, copyfile
+        from pynets.core.utils import stage_input
 
-        # anat_file_tmp_path = fname_presuffix(self.inputs.anat_file, suffix='_tmp', newpath=runtime.cwd)
-        # copyfile(self.inputs.anat_file, anat_file_tmp_path, copy=True, use_hardlink=False)
+        # anat_file_tmp_path = stage_input(self.inputs.anat_file, runtime.cwd)
         if self.inputs.mask:
-            mask_tmp_path = fname_presuffix(self.inputs.mask, suffix='_tmp', newpath=runtime.cwd)
-            copyfile(self.inputs.mask, mask_tmp_path, copy=True, use_hardlink=False)
+            mask_tmp_path = stage_input(self.inputs.mask, runtime.cwd)
         else:
             mask_tmp_path = None
 
@@ -195,6 +195,28 @@ def density_thresholding(conn_matrix, thr, max_iters=10000, interval=0.01):
     return conn_matrix
 
 
+def is_connected(in_mat):
+    """
+    Checks whether the undirected graph of a given connectivity matrix is connected, without building a
+    NetworkX graph.
+
+    Parameters
+    ----------
+    in_mat : NxN np.ndarray
+        weighted connectivity matrix.
+
+    Returns
+    -------
+    connected : bool
+        True if every node can be reached from every other node.
+    """
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    n_components = connected_components(csr_matrix(np.asarray(in_mat)), directed=False, return_labels=False)
+    return bool(n_components == 1)
+
+
 # Calculate density
 def est_density(in_mat):
     """
@@ -291,10 +313,55 @@ def invert(W, copy=False):
     ----------
     .. Adapted from Adapted from bctpy
     '''
+    return distance_transform(W, method='inv', copy=copy)
+
+
+def distance_transform(W, method='inv', copy=True, edges=None):
+    '''
+    Converts the weights of an input connection matrix to distances (connection
+    lengths) in a single array operation. Absent connections are left
+    as zeros. If copy is not set, this function will *modify W in place.*
+
+    Parameters
+    ----------
+    W : NxN np.ndarray
+        weighted connectivity matrix
+    method : str
+        distance transform.
+        'inv' : 1 / w
+        'emax' : max(w) + 1 / N - w, where N is the number of nodes
+        'neglog' : -log(w), for weights in the range (0, 1]. Weights of 1 (or more) have a length of eps, so
+        that the strongest connections are not turned into absent ones.
+    copy : bool
+        if True, returns a copy of the matrix. Otherwise, modifies the matrix
+        in place. Default value=True.
+    edges : NxN np.ndarray
+        boolean mask of the existing connections, for graphs whose edges may
+        have a weight of zero. Default is W != 0.
+
+    Returns
+    -------
+    W : NxN np.ndarray
+        connection-length matrix
+    '''
     if copy:
         W = W.copy()
-    E = np.where(W)
-    W[E] = 1. / W[E]
+    if method != 'inv' and not np.issubdtype(W.dtype, np.floating):
+        W = W.astype(np.float64)
+    E = W != 0 if edges is None else np.asarray(edges, dtype=bool)
+
+    if method == 'inv':
+        np.reciprocal(W, out=W, where=E)
+    elif method == 'emax':
+        if np.any(E):
+            emax = np.max(W[E]) + 1 / float(len(W))
+            np.subtract(emax, W, out=W, where=E)
+    elif method == 'neglog':
+        np.log(W, out=W, where=E)
+        np.negative(W, out=W, where=E)
+        np.maximum(W, np.finfo(W.dtype).eps, out=W, where=E)
+    else:
+        raise ValueError("%s%s" % ('Unrecognized distance transform: ', method))
 
     return W
 
@@ -549,15 +616,77 @@ def weight_to_distance(G):
     G : Object
         Inverted NetworkX graph equivalent to the distance measure.
     """
-    edge_list = [v[2]['weight'] for v in G.edges(data=True)]
-    # maximum edge value
-    emax = np.max(edge_list) + 1 / float(G.number_of_nodes())
-    for edge in G.edges():
-        G.edges[edge[0], edge[1]]['distance'] = emax - G.edges[edge[0], edge[1]]['weight']
+    nodes = list(G.nodes())
+    index = dict(zip(nodes, range(len(nodes))))
+    # The same array-level emax transform as distance_transform, read back onto the edges. Edges of zero weight are
+    # kept as connections, at the largest distance.
+    D = distance_transform(nx.to_numpy_array(G, nodelist=nodes, weight='weight'), method='emax', copy=False,
+                           edges=nx.to_numpy_array(G, nodelist=nodes, weight=None) > 0)
+    nx.set_edge_attributes(G, dict([((u, v), float(D[index[u], index[v]])) for u, v in G.edges()]), 'distance')
 
     return G
 
 
+def knn_mask(conn_matrix, k, mode='symmetric', sparse=True):
+    """
+    Creates a k-nearest neighbour adjacency mask for all nodes at once.
+
+    Parameters
+    ----------
+    conn_matrix : array
+        Weighted NxN matrix. NaN entries and the main diagonal are never selected as neighbours.
+    k : int
+        Number of nearest neighbours (i.e. strongest weights) to select for each node.
+    mode : str
+        How the row-wise neighbour selections are combined. 'symmetric' keeps an edge if either node
+        selected the other, 'mutual' keeps an edge only if both nodes selected each other, and 'directed'
+        returns the raw (asymmetric) row-wise selections. Default is 'symmetric'.
+    sparse : bool
+        If True, returns a boolean scipy CSR matrix. Otherwise, returns a dense boolean array. Default is True.
+
+    Returns
+    -------
+    mask : scipy.sparse.csr_matrix or NxN np.ndarray
+        Boolean kNN adjacency mask.
+
+    Notes
+    -----
+    Neighbours are selected with a single `np.argpartition` over all rows, so ties between equally-weighted
+    candidates for the k-th neighbour are broken arbitrarily.
+    """
+    from scipy.sparse import csr_matrix
+
+    if mode not in ('symmetric', 'mutual', 'directed'):
+        raise ValueError("%s%s" % ('Unrecognized kNN mode: ', mode))
+
+    W = np.array(conn_matrix, dtype=np.float64)
+    n = W.shape[0]
+    W[np.isnan(W)] = -np.inf
+    np.fill_diagonal(W, -np.inf)
+
+    k = int(min(k, n - 1))
+    if k > 0:
+        nbrs = np.argpartition(-W, k - 1, axis=1)[:, :k].ravel()
+        rows = np.repeat(np.arange(n), k)
+        valid = W[rows, nbrs] > -np.inf
+        rows = rows[valid]
+        nbrs = nbrs[valid]
+    else:
+        rows = nbrs = np.array([], dtype=np.intp)
+
+    mask = csr_matrix((np.ones(len(rows), dtype=bool), (rows, nbrs)), shape=(n, n))
+    if mode == 'symmetric':
+        mask = mask + mask.T
+    elif mode == 'mutual':
+        mask = mask.multiply(mask.T)
+    mask = csr_matrix(mask, dtype=bool)
+
+    if sparse is True:
+        return mask
+    else:
+        return mask.toarray()
+
+
 def knn(conn_matrix, k):
     """
     Creates a k-nearest neighbour graph.
@@ -574,18 +703,14 @@ def knn(conn_matrix, k):
     gra : Obj
         KNN Weighted NetworkX graph.
     """
+    from scipy.sparse import triu
+    from pynets.core import thresholding
+
+    rows, cols = triu(thresholding.knn_mask(conn_matrix, k, mode='symmetric', sparse=True)).nonzero()
+
     gra = nx.Graph()
-    nodes = list(range(len(conn_matrix[0])))
-    gra.add_nodes_from(nodes)
-    for i in nodes:
-        line = np.ma.masked_array(conn_matrix[i, :], mask=np.isnan(conn_matrix[i]))
-        line.mask[i] = True
-        for _ in range(k):
-            node = np.argmax(line)
-            if not np.isnan(conn_matrix[i, node]):
-                gra.add_edge(i, node)
-
-            line.mask[node] = True
+    gra.add_nodes_from(list(range(len(conn_matrix[0]))))
+    gra.add_edges_from(zip(rows.tolist(), cols.tolist()))
 
     return gra
 
@@ -622,9 +747,11 @@ def local_thresholding_prop(conn_matrix, coords, labels, thr):
             for j in pruned_nodes:
                 labels_pre.pop(j)
                 coords_pre.pop(j)
-            conn_matrix = nx.to_numpy_array(G)
+            conn_matrix = nx.to_numpy_array(G, nodelist=sorted(G.nodes()))
             labels = labels_pre
             coords = coords_pre
+            # Relabel the pruned graph so that its nodes index the rows and columns of conn_matrix
+            G = nx.from_numpy_array(conn_matrix)
 
     maximum_edges = G.number_of_edges()
     min_t = nx.minimum_spanning_tree(thresholding.weight_to_distance(G), weight="distance")
@@ -648,27 +775,31 @@ def local_thresholding_prop(conn_matrix, coords, labels, thr):
         # print(k)
         # print(len_edges)
         len_edge_list.append(len_edges)
-        # Create nearest neighbour graph
-        nng = thresholding.knn(conn_matrix, k)
+        # Create nearest neighbour mask (upper triangle, one entry per undirected edge)
+        nng = np.triu(thresholding.knn_mask(conn_matrix, k, mode='symmetric', sparse=False), k=1)
+        number_before = np.count_nonzero(nng)
 
         # Remove edges from the NNG that exist already in the new graph/MST
-        nng.remove_edges_from(min_t.edges())
-
-        number_before = nng.number_of_edges()
-        if nng.number_of_edges() == 0 and number_before >= maximum_edges:
-            break
-
-        # Add weights to NNG
-        for e in nng.edges():
-            nng.edges[e[0], e[1]]['weight'] = float(conn_matrix[e[0], e[1]])
+        mst_edges = np.array(list(min_t.edges()), dtype=np.intp).reshape(-1, 2)
+        nng[mst_edges.min(axis=1), mst_edges.max(axis=1)] = False
+        rows, cols = np.nonzero(nng)
+
+        # No edges would be added. Stop once the NNG already spans every edge of the graph, since no larger k can
+        # contribute new ones.
+        if len(rows) == 0:
+            if number_before >= maximum_edges:
+                break
+            k += 1
+            continue
 
         # Obtain list of edges from the NNG in order of weight
-        edge_list = sorted(nng.edges(data=True), key=lambda t: t[2]['weight'], reverse=True)
+        weights = conn_matrix[rows, cols].astype('float64')
+        order = np.argsort(-weights, kind='stable')
 
         # Add edges in order of connectivity strength
-        for edge in edge_list:
+        for ix in order:
             # print("%s%s" % ('Adding edge to mst: ', edge))
-            min_t.add_edges_from([edge])
+            min_t.add_edge(int(rows[ix]), int(cols[ix]), weight=float(weights[ix]))
             len_edges = min_t.number_of_edges()
             if len_edges >= edgenum:
                 print(len_edges)
@@ -738,9 +869,160 @@ def perform_thresholding(conn_matrix, coords, labels, thr, thr_perc, min_span_tr
     return thr_type, edge_threshold, conn_matrix_thr, coords, labels
 
 
+def _npz_member_memmap(npz_path, key):
+    """
+    Memory-map a single array stored (uncompressed) inside an .npz archive, falling back to a full
+    read if the member is compressed.
+    """
+    import struct
+    import zipfile
+
+    with zipfile.ZipFile(npz_path) as zf:
+        info = zf.getinfo("%s%s" % (key, '.npy'))
+    if info.compress_type != zipfile.ZIP_STORED:
+        with np.load(npz_path) as npz:
+            return npz[key]
+
+    with open(npz_path, 'rb') as f:
+        f.seek(info.header_offset)
+        local_header = f.read(30)
+        fname_len, extra_len = struct.unpack('<HH', local_header[26:30])
+        f.seek(info.header_offset + 30 + fname_len + extra_len)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    return np.memmap(npz_path, dtype=dtype, mode='r', shape=shape, order='F' if fortran_order else 'C',
+                     offset=offset)
+
+
+class ThresholdFamily(object):
+    """
+    A store for the whole family of proportionally-thresholded variants of a single raw connectivity matrix.
+
+    Rather than saving one full matrix per threshold, the raw matrix is saved once alongside its edges
+    ranked by weight, and any thresholded variant is materialized on demand. Materialized matrices are
+    identical to those of `threshold_proportional`.
+
+    Parameters
+    ----------
+    conn_matrix : array
+        Raw (unthresholded) NxN connectivity matrix.
+    """
+    def __init__(self, conn_matrix=None):
+        self.raw = None
+        self.order = None
+        self.ud = None
+        if conn_matrix is not None:
+            self.raw = np.array(conn_matrix, dtype=np.float64)
+            self._rank_edges()
+
+    def _rank_edges(self):
+        # Mirror the edge selection of threshold_proportional exactly
+        W = self.raw.copy()
+        n = len(W)
+        np.fill_diagonal(W, 0)
+        if np.allclose(W, W.T):
+            W[np.tril_indices(n)] = 0
+            self.ud = 2
+        else:
+            self.ud = 1
+        ind = np.where(W)
+        I = np.argsort(W[ind])[::-1]
+        self.order = np.ravel_multi_index((ind[0][I], ind[1][I]), W.shape).astype(np.int64)
+        return
+
+    def materialize(self, thr):
+        """
+        Build the matrix preserving a proportion thr (0<thr<1) of the strongest weights.
+        """
+        if thr > 1 or thr < 0:
+            raise ValueError('Threshold must be in range [0,1]')
+        n = len(self.raw)
+        en = int(round((n * n - n) * float(thr) / self.ud))
+        keep = np.asarray(self.order[:en])
+        conn_matrix_thr = np.zeros((n, n), dtype=np.float64)
+        conn_matrix_thr.flat[keep] = np.asarray(self.raw).flat[keep]
+        if self.ud == 2:
+            conn_matrix_thr = conn_matrix_thr + conn_matrix_thr.T
+        return conn_matrix_thr
+
+    def save(self, family_path, compress=False):
+        """
+        Save the family to a single .npz file. Uncompressed files (the default) can be memory-mapped by
+        readers; compressed files are smaller but must be read fully.
+        """
+        import os
+        import tempfile
+
+        # Write to a temporary file first so that concurrent readers never see a partial store
+        fd, tmp_path = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(os.path.abspath(family_path)))
+        os.close(fd)
+        if compress is True:
+            np.savez_compressed(tmp_path, raw=self.raw, order=self.order, ud=np.array(self.ud))
+        else:
+            np.savez(tmp_path, raw=self.raw, order=self.order, ud=np.array(self.ud))
+        os.replace(tmp_path, family_path)
+        return family_path
+
+    @classmethod
+    def load(cls, family_path, mmap=True):
+        """
+        Load a family from an .npz file, memory-mapping its arrays where possible.
+        """
+        family = cls()
+        if mmap is True:
+            family.raw = _npz_member_memmap(family_path, 'raw')
+            family.order = _npz_member_memmap(family_path, 'order')
+            family.ud = int(_npz_member_memmap(family_path, 'ud'))
+        else:
+            with np.load(family_path) as npz:
+                family.raw = npz['raw']
+                family.order = npz['order']
+                family.ud = int(npz['ud'])
+        return family
+
+
+def get_family_path(est_path):
+    """
+    Derive the path of the threshold family store shared by all thresholds of a given est_path.
+    """
+    import re
+    return re.sub(r'_thr-[^_/]*\.npy$', '_family.npz', est_path)
+
+
+def load_thresholded(est_path, mmap=True):
+    """
+    Load a thresholded connectivity matrix, materializing it from its threshold family store if no
+    matrix was written to est_path.
+
+    Parameters
+    ----------
+    est_path : str
+        File path to the thresholded graph, conn_matrix_thr, saved as a numpy array in .npy format.
+    mmap : bool
+        Whether to memory-map the family store. Default is True.
+
+    Returns
+    -------
+    conn_matrix_thr : array
+        Weighted, thresholded, NxN matrix.
+    """
+    import os
+    import re
+
+    if os.path.isfile(est_path) or not os.path.isfile(get_family_path(est_path)):
+        return np.load(est_path)
+    thr = float(re.search(r'_thr-([^_/]*)\.npy$', est_path).group(1))
+    return ThresholdFamily.load(get_family_path(est_path), mmap=mmap).materialize(thr)
+
+
 def thresh_func(dens_thresh, thr, conn_matrix, conn_model, network, ID, dir_path, roi, node_size, min_span_tree,
                 smooth, disp_filt, parc, prune, atlas, uatlas, labels, coords, c_boot, norm, binary,
-                hpass):
+                hpass, thr_family=False, save_raw=True):
     """
     Threshold a functional connectivity matrix using any of a variety of methods.
 
@@ -798,6 +1080,13 @@ def thresh_func(dens_thresh, thr, conn_matrix, conn_model, network, ID, dir_path
         unweighted graph.
     hpass : float
         High-pass filter values (Hz) to apply to node-extracted time-series.
+    thr_family : bool
+        If True and proportional thresholding is used, save a single threshold family store shared by all
+        thresholds of conn_matrix instead of one .npy per threshold. est_path is then not written, and is resolved
+        by thresholding.load_thresholded. Default is False.
+    save_raw : bool
+        Whether to save the unthresholded conn_matrix. Set to False to defer the raw save to another node (e.g. when
+        the raw matrix is already stored in a threshold family). Default is True.
 
     Returns
     -------
@@ -849,6 +1138,8 @@ def thresh_func(dens_thresh, thr, conn_matrix, conn_model, network, ID, dir_path
         High-pass filter values (Hz) to apply to node-extracted time-series.
     """
     import gc
+    import os
+    import os.path as op
     from pynets.core import utils, thresholding
 
     thr_perc = 100-np.abs(100 * float(thr))
@@ -859,8 +1150,9 @@ def thresh_func(dens_thresh, thr, conn_matrix, conn_model, network, ID, dir_path
         raise ValueError('ERROR: Raw connectivity matrix contains only zeros.')
 
     # Save unthresholded
-    utils.save_mat(conn_matrix, utils.create_raw_path_func(ID, network, conn_model, roi, dir_path, node_size, smooth,
-                                                           c_boot, hpass, parc))
+    if save_raw is True:
+        utils.save_mat(conn_matrix, utils.create_raw_path_func(ID, network, conn_model, roi, dir_path, node_size,
+                                                               smooth, c_boot, hpass, parc))
 
     [thr_type, edge_threshold, conn_matrix_thr, coords, labels] = thresholding.perform_thresholding(conn_matrix, coords,
                                                                                                     labels, thr,
@@ -869,14 +1161,21 @@ def thresh_func(dens_thresh, thr, conn_matrix, conn_model, network, ID, dir_path
                                                                                                     dens_thresh,
                                                                                                     disp_filt)
 
-    if not nx.is_connected(nx.from_numpy_matrix(conn_matrix_thr)):
+    if not thresholding.is_connected(conn_matrix_thr):
         print('Warning: Fragmented graph')
 
     # Save thresholded mat
     est_path = utils.create_est_path_func(ID, network, conn_model, thr, roi, dir_path, node_size, smooth, c_boot,
                                           thr_type, hpass, parc)
 
-    utils.save_mat(conn_matrix_thr, est_path)
+    if thr_family is True and thr_type == 'prop':
+        # Materialized on demand by thresholding.load_thresholded. The store is rewritten atomically on every run so
+        # that it always reflects conn_matrix, and any stale graph at est_path would shadow it.
+        thresholding.ThresholdFamily(conn_matrix).save(thresholding.get_family_path(est_path))
+        if op.isfile(est_path):
+            os.remove(est_path)
+    else:
+        utils.save_mat(conn_matrix_thr, est_path)
     gc.collect()
 
     return (conn_matrix_thr, edge_threshold, est_path, thr, node_size, network, conn_model, roi, smooth, prune, ID,
@@ -885,7 +1184,8 @@ def thresh_func(dens_thresh, thr, conn_matrix, conn_model, network, ID, dir_path
 
 def thresh_struct(dens_thresh, thr, conn_matrix, conn_model, network, ID, dir_path, roi, node_size, min_span_tree,
                   disp_filt, parc, prune, atlas, uatlas, labels, coords, norm, binary,
-                  target_samples, track_type, atlas_mni, streams, directget, min_length):
+                  target_samples, track_type, atlas_mni, streams, directget, min_length, thr_family=False,
+                  save_raw=True):
     """
     Threshold a structural connectivity matrix using any of a variety of methods.
 
@@ -951,6 +1251,13 @@ def thresh_struct(dens_thresh, thr, conn_matrix, conn_model, network, ID, dir_pa
         and prob (probabilistic).
     min_length : int
         Minimum fiber length threshold in mm to restrict tracking.
+    thr_family : bool
+        If True and proportional thresholding is used, save a single threshold family store shared by all
+        thresholds of conn_matrix instead of one .npy per threshold. est_path is then not written, and is resolved
+        by thresholding.load_thresholded. Default is False.
+    save_raw : bool
+        Whether to save the unthresholded conn_matrix. Set to False to defer the raw save to another node (e.g. when
+        the raw matrix is already stored in a threshold family). Default is True.
 
     Returns
     -------
@@ -1009,6 +1316,8 @@ def thresh_struct(dens_thresh, thr, conn_matrix, conn_model, network, ID, dir_pa
         Minimum fiber length threshold in mm to restrict tracking.
     """
     import gc
+    import os
+    import os.path as op
     from pynets.core import utils, thresholding
 
     thr_perc = 100 - np.abs(100 * float(thr))
@@ -1019,8 +1328,10 @@ def thresh_struct(dens_thresh, thr, conn_matrix, conn_model, network, ID, dir_pa
         raise ValueError('ERROR: Raw connectivity matrix contains only zeros.')
 
     # Save unthresholded
-    utils.save_mat(conn_matrix, utils.create_raw_path_diff(ID, network, conn_model, roi, dir_path, node_size,
-                                                           target_samples, track_type, parc, directget, min_length))
+    if save_raw is True:
+        utils.save_mat(conn_matrix, utils.create_raw_path_diff(ID, network, conn_model, roi, dir_path, node_size,
+                                                               target_samples, track_type, parc, directget,
+                                                               min_length))
 
     [thr_type, edge_threshold, conn_matrix_thr, coords, labels] = thresholding.perform_thresholding(conn_matrix,
                                                                                                     coords, labels,
@@ -1029,14 +1340,21 @@ def thresh_struct(dens_thresh, thr, conn_matrix, conn_model, network, ID, dir_pa
                                                                                                     dens_thresh,
                                                                                                     disp_filt)
 
-    if not nx.is_connected(nx.from_numpy_matrix(conn_matrix_thr)):
+    if not thresholding.is_connected(conn_matrix_thr):
         print('Warning: Fragmented graph')
 
     # Save thresholded mat
     est_path = utils.create_est_path_diff(ID, network, conn_model, thr, roi, dir_path, node_size, target_samples,
                                           track_type, thr_type, parc, directget, min_length)
 
-    utils.save_mat(conn_matrix_thr, est_path)
+    if thr_family is True and thr_type == 'prop':
+        # Materialized on demand by thresholding.load_thresholded. The store is rewritten atomically on every run so
+        # that it always reflects conn_matrix, and any stale graph at est_path would shadow it.
+        thresholding.ThresholdFamily(conn_matrix).save(thresholding.get_family_path(est_path))
+        if op.isfile(est_path):
+            os.remove(est_path)
+    else:
+        utils.save_mat(conn_matrix_thr, est_path)
     gc.collect()
 
     return (conn_matrix_thr, edge_threshold, est_path, thr, node_size, network, conn_model, roi, prune, ID, dir_path,
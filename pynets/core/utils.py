@@ -371,6 +371,17 @@ def save_mat(conn_matrix, est_path, fmt='npy'):
         Format to save connectivity matrix/graph (e.g. .npy, .pkl, .graphml, .txt, .ssv, .csv). Default is .npy.
     """
     import networkx as nx
+
+    # Dense formats of symmetric matrices survive the graph round-trip unchanged, so write the array directly
+    if fmt in ('npy', 'txt'):
+        conn_matrix = np.asarray(conn_matrix, dtype=np.float64)
+        if np.array_equal(conn_matrix, conn_matrix.T):
+            if fmt == 'npy':
+                np.save(est_path, conn_matrix)
+            else:
+                np.savetxt("%s%s" % (est_path.split('.npy')[0], '.txt'), conn_matrix)
+            return
+
     G = nx.from_numpy_array(conn_matrix)
     G.graph['ecount'] = nx.number_of_edges(G)
     G = nx.convert_node_labels_to_integers(G, first_label=1)
@@ -985,6 +996,92 @@ def merge_dicts(x, y):
     return z
 
 
+def file_fingerprint(in_file, block_size=1048576):
+    """
+    A cheap content hash of a file, built from its size and its first and last blocks, used to guard
+    staged inputs against stale or modified sources without reading multi-gigabyte images in full.
+
+    Parameters
+    ----------
+    in_file : str
+        File path.
+    block_size : int
+        Number of bytes to hash from each end of the file. Default is 1 MB.
+
+    Returns
+    -------
+    fingerprint : str
+        Hex digest of the file's size and boundary blocks.
+    """
+    import hashlib
+    size = op.getsize(in_file)
+    digest = hashlib.sha256(str(size).encode())
+    with open(in_file, 'rb') as f:
+        digest.update(f.read(block_size))
+        if size > block_size:
+            f.seek(max(size - block_size, block_size))
+            digest.update(f.read(block_size))
+    return digest.hexdigest()
+
+
+def stage_input(in_file, newpath, suffix='_tmp', link_type='auto'):
+    """
+    Stage an immutable input file into a node's working directory without duplicating its contents.
+
+    Parameters
+    ----------
+    in_file : str
+        File path to an input that will only be read by the node.
+    newpath : str
+        Directory to stage the file into (usually the node's runtime.cwd).
+    suffix : str
+        Suffix appended to the staged file's name. Default is '_tmp'.
+    link_type : str
+        'hardlink', 'symlink', 'copy', 'inplace' (return in_file unchanged), or 'auto', which tries a hardlink,
+        then a symlink, and only then falls back to copying. Default is 'auto'.
+
+    Returns
+    -------
+    out_file : str
+        File path to the staged input.
+
+    Notes
+    -----
+    A previously staged file is reused only if it is the same file as in_file or has the same content
+    fingerprint; otherwise it is re-staged. Consumers that resolve symlinks (e.g. via os.path.realpath) will
+    see the location of the original file.
+    """
+    from nipype.utils.filemanip import fname_presuffix, copyfile
+
+    if link_type == 'inplace':
+        return in_file
+
+    out_file = fname_presuffix(in_file, suffix=suffix, newpath=newpath)
+    if op.lexists(out_file):
+        if op.exists(out_file) and (op.samefile(in_file, out_file) or
+                                    file_fingerprint(in_file) == file_fingerprint(out_file)):
+            return out_file
+        os.remove(out_file)
+
+    link_types = ['hardlink', 'symlink', 'copy'] if link_type == 'auto' else [link_type]
+    for method in link_types:
+        try:
+            if method == 'hardlink':
+                os.link(op.realpath(in_file), out_file)
+            elif method == 'symlink':
+                os.symlink(op.realpath(in_file), out_file)
+            elif method == 'copy':
+                copyfile(in_file, out_file, copy=True, use_hardlink=False)
+            else:
+                raise ValueError("%s%s" % ('Unrecognized link type: ', method))
+            break
+        except OSError:
+            if method == link_types[-1]:
+                raise
+
+    return out_file
+
+
 def timeout(seconds):
     """
     Timeout function for hung calculations.
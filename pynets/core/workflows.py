@@ -19,7 +19,7 @@ def workflow_selector(func_file, ID, atlas, network, node_size, roi, thr, uatlas
                       mask, norm, binary, fbval, fbvec, target_samples, curv_thr_list, step_list, overlap_thr,
                       track_type, min_length, maxcrossing, directget, tiss_class, runtime_dict,
                       execution_dict, embed, multi_directget, multimodal, hpass, hpass_list, template, template_mask,
-                      vox_size, multiplex, waymask, local_corr, min_length_list, clean=True):
+                      vox_size, multiplex, waymask, local_corr, min_length_list, clean=True, thr_family=False):
     """A meta-interface for selecting modality-specific workflows to nest into a single-subject workflow"""
     import gc
     import sys
@@ -113,7 +113,8 @@ def workflow_selector(func_file, ID, atlas, network, node_size, roi, thr, uatlas
                                                      target_samples, curv_thr_list, step_list, overlap_thr,
                                                      track_type, min_length, maxcrossing, directget,
                                                      tiss_class, runtime_dict, execution_dict, multi_directget,
-                                                     template, template_mask, vox_size, waymask, min_length_list)
+                                                     template, template_mask, vox_size, waymask, min_length_list,
+                                                     thr_family=thr_family)
         if func_file is None:
             sub_func_wf = None
         sub_struct_wf._n_procs = procmem[0]
@@ -133,7 +134,8 @@ def workflow_selector(func_file, ID, atlas, network, node_size, roi, thr, uatlas
                                                    smooth_list, disp_filt, prune, multi_nets, clust_type,
                                                    clust_type_list, plugin_type, c_boot, block_size, mask,
                                                    norm, binary, anat_file, runtime_dict, execution_dict, hpass,
-                                                   hpass_list, template, template_mask, vox_size, local_corr)
+                                                   hpass_list, template, template_mask, vox_size, local_corr,
+                                                   thr_family=thr_family)
         if dwi_file is None:
             sub_struct_wf = None
         sub_func_wf._n_procs = procmem[0]
@@ -650,7 +652,7 @@ def dmri_connectometry(ID, atlas, network, node_size, roi, uatlas, plot_switch,
                        min_span_tree, use_AAL_naming, disp_filt, plugin_type, multi_nets, prune, mask, norm,
                        binary, target_samples, curv_thr_list, step_list, overlap_thr, track_type, min_length,
                        maxcrossing, directget, tiss_class, runtime_dict, execution_dict, multi_directget,
-                       template, template_mask, vox_size, waymask, min_length_list):
+                       template, template_mask, vox_size, waymask, min_length_list, thr_family=False):
     """A function interface for generating a dMRI nested workflow"""
     import itertools
     from nipype.pipeline import engine as pe
@@ -1244,7 +1246,7 @@ def dmri_connectometry(ID, atlas, network, node_size, roi, uatlas, plot_switch,
                               'min_length']
 
     if no_iters is True:
-        thresh_diff_node = pe.Node(niu.Function(input_names=thr_struct_fields,
+        thresh_diff_node = pe.Node(niu.Function(input_names=thr_struct_fields + ['thr_family'],
                                                 output_names=['conn_matrix_thr', 'edge_threshold', 'est_path', 'thr',
                                                               'node_size', 'network', 'conn_model', 'roi', 'prune',
                                                               'ID', 'dir_path', 'atlas', 'uatlas', 'labels', 'coords',
@@ -1253,7 +1255,7 @@ def dmri_connectometry(ID, atlas, network, node_size, roi, uatlas, plot_switch,
                                                 function=thresholding.thresh_struct, imports=import_list),
                                    name="thresh_diff_node")
     else:
-        thresh_diff_node = pe.MapNode(niu.Function(input_names=thr_struct_fields,
+        thresh_diff_node = pe.MapNode(niu.Function(input_names=thr_struct_fields + ['thr_family'],
                                                    output_names=['conn_matrix_thr', 'edge_threshold', 'est_path', 'thr',
                                                                  'node_size', 'network', 'conn_model', 'roi', 'prune',
                                                                  'ID', 'dir_path', 'atlas', 'uatlas', 'labels',
@@ -1264,6 +1266,7 @@ def dmri_connectometry(ID, atlas, network, node_size, roi, uatlas, plot_switch,
                                       name="thresh_diff_node", iterfield=thr_struct_fields,
                                       nested=True)
         thresh_diff_node.synchronize = True
+    thresh_diff_node.inputs.thr_family = thr_family
 
     dmri_connectometry_wf.connect([
         (join_iters_node, thresh_diff_node, [('dens_thresh', 'dens_thresh'),
@@ -1594,7 +1597,7 @@ def fmri_connectometry(func_file, ID, atlas, network, node_size, roi, thr, uatla
                        min_span_tree, use_AAL_naming, smooth, smooth_list, disp_filt, prune, multi_nets,
                        clust_type, clust_type_list, plugin_type, c_boot, block_size, mask, norm, binary,
                        anat_file, runtime_dict, execution_dict, hpass, hpass_list, template, template_mask, vox_size,
-                       local_corr):
+                       local_corr, thr_family=False):
     """A function interface for generating an fMRI nested workflow"""
     import itertools
     import os.path as op
@@ -1759,10 +1762,14 @@ def fmri_connectometry(func_file, ID, atlas, network, node_size, roi, thr, uatla
 
         clustering_node = pe.Node(IndividualClustering(),
                                   input_names=['func_file', 'conf', 'clust_mask', 'ID', 'k', 'clust_type', 'vox_size',
-                                               'local_corr', 'mask'],
+                                               'local_corr', 'mask', 'k_list', 'nthreads'],
                                   output_names=['uatlas', 'atlas', 'clustering', 'clust_mask', 'k', 'clust_type'],
                                   imports=import_list, name="clustering_node")
 
+        # The nodes of each k share one ncut eigenbasis, and connected components are clustered in parallel
+        if k_list:
+            clustering_node.inputs.k_list = k_list
+        clustering_node.inputs.nthreads = int(runtime_dict['clustering_node'][0])
         clustering_node.interface.n_procs = runtime_dict['clustering_node'][0]
         clustering_node.interface.mem_gb = runtime_dict['clustering_node'][1]
         clustering_node._n_procs = runtime_dict['clustering_node'][0]
@@ -2163,7 +2170,7 @@ def fmri_connectometry(func_file, ID, atlas, network, node_size, roi, thr, uatla
                                                              'smooth', 'dens_thresh', 'network', 'ID', 'roi',
                                                              'min_span_tree', 'disp_filt', 'parc', 'prune',
                                                              'atlas', 'uatlas', 'labels', 'coords',
-                                                             'c_boot', 'norm', 'binary', 'hpass'],
+                                                             'c_boot', 'norm', 'binary', 'hpass', 'n_jobs'],
                                                 output_names=['conn_matrix', 'conn_model', 'dir_path', 'node_size',
                                                               'smooth', 'dens_thresh', 'network', 'ID', 'roi',
                                                               'min_span_tree', 'disp_filt', 'parc', 'prune',
@@ -2171,6 +2178,7 @@ def fmri_connectometry(func_file, ID, atlas, network, node_size, roi, thr, uatla
                                                               'c_boot', 'norm', 'binary', 'hpass'],
                                                 function=estimation.get_conn_matrix, imports=import_list),
                                    name="get_conn_matrix_node")
+    get_conn_matrix_node.inputs.n_jobs = int(runtime_dict['get_conn_matrix_node'][0])
 
     # Set get_conn_matrix_node iterables
     if conn_model_list:
@@ -2329,7 +2337,7 @@ def fmri_connectometry(func_file, ID, atlas, network, node_size, roi, thr, uatla
                             'coords', 'c_boot', 'norm', 'binary', 'hpass']
 
     if no_iters is True:
-        thresh_func_node = pe.Node(niu.Function(input_names=thr_func_fields,
+        thresh_func_node = pe.Node(niu.Function(input_names=thr_func_fields + ['thr_family'],
                                                 output_names=['conn_matrix_thr', 'edge_threshold', 'est_path', 'thr',
                                                               'node_size', 'network', 'conn_model', 'roi', 'smooth',
                                                               'prune', 'ID', 'dir_path', 'atlas',
@@ -2338,7 +2346,7 @@ def fmri_connectometry(func_file, ID, atlas, network, node_size, roi, thr, uatla
                                                 function=thresholding.thresh_func, imports=import_list),
                                    name="thresh_func_node")
     else:
-        thresh_func_node = pe.MapNode(niu.Function(input_names=thr_func_fields,
+        thresh_func_node = pe.MapNode(niu.Function(input_names=thr_func_fields + ['thr_family'],
                                                    output_names=['conn_matrix_thr', 'edge_threshold', 'est_path', 'thr',
                                                                  'node_size', 'network', 'conn_model', 'roi', 'smooth',
                                                                  'prune', 'ID', 'dir_path', 'atlas',
@@ -2348,6 +2356,7 @@ def fmri_connectometry(func_file, ID, atlas, network, node_size, roi, thr, uatla
                                                    imports=import_list), name="thresh_func_node",
                                       iterfield=thr_func_fields, nested=True)
         thresh_func_node.synchronize = True
+    thresh_func_node.inputs.thr_family = thr_family
 
     fmri_connectometry_wf.connect([
         (join_iters_node, thresh_func_node, [('dens_thresh', 'dens_thresh'),
@@ -71,7 +71,7 @@ def indx_3dto1d(idx, sz):
     return idx1
 
 
-def ncut(W, nbEigenValues):
+def ncut(W, nbEigenValues, solver='arpack'):
     """
     This function performs the first step of normalized cut spectral clustering.
     The normalized LaPlacian is calculated on the similarity matrix W, and top
@@ -88,6 +88,9 @@ def ncut(W, nbEigenValues):
     nbEigenValues : int
         Number of eigenvectors that should be calculated, this determines the maximum number
         of clusters (K) that can be derived from the result.
+    solver : str
+        Eigensolver: 'arpack' (Lanczos iterations of scipy's eigsh) or 'lobpcg', which scales better to large
+        sparse W and is preconditioned with algebraic multigrid when pyamg is installed. Default is 'arpack'.
 
     Returns
     -------
@@ -108,8 +111,8 @@ def ncut(W, nbEigenValues):
        IEEE International Conference on Computer Vision, (1), 313-319 vol.1. Ieee.
        doi: 10.1109/ICCV.2003.1238361
     """
-    from scipy.sparse.linalg import eigsh
-    from scipy.sparse import spdiags
+    from scipy.sparse.linalg import eigsh, lobpcg
+    from scipy.sparse import spdiags, identity
     from numpy.linalg import norm
 
     # Parameters
@@ -131,7 +134,24 @@ def ncut(W, nbEigenValues):
     P = Dinvsqrt * (W * Dinvsqrt)
 
     # Perform the eigen decomposition
-    eigen_val, eigen_vec = eigsh(P, nbEigenValues, maxiter=maxiterations, tol=eigsErrorTolerence, which='LA')
+    if solver == 'arpack':
+        eigen_val, eigen_vec = eigsh(P, nbEigenValues, maxiter=maxiterations, tol=eigsErrorTolerence, which='LA')
+    elif solver == 'lobpcg':
+        # The largest eigenvalues of P are the smallest of I - P, which is what multigrid preconditions well. A small
+        # shift keeps the operator positive definite.
+        A = (identity(m, format='csr') * (1. + 1e-5) - P).tocsr()
+        try:
+            import pyamg
+            M = pyamg.smoothed_aggregation_solver(A).aspreconditioner()
+        except ImportError:
+            print('pyamg not installed. Running LOBPCG without a multigrid preconditioner...')
+            M = None
+        X = np.random.RandomState(42).rand(m, nbEigenValues)
+        X[:, 0] = np.sqrt(d)
+        eigen_val, eigen_vec = lobpcg(A, X, M=M, tol=eigsErrorTolerence, maxiter=maxiterations * 10, largest=False)
+        eigen_val = 1. + 1e-5 - eigen_val
+    else:
+        raise ValueError("%s%s" % ('\nERROR: Eigensolver not recognized: ', solver))
 
     # Sort the eigen_vals so that the first is the largest
     i = np.argsort(-eigen_val)
@@ -149,7 +169,150 @@ def ncut(W, nbEigenValues):
     return eigen_val, eigen_vec
 
 
-def discretisation(eigen_vec):
+def get_ncut_eigenbasis(W, n_eigen, solver='arpack', cache_path=None):
+    """
+    Eigenbasis of `ncut`, optionally cached on disk so that every parcellation of the same connectivity matrix (e.g.
+    the clustering nodes of each k of a subject) shares one eigendecomposition. Concurrent callers serialize on a
+    lock file beside the cache, so that only the first computes it.
+
+    Parameters
+    ----------
+    W : Compressed Sparse Matrix
+        Symmetric similarity matrix (see `ncut`).
+    n_eigen : int
+        Number of eigenvectors.
+    solver : str
+        Eigensolver used by `ncut`. Default is 'arpack'.
+    cache_path : str
+        File path to the .npz cache of the eigenbasis. Default is None (no caching).
+
+    Returns
+    -------
+    eigen_val :  array
+        Eigenvalues from the eigen decomposition of the LaPlacian of W.
+    eigen_vec :  array
+        Eigenvectors from the eigen decomposition of the LaPlacian of W.
+    """
+    from pynets.fmri.clustools import ncut, _locked_npz_cache
+
+    def _eigenbasis():
+        eigen_val, eigen_vec = ncut(W, int(n_eigen), solver=solver)
+        return {'eigen_val': eigen_val, 'eigen_vec': eigen_vec}
+
+    cached = _locked_npz_cache(cache_path, _eigenbasis, 'ncut eigenbasis')
+    return cached['eigen_val'], cached['eigen_vec']
+
+
+def _locked_npz_cache(cache_path, compute, description):
+    """
+    Load the arrays cached at cache_path, or compute and cache them. Concurrent callers serialize on a lock file
+    beside the cache, so that only the first computes them; the cache is written atomically.
+
+    Parameters
+    ----------
+    cache_path : str
+        File path to the .npz cache. If None, the arrays are computed without caching.
+    compute : callable
+        Function of no arguments returning a dictionary of the arrays to cache.
+    description : str
+        Name of the cached arrays in progress messages.
+
+    Returns
+    -------
+    arrays : dict
+        The cached or computed arrays.
+    """
+    import os
+    import fcntl
+    import tempfile
+
+    if cache_path is None:
+        return compute()
+
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        lock = open("%s%s" % (cache_path, '.lock'), 'a')
+    except OSError:
+        print("%s%s%s%s" % ('Warning: could not cache ', description, ' in ', os.path.dirname(cache_path)))
+        return compute()
+
+    with lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.isfile(cache_path):
+            try:
+                with np.load(cache_path) as cached:
+                    print("%s%s%s%s" % ('Loading cached ', description, ' from: ', cache_path))
+                    return {name: cached[name] for name in cached.files}
+            except (OSError, ValueError, KeyError):
+                pass
+
+        arrays = compute()
+        try:
+            fd, tmp_path = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(cache_path))
+            os.close(fd)
+            np.savez(tmp_path, **arrays)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            print("%s%s%s%s" % ('Warning: could not cache ', description, ' in ', os.path.dirname(cache_path)))
+    return arrays
+
+
+def _discretisation_run(eigen_vec, random_state, max_iterations=20, max_svd_restarts=30):
+    """
+    One Yu-Shi discretisation of row-normalized eigenvectors (see `discretisation`).
+
+    Returns
+    -------
+    ncut_value : float
+        Ncut objective of the solution.
+    labels : array
+        Cluster index in 0..k-1 of each feature.
+    """
+    from scipy.linalg import LinAlgError, svd
+    eps = 2.2204e-16
+
+    n, k = eigen_vec.shape
+    rng = np.random.RandomState(random_state)
+    t_discrete = np.empty((n, k))
+    discrete = np.zeros((n, k))
+    rows = np.arange(n)
+
+    # if there is an exception we try to randomize and rerun SVD again and do this 30 times
+    for _ in range(max_svd_restarts):
+        # initialize algorithm with a random ordering of eigenvectors
+        c = np.zeros(n)
+        R = np.zeros((k, k))
+        R[:, 0] = eigen_vec[int(rng.rand() * (n - 1)), :]
+        for j in range(1, k):
+            c += np.abs(eigen_vec.dot(R[:, j - 1]))
+            R[:, j] = eigen_vec[c.argmin(), :]
+
+        last_objective_value = 0
+        for n_iter in range(1, max_iterations + 2):
+            # Rotate the original eigen_vectors and discretise the result by setting the max of each row=1 and other
+            # values to 0
+            np.dot(eigen_vec, R, out=t_discrete)
+            labels = t_discrete.argmax(axis=1)
+            discrete.fill(0)
+            discrete[rows, labels] = 1
+
+            # Calculate a rotation to bring the discrete eigenvectors cluster to the original eigenvectors
+            try:
+                U, S, Vh = svd(discrete.T.dot(eigen_vec))
+            except LinAlgError:
+                print("SVD did not converge. Randomizing and trying again...")
+                break
+
+            # Test for convergence
+            ncut_value = 2 * (n - S.sum())
+            if abs(ncut_value - last_objective_value) < eps or n_iter > max_iterations:
+                return ncut_value, labels
+            last_objective_value = ncut_value
+            R = Vh.T.dot(U.T)
+    return None
+
+
+def discretisation(eigen_vec, n_restarts=1, n_jobs=1, random_state=42):
     """
     This function performs the second step of normalized cut clustering which
     assigns features to clusters based on the eigen vectors from the LaPlacian of
@@ -168,11 +331,20 @@ def discretisation(eigen_vec):
     caveat of this method, is that number of resulting clusters is bound by the
     number of eignevectors, but it may contain less.
 
+    Each restart rotates from a different random initial row. Restarts can be run in parallel threads, and the
+    solution with the lowest Ncut objective is kept.
+
     Parameters
     ----------
     eigen_vec : array
         Eigenvectors of the normalized LaPlacian calculated from the
         similarity matrix for the corresponding clustering problem.
+    n_restarts : int
+        Number of random restarts. Default is 1.
+    n_jobs : int
+        Number of threads over which restarts are distributed. Default is 1.
+    random_state : int
+        Seed of the initial rotations. Default is 42.
 
     Returns
     -------
@@ -195,73 +367,28 @@ def discretisation(eigen_vec):
        IEEE International Conference on Computer Vision, (1), 313-319 vol.1. Ieee.
        doi: 10.1109/ICCV.2003.1238361
     """
-    import scipy as sp
     from scipy.sparse import csc_matrix
-    from scipy.linalg import LinAlgError, svd
-    from scipy import divide
-    eps = 2.2204e-16
+    from pynets.fmri.clustools import _discretisation_run
 
     # normalize the eigenvectors
-    [n, k] = np.shape(eigen_vec)
-    vm = np.kron(np.ones((1, k)), np.sqrt(np.multiply(eigen_vec, eigen_vec).sum(1)))
-    eigen_vec = divide(eigen_vec, vm)
-
-    svd_restarts = 0
-    exitLoop = 0
-
-    # if there is an exception we try to randomize and rerun SVD again and do this 30 times
-    while (svd_restarts < 30) and (exitLoop == 0):
-        # initialize algorithm with a random ordering of eigenvectors
-        c = np.zeros((n, 1))
-        R = np.matrix(np.zeros((k, k)))
-        R[:, 0] = eigen_vec[int(sp.rand(1) * (n - 1)), :].transpose()
-
-        for j in range(1, k):
-            c = c + abs(eigen_vec * R[:, j - 1])
-            R[:, j] = eigen_vec[c.argmin(), :].transpose()
-
-        lastObjectiveValue = 0
-        nbIterationsDiscretisation = 0
-        nbIterationsDiscretisationMax = 20
-
-        # Iteratively rotate the discretised eigenvectors until they are maximally similar to the input eignevectors,
-        # this converges when the differences between the current solution and the previous solution differs by less
-        # than eps or we have reached the maximum number of itarations
-        while exitLoop == 0:
-            nbIterationsDiscretisation = nbIterationsDiscretisation + 1
-
-            # Rotate the original eigen_vectors
-            tDiscrete = eigen_vec * R
+    eigen_vec = np.asarray(eigen_vec, dtype='float64')
+    n, k = eigen_vec.shape
+    eigen_vec = eigen_vec / np.sqrt(np.einsum('ij,ij->i', eigen_vec, eigen_vec))[:, np.newaxis]
 
-            # Discretise the result by setting the max of each row=1 and other values to 0
-            j = np.reshape(np.asarray(tDiscrete.argmax(1)), n)
-            eigenvec_discrete = csc_matrix((np.ones(len(j)), (list(range(0, n)), np.array(j))), shape=(n, k))
-
-            # Calculate a rotation to bring the discrete eigenvectors cluster to the original eigenvectors
-            tSVD = eigenvec_discrete.transpose() * eigen_vec
-
-            # Catch a SVD convergence error and restart
-            try:
-                [U, S, Vh] = svd(tSVD)
-            except LinAlgError:
-                # Catch exception and go back to the beginning of the loop
-                print("SVD did not converge. Randomizing and trying again...")
-                break
-
-            # Test for convergence
-            NcutValue = 2 * (n - S.sum())
-            if (abs(NcutValue - lastObjectiveValue) < eps) or (
-                nbIterationsDiscretisation > nbIterationsDiscretisationMax):
-                exitLoop = 1
-            else:
-                # Otherwise calculate rotation and continue
-                lastObjectiveValue = NcutValue
-                R = np.matrix(Vh).transpose() * np.matrix(U).transpose()
+    seeds = np.random.RandomState(random_state).randint(0, 2 ** 31 - 1, int(n_restarts))
+    if n_jobs is None or int(n_jobs) <= 1 or len(seeds) == 1:
+        runs = [_discretisation_run(eigen_vec, seed) for seed in seeds]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=int(n_jobs)) as pool:
+            runs = list(pool.map(lambda seed: _discretisation_run(eigen_vec, seed), seeds))
+    runs = [run for run in runs if run is not None]
 
-    if exitLoop == 0:
+    if len(runs) == 0:
         raise ValueError("SVD did not converge after 30 retries")
-    else:
-        return eigenvec_discrete
+
+    _, labels = min(runs, key=lambda run: run[0])
+    return csc_matrix((np.ones(n), (np.arange(n), labels)), shape=(n, k))
 
 
 def parcellate_ncut(W, k, mask_img):
@@ -284,39 +411,73 @@ def parcellate_ncut(W, k, mask_img):
     ----------
     .. Adapted from PyClusterROI
     """
-    # We only have to calculate the eigendecomposition of the LaPlacian once,
-    # for the largest number of clusters provided. This provides a significant
-    # speedup, without any difference to the results.
-    [_, eigenvec] = ncut(W, k)
+    from pynets.fmri.clustools import parcellate_ncut_k_list
+
+    return parcellate_ncut_k_list(W, [k], mask_img)[0]
+
+
+def parcellate_ncut_k_list(W, k_list, mask_img, solver='arpack', n_restarts=1, n_jobs=1, n_eigen=None,
+                           eigen_cache=None):
+    """
+    Normalized cut parcellations of a connectivity matrix at several numbers of clusters. The eigendecomposition of
+    the LaPlacian is only calculated once, for the largest number of clusters, and every clustering is discretised
+    from its leading eigenvectors. This provides a significant speedup, without any difference to the results.
+
+    Parameters
+    ----------
+    W : Compressed Sparse Matrix
+        A Scipy sparse matrix, with weights corresponding to the temporal/spatial
+        correlation between the time series from voxel i and voxel j.
+    k_list : list
+        Numbers of clusters that will be generated.
+    mask_img : Nifti1Image
+        3D NIFTI file containing a mask, which restricts the voxels used in the analysis.
+    solver : str
+        Eigensolver used by `ncut`. Default is 'arpack'.
+    n_restarts : int
+        Number of random restarts of `discretisation`. Default is 1.
+    n_jobs : int
+        Number of threads over which discretisation restarts are distributed. Default is 1.
+    n_eigen : int
+        Number of eigenvectors to compute, if more than max(k_list) (e.g. the largest k of the run, so that the
+        eigenbasis can be shared with its other parcellations). Default is max(k_list).
+    eigen_cache : str
+        File path to the on-disk cache of the eigenbasis (see `get_ncut_eigenbasis`). Default is None.
 
-    # Calculate each desired clustering result
-    eigenvec_discrete = discretisation(eigenvec[:, :k])
+    Returns
+    -------
+    out_imgs : list
+        Nifti1Image atlas for each k, in the order of k_list.
 
-    # Transform the discretised eigenvectors into a single vector where the
-    # value corresponds to the cluster # of the corresponding ROI
-    a = eigenvec_discrete[:, 0].todense()
+    References
+    ----------
+    .. Adapted from PyClusterROI
+    """
+    from pynets.fmri.clustools import get_ncut_eigenbasis, discretisation
 
-    for i in range(1, k):
-        a = a + (i + 1) * eigenvec_discrete[:, i]
+    n_eigen = max(int(max(k_list)), int(n_eigen) if n_eigen is not None else 0)
+    [_, eigenvec] = get_ncut_eigenbasis(W, n_eigen, solver=solver, cache_path=eigen_cache)
 
-    unique_a = list(set(a.flatten()))
-    unique_a.sort()
+    mskdat = np.asarray(mask_img.dataobj) > 0
+    out_imgs = []
+    for k in k_list:
+        k = int(k)
 
-    # Renumber clusters to make the contiguous
-    b = np.zeros((len(a), 1))
-    for i in range(0, len(unique_a)):
-        b[a == unique_a[i]] = i + 1
+        # Calculate each desired clustering result
+        eigenvec_discrete = discretisation(eigenvec[:, :k], n_restarts=n_restarts, n_jobs=n_jobs)
 
-    imdat = mask_img.get_fdata()
-    imdat[imdat > 0] = 1
-    imdat[imdat > 0] = np.short(b[0:int(np.sum(imdat))].flatten())
+        # Transform the discretised eigenvectors into a single vector where the value corresponds to the cluster #
+        # of the corresponding ROI, and renumber clusters to make them contiguous
+        b = np.unique(np.asarray(eigenvec_discrete.argmax(axis=1)).ravel(), return_inverse=True)[1] + 1
 
-    del a, W
+        imdat = np.zeros(mskdat.shape, dtype='uint16')
+        imdat[mskdat] = b[0:int(np.sum(mskdat))]
+        out_imgs.append(nib.Nifti1Image(imdat, mask_img.affine, mask_img.header))
 
-    return nib.Nifti1Image(imdat.astype('uint16'), mask_img.get_affine(), mask_img.get_header())
+    return out_imgs
 
 
-def make_local_connectivity_scorr(func_img, clust_mask_img, thresh):
+def make_local_connectivity_scorr(func_img, clust_mask_img, thresh, n_jobs=1, chunk_mb=64):
     """
     Constructs a spatially constrained connectivity matrix from a fMRI dataset.
     The weights w_ij of the connectivity matrix W correspond to the
@@ -325,6 +486,12 @@ def make_local_connectivity_scorr(func_img, clust_mask_img, thresh):
     between a voxel and the 27 voxels in its 3D neighborhood
     (face touching and edge touching).
 
+    The FC maps are never formed. With Z the z-scored voxel x time matrix and Zc its columns centered over voxels,
+    the spatially centered FC map of voxel i is z_i Zc^T, so the covariance of two maps is z_i C z_j^T with
+    C = Zc^T Zc, a time x time matrix accumulated over blocks of voxels. Each neighbour weight is then an elementwise
+    dot product between rows of Z C and Z, computed in chunks of seeds (optionally across threads) that only project
+    their own seeds. Z is held once, in float32, and `chunk_mb` bounds every other voxel-sized intermediate.
+
     Parameters
     ----------
     func_img : Nifti1Image
@@ -334,6 +501,10 @@ def make_local_connectivity_scorr(func_img, clust_mask_img, thresh):
     thresh : str
         Threshold value, correlation coefficients lower than this value
         will be removed from the matrix (set to zero).
+    n_jobs : int
+        Number of threads over which chunks of seed voxels are distributed. Default is 1.
+    chunk_mb : int
+        Memory budget per block of voxels or chunk of seeds in megabytes of float32 data. Default is 64.
 
     Returns
     -------
@@ -346,134 +517,122 @@ def make_local_connectivity_scorr(func_img, clust_mask_img, thresh):
     .. Adapted from PyClusterROI
     """
     from scipy.sparse import csc_matrix
-    from scipy import prod
-    from itertools import product
-    from pynets.fmri.clustools import indx_1dto3d, indx_3dto1d
-
-    neighbors = np.array(sorted(sorted(sorted([list(x) for x in list(set(product({-1, 0, 1}, repeat=3)))],
-                                              key=lambda k: (k[0])), key=lambda k: (k[1])), key=lambda k: (k[2])))
-
-    # Read in the mask
-    msz = clust_mask_img.shape
-
-    # Convert the 3D mask array into a 1D vector
-    mskdat = np.reshape(np.asarray(clust_mask_img.dataobj).astype('bool'), prod(msz))
-
-    # Determine the 1D coordinates of the non-zero
-    # elements of the mask
-    iv = np.nonzero(mskdat)[0]
-    sz = func_img.shape
-
-    # Reshape fmri data to a num_voxels x num_timepoints array
-    func_data = func_img.get_fdata(dtype=np.float32)
-    imdat = np.reshape(func_data, (prod(sz[:3]), sz[3]))
-    del func_data
-
-    # Mask the datset to only the in-mask voxels
-    imdat = imdat[iv, :]
-    imdat_sz = imdat.shape
-
-    # Z-score fmri time courses, this makes calculation of the
-    # correlation coefficient a simple matrix product
-    imdat_s = np.tile(np.std(imdat, 1), (imdat_sz[1], 1)).T
-
-    # Replace 0 with really large number to avoid div by zero
-    imdat_s[imdat_s == 0] = 1000000
-    imdat_m = np.tile(np.mean(imdat, 1), (imdat_sz[1], 1)).T
-    imdat = (imdat - imdat_m) / imdat_s
-
-    # Set values with no variance to zero
-    imdat[imdat_s == 0] = 0
-    imdat[np.isnan(imdat)] = 0
-
-    # Remove voxels with zero variance, do this here
-    # so that the mapping will be consistent across
-    # subjects
-    vndx = np.nonzero(np.var(imdat, 1) != 0)[0]
-    iv = iv[vndx]
-    m = len(iv)
+    from pynets.fmri.clustools import local_neighbourhoods
+    from pynets.fmri.fmri_utils import bold_voxel_matrix
+
+    # Read in the mask and determine the 1D coordinates of its non-zero elements
+    mskdat = np.asarray(clust_mask_img.dataobj).astype('bool')
+    iv = np.flatnonzero(mskdat)
+
+    # Stream the in-mask voxels of the fmri data into a num_voxels x num_timepoints float32 array and z-score the
+    # time courses in place. Voxels with no variance are set to zero (their FC maps are zero).
+    imdat = bold_voxel_matrix(func_img, iv)
+    imdat -= imdat.mean(axis=1, dtype='float64', keepdims=True).astype('float32')
+    imdat_s = imdat.std(axis=1, dtype='float64')
+    has_var = imdat_s > 0
+    imdat[has_var] /= imdat_s[has_var, np.newaxis].astype('float32')
+    imdat[~has_var] = 0
+
+    # Voxels with zero variance are removed here so that the mapping will be consistent across subjects
+    vndx = np.flatnonzero(has_var)
+    m = len(vndx)
     print(m, ' # of non-zero valued or non-zero variance voxels in the mask')
 
-    # Construct a sparse matrix from the mask
-    msk = csc_matrix((vndx + 1, (iv, np.zeros(m))), shape=(prod(msz), 1), dtype=np.float32)
-
-    sparse_i = []
-    sparse_j = []
-    sparse_w = [[]]
-
-    for i in range(0, m):
-        if i % 1000 == 0:
-            print('voxel #', i)
-
-        # Convert index into 3D and calculate neighbors, then convert resulting 3D indices into 1D
-        ndx1d = indx_3dto1d(indx_1dto3d(iv[i], sz[:-1]) + neighbors, sz[:-1])
-
-        # Convert 1D indices into masked versions
-        ondx1d = msk[ndx1d].todense()
-
-        # Exclude indices not in the mask
-        ndx1d = ndx1d[np.nonzero(ondx1d)[0]].flatten()
-        ondx1d = np.array(ondx1d[np.nonzero(ondx1d)[0]])
-        ondx1d = ondx1d.flatten() - 1
-
-        # Keep track of the index corresponding to the "seed"
-        nndx = np.nonzero(ndx1d == iv[i])[0]
-
-        # Extract the time courses corresponding to the "seed"
-        # and 3D neighborhood voxels
-        tc = np.array(imdat[ondx1d.astype('int'), :])
-
-        # Ensure that the "seed" has variance, if not just skip it
-        if np.var(tc[nndx, :]) == 0:
-            continue
-
-        # Calculate functional connectivity maps for "seed"
-        # and 3D neighborhood voxels
-        R = np.corrcoef(np.dot(tc, imdat.T) / (sz[3] - 1))
-
-        if np.linalg.matrix_rank(R) == 1:
-            R = np.reshape(R, (1, 1))
-
-        # Set nans to 0
+    # Gram matrix of the voxel-centered time courses, accumulated block by block in float64 from float32 products
+    n_vox, n_t = imdat.shape
+    block_size = max(1, int((chunk_mb * 1048576) // (n_t * 4 * 2)))
+    gram = np.zeros((n_t, n_t))
+    for b0 in range(0, n_vox, block_size):
+        gram += imdat[b0:b0 + block_size].T.dot(imdat[b0:b0 + block_size])
+    vox_mean = imdat.mean(axis=0, dtype='float64')
+    gram -= n_vox * np.outer(vox_mean, vox_mean)
+    gram = gram.astype('float32')
+
+    # Norms of the FC maps, z_i C z_i^T, projected block by block
+    fc_norm = np.zeros(n_vox)
+    for b0 in range(0, n_vox, block_size):
+        fc_norm[b0:b0 + block_size] = np.einsum('ij,ij->i', imdat[b0:b0 + block_size].dot(gram),
+                                                imdat[b0:b0 + block_size], dtype='float64')
+    fc_norm = np.sqrt(np.maximum(fc_norm, 0))
+
+    # Each chunk projects its own seeds and gathers up to 27 neighbour time courses per seed
+    chunk_size = max(1, int((chunk_mb * 1048576) // (28 * n_t * 4)))
+    chunks = [vndx[c0:c0 + chunk_size] for c0 in range(0, m, chunk_size)]
+
+    def _scorr_chunk(seeds):
+        seed_ndx, neighbour_ndx = local_neighbourhoods(mskdat, seeds)
+        valid = has_var[neighbour_ndx]
+        seed_ndx = seed_ndx[valid]
+        neighbour_ndx = neighbour_ndx[valid]
+        projected = imdat[seeds].dot(gram)
+        R = np.einsum('ij,ij->i', projected[np.searchsorted(seeds, seed_ndx)], imdat[neighbour_ndx],
+                      dtype='float64') / (fc_norm[seed_ndx] * fc_norm[neighbour_ndx])
+
+        # Set nans to 0 and values below thresh to 0
         R[np.isnan(R)] = 0
-
-        # Set values below thresh to 0
         R[R < thresh] = 0
+        nz = np.flatnonzero(R)
+        return neighbour_ndx[nz], seed_ndx[nz], R[nz]
 
-        # Calculate the spatial correlation between FC maps
-        if np.linalg.matrix_rank(R) == 0:
-            R = np.reshape(R, (1, 1))
-
-        # Keep track of the indices and the correlation weights
-        # to construct sparse connectivity matrix
-        sparse_i = np.append(sparse_i, ondx1d, 0)
-        sparse_j = np.append(sparse_j, (ondx1d[nndx]) * np.ones(len(ondx1d)))
-        sparse_w = np.append(sparse_w, R[nndx, :], 1)
-
-    # Ensure that the weight vector is the correct shape
-    sparse_w = np.reshape(sparse_w, prod(np.shape(sparse_w)))
-
-    # Concatenate the i, j, and w_ij vectors
-    outlist = sparse_i
-    outlist = np.append(outlist, sparse_j)
-    outlist = np.append(outlist, sparse_w)
-
-    # Calculate the number of non-zero weights in the connectivity matrix
-    n = len(outlist) / 3
+    if n_jobs is None or int(n_jobs) <= 1:
+        results = [_scorr_chunk(seeds) for seeds in chunks]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=int(n_jobs)) as pool:
+            results = list(pool.map(_scorr_chunk, chunks))
 
-    # Reshape the 1D vector read in from infile in to a 3xN array
-    outlist = np.reshape(outlist, (3, int(n)))
+    sparse_i = np.concatenate([r[0] for r in results] + [np.zeros(0, dtype='int64')])
+    sparse_j = np.concatenate([r[1] for r in results] + [np.zeros(0, dtype='int64')])
+    sparse_w = np.concatenate([r[2] for r in results] + [np.zeros(0)])
+    m = int(max(sparse_i.max(), sparse_j.max())) + 1 if len(sparse_w) > 0 else 0
 
-    m = max(max(outlist[0, :]), max(outlist[1, :])) + 1
+    return csc_matrix((sparse_w, (sparse_i, sparse_j)), shape=(m, m), dtype=np.float32)
 
-    W = csc_matrix((outlist[2, :], (outlist[0, :], outlist[1, :])), shape=(int(m), int(m)), dtype=np.float32)
 
-    del imdat, msk, mskdat, outlist, m, sparse_i, sparse_j, sparse_w
+def local_neighbourhoods(mask, seeds=None):
+    """
+    Enumerate the in-mask voxels of the 27-voxel 3D neighbourhood (face, edge and corner touching, including the
+    voxel itself) of each seed voxel of a mask.
 
-    return W
+    Parameters
+    ----------
+    mask : array
+        3D boolean mask array.
+    seeds : array
+        Indices of the seed voxels, in the C-ordered enumeration of the mask's voxels. Default is all voxels.
 
+    Returns
+    -------
+    seed_ndx : array
+        Mask index of the seed of each seed-neighbour pair.
+    neighbour_ndx : array
+        Mask index of the neighbour of each seed-neighbour pair.
+    """
+    from itertools import product
 
-def make_local_connectivity_tcorr(func_img, clust_mask_img, thresh):
+    mask = np.asarray(mask, dtype=bool)
+    index_vol = np.full(mask.shape, -1, dtype='int64')
+    index_vol[mask] = np.arange(np.count_nonzero(mask))
+    coords = np.argwhere(mask)
+    if seeds is None:
+        seeds = np.arange(len(coords))
+    seeds = np.asarray(seeds, dtype='int64')
+    seed_coords = coords[seeds]
+
+    seed_ndx = []
+    neighbour_ndx = []
+    for offset in product((-1, 0, 1), repeat=3):
+        nb_coords = seed_coords + np.array(offset)
+        in_bounds = np.all((nb_coords >= 0) & (nb_coords < np.array(mask.shape)), axis=1)
+        nb_ndx = np.full(len(seeds), -1, dtype='int64')
+        nb_ndx[in_bounds] = index_vol[tuple(nb_coords[in_bounds].T)]
+        in_mask = nb_ndx >= 0
+        seed_ndx.append(seeds[in_mask])
+        neighbour_ndx.append(nb_ndx[in_mask])
+    return np.concatenate(seed_ndx), np.concatenate(neighbour_ndx)
+
+
+def make_local_connectivity_tcorr(func_img, clust_mask_img, thresh, n_jobs=1, chunk_mb=64):
     """
     Constructs a spatially constrained connectivity matrix from a fMRI dataset.
     The weights w_ij of the connectivity matrix W correspond to the
@@ -481,6 +640,11 @@ def make_local_connectivity_tcorr(func_img, clust_mask_img, thresh):
     Connectivity is only calculated between a voxel and the 27 voxels in its 3D
     neighborhood (face touching and edge touching).
 
+    The voxel time series are z-scored once, so that each neighbour correlation is an elementwise dot product.
+    Seeds are processed in chunks (optionally across threads) whose weights are written into preallocated
+    buffers. Neighbour products need random access to the series of every voxel, so the voxel x time matrix of the
+    mask is held in memory; `chunk_mb` bounds the gathered neighbour blocks on top of it.
+
     References
     ----------
     .. Adapted from PyClusterROI
@@ -495,6 +659,10 @@ def make_local_connectivity_tcorr(func_img, clust_mask_img, thresh):
     thresh : str
         Threshold value, correlation coefficients lower than this value
         will be removed from the matrix (set to zero).
+    n_jobs : int
+        Number of threads over which chunks of seed voxels are distributed. Default is 1.
+    chunk_mb : int
+        Memory budget per chunk in megabytes of gathered neighbour time series. Default is 64.
 
     Returns
     -------
@@ -503,115 +671,272 @@ def make_local_connectivity_tcorr(func_img, clust_mask_img, thresh):
         voxel i and voxel j
     """
     from scipy.sparse import csc_matrix
-    from scipy import prod
-    from itertools import product
-    from pynets.fmri.clustools import indx_1dto3d, indx_3dto1d
+    from pynets.fmri.clustools import local_neighbourhoods
+    from pynets.fmri.fmri_utils import bold_voxel_matrix
+
+    # Read in the mask and determine the 1D coordinates of its non-zero elements
+    mskdat = np.asarray(clust_mask_img.dataobj).astype('bool')
+    iv = np.flatnonzero(mskdat)
+    m = len(iv)
+    print("%s%s%s" % ('\nTotal non-zero voxels in the mask: ', m, '\n'))
 
-    # Index array used to calculate 3D neigbors
-    neighbors = np.array(sorted(sorted(sorted([list(x) for x in list(set(product({-1, 0, 1}, repeat=3)))],
-                                              key=lambda k: (k[0])), key=lambda k: (k[1])), key=lambda k: (k[2])))
+    # Stream the in-mask voxels of the fmri data into a num_voxels x num_timepoints array, and normalise each time
+    # course to zero mean and unit norm so that correlation coefficients are dot products. Voxels without variance
+    # have no correlations.
+    imdat = bold_voxel_matrix(func_img, iv).astype('float64')
+    imdat -= imdat.mean(axis=1, keepdims=True)
+    imdat_norm = np.sqrt(np.einsum('ij,ij->i', imdat, imdat))
+    has_var = imdat_norm > 0
+    imdat[has_var] /= imdat_norm[has_var, np.newaxis]
+
+    chunk_size = max(1, int((chunk_mb * 1048576) // (27 * imdat.shape[1] * 8)))
+    chunks = [(c0, min(c0 + chunk_size, m)) for c0 in range(0, m, chunk_size)]
+
+    # Each seed contributes at most 27 weights, written to its own slice of the preallocated buffers
+    sparse_i = np.zeros(27 * m, dtype='int64')
+    sparse_j = np.zeros(27 * m, dtype='int64')
+    sparse_w = np.zeros(27 * m, dtype='float64')
+    keep = np.zeros(27 * m, dtype='bool')
+
+    def _tcorr_chunk(bounds):
+        seeds = np.arange(bounds[0], bounds[1])
+        seeds = seeds[has_var[seeds]]
+        seed_ndx, neighbour_ndx = local_neighbourhoods(mskdat, seeds)
+        R = np.einsum('ij,ij->i', imdat[seed_ndx], imdat[neighbour_ndx])
+        R[R < thresh] = 0
+        nz = np.flatnonzero(R)
+        out = slice(27 * bounds[0], 27 * bounds[0] + len(nz))
+        sparse_i[out] = neighbour_ndx[nz]
+        sparse_j[out] = seed_ndx[nz]
+        sparse_w[out] = R[nz]
+        keep[out] = True
+
+    if n_jobs is None or int(n_jobs) <= 1:
+        for bounds in chunks:
+            _tcorr_chunk(bounds)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=int(n_jobs)) as pool:
+            list(pool.map(_tcorr_chunk, chunks))
 
-    # Read in the mask
-    msz = np.shape(np.asarray(clust_mask_img.dataobj).astype('bool'))
+    sparse_i = sparse_i[keep]
+    sparse_j = sparse_j[keep]
+    sparse_w = sparse_w[keep]
+    m = int(max(sparse_i.max(), sparse_j.max())) + 1 if len(sparse_w) > 0 else 0
 
-    # Convert the 3D mask array into a 1D vector
-    mskdat = np.reshape(np.asarray(clust_mask_img.dataobj).astype('bool'), prod(msz))
+    return csc_matrix((sparse_w, (sparse_i, sparse_j)), shape=(m, m), dtype=np.float32)
 
-    # Determine the 1D coordinates of the non-zero elements of the mask
-    iv = np.nonzero(mskdat)[0]
-    m = len(iv)
-    print("%s%s%s" % ('\nTotal non-zero voxels in the mask: ', m, '\n'))
-    sz = func_img.shape
 
-    # Reshape fmri data to a num_voxels x num_timepoints array
-    func_data = func_img.get_fdata(dtype=np.float32)
-    imdat = np.reshape(func_data, (prod(sz[:3]), sz[3]))
-    del func_data
+def cut_tree(children, n_leaves, k):
+    """
+    Cut an agglomerative clustering tree into k clusters by undoing its last k - 1 merges.
+
+    Parameters
+    ----------
+    children : array
+        (n_leaves - 1) x 2 array of the nodes merged at each step, as returned by scikit-learn's ward_tree and
+        linkage_tree. Node i >= n_leaves is the cluster formed at merge i - n_leaves.
+    n_leaves : int
+        Number of leaves (voxels) of the tree.
+    k : int
+        Number of clusters.
 
-    # Construct a sparse matrix from the mask
-    msk = csc_matrix((list(range(1, m + 1)), (iv, np.zeros(m))), shape=(prod(sz[:-1]), 1), dtype=np.float32)
-    sparse_i = []
-    sparse_j = []
-    sparse_w = []
+    Returns
+    -------
+    labels : array
+        Cluster label in 0..k-1 of each leaf.
+    """
+    n_merges = max(0, int(n_leaves) - int(k))
+    root = np.arange(n_leaves + n_merges)
 
-    negcount = 0
+    # Walk the applied merges from the last to the first, so that each node inherits the root of its parent
+    for i in range(n_merges - 1, -1, -1):
+        root[children[i]] = root[n_leaves + i]
+    return np.unique(root[:n_leaves], return_inverse=True)[1]
 
-    # Loop over all of the voxels in the mask
-    print('Voxels:')
-    for i in range(0, m):
-        if i % 1000 == 0:
-            print(str(i))
-        # Calculate the voxels that are in the 3D neighborhood of the center voxel
-        ndx1d = indx_3dto1d(indx_1dto3d(iv[i], sz[:-1]) + neighbors, sz[:-1])
 
-        # Restrict the neigborhood using the mask
-        ondx1d = msk[ndx1d].todense()
-        ndx1d = ndx1d[np.nonzero(ondx1d)[0]].flatten()
-        ondx1d = np.array(ondx1d[np.nonzero(ondx1d)[0]]).flatten()
+def hierarchical_tree(X, connectivity=None, linkage='ward'):
+    """
+    Fit a connectivity-constrained agglomerative clustering tree, to be cut at any number of clusters by `cut_tree`.
 
-        # Determine the index of the seed voxel in the neighborhood
-        nndx = np.nonzero(ndx1d == iv[i])[0]
+    Parameters
+    ----------
+    X : array
+        n_voxels x n_features array of voxel features (e.g. cleaned time-series).
+    connectivity : sparse matrix
+        n_voxels x n_voxels spatial connectivity constraint. Default is None (unconstrained).
+    linkage : str
+        'ward', 'complete', 'average' or 'single'. Default is 'ward'.
 
-        # Extract the timecourses for all of the voxels in the neighborhood
-        tc = np.array(imdat[ndx1d.astype('int'), :])
+    Returns
+    -------
+    children : array
+        (n_leaves - 1) x 2 array of the nodes merged at each step.
+    n_leaves : int
+        Number of leaves (voxels) of the tree.
+    """
+    from sklearn.cluster import ward_tree, linkage_tree
 
-        # Ensure that the "seed" has variance, if not just skip it
-        if np.var(tc[nndx, :]) == 0:
-            continue
+    if linkage == 'ward':
+        children, _, n_leaves, _ = ward_tree(X, connectivity=connectivity, n_clusters=None)
+    elif linkage == 'complete' or linkage == 'average' or linkage == 'single':
+        children, _, n_leaves, _ = linkage_tree(X, connectivity=connectivity, n_clusters=None, linkage=linkage)
+    else:
+        raise ValueError("%s%s" % ('\nERROR: Linkage not recognized: ', linkage))
+    return children, n_leaves
 
-        # Calculate the correlation between all of the voxel TCs
-        R = np.corrcoef(tc)
 
-        if np.linalg.matrix_rank(R) == 1:
-            R = np.reshape(R, (1, 1))
+def hierarchical_parcellations(X, k_list, connectivity=None, linkage='ward'):
+    """
+    Fit one connectivity-constrained agglomerative clustering tree and cut it at every number of clusters in k_list,
+    instead of refitting the hierarchy for each k.
 
-        # Set nans to 0
-        R[np.isnan(R)] = 0
+    Parameters
+    ----------
+    X : array
+        n_voxels x n_features array of voxel features (e.g. cleaned time-series).
+    k_list : list
+        Numbers of clusters that will be generated.
+    connectivity : sparse matrix
+        n_voxels x n_voxels spatial connectivity constraint. Default is None (unconstrained).
+    linkage : str
+        'ward', 'complete', 'average' or 'single'. Default is 'ward'.
 
-        # Set values below thresh to 0
-        R[R < thresh] = 0
+    Returns
+    -------
+    labels_list : list
+        Array of cluster labels in 0..k-1 for each k, in the order of k_list.
+    """
+    from pynets.fmri.clustools import cut_tree, hierarchical_tree
 
-        if np.linalg.matrix_rank(R) == 0:
-            R = np.reshape(R, (1, 1))
+    children, n_leaves = hierarchical_tree(X, connectivity=connectivity, linkage=linkage)
+    return [cut_tree(children, n_leaves, k) for k in k_list]
 
-        # Extract just the correlations with the seed TC
-        R = R[nndx, :].flatten()
 
-        # Set NaN values to 0
-        negcount = negcount + sum(R < 0)
+def _cluster_component(data_path, rows, comp_mask, affine, k, clust_type, random_state=42):
+    """
+    Cluster the voxels of one connected component of a clustering mask, reading their cleaned time-series from the
+    rows of a memory-mapped n_voxels x n_timepoints array shared between worker processes.
 
-        # Determine the non-zero correlations (matrix weights) and add their indices and values to the list
-        nzndx = np.nonzero(R)[0]
-        if len(nzndx) > 0:
-            sparse_i = np.append(sparse_i, ondx1d[nzndx] - 1, 0)
-            sparse_j = np.append(sparse_j, (ondx1d[nndx] - 1) * np.ones(len(nzndx)))
-            sparse_w = np.append(sparse_w, R[nzndx], 0)
+    Returns
+    -------
+    labels : array
+        Cluster label in 0..k-1 of each voxel of the component, in C order.
+    """
+    X = np.asarray(np.load(data_path, mmap_mode='r')[rows], dtype='float64')
+    if clust_type == 'kmeans':
+        from sklearn.cluster import MiniBatchKMeans
+        labels = MiniBatchKMeans(n_clusters=int(k), init='k-means++', random_state=random_state).fit(X).labels_
+    elif clust_type == 'rena':
+        from nilearn.regions import ReNA
+        labels = ReNA(nib.Nifti1Image(comp_mask.astype('uint8'), affine), n_clusters=int(k), scaling=False,
+                      n_iter=10).fit(X.T).labels_
+    else:
+        raise ValueError("%s%s" % ('\nERROR: Clustering method not supported per connected component: ', clust_type))
+    return np.unique(labels, return_inverse=True)[1]
 
-    # Concatenate the i, j and w_ij into a single vector
-    outlist = sparse_i
-    outlist = np.append(outlist, sparse_j)
-    outlist = np.append(outlist, sparse_w)
 
-    # Calculate the number of non-zero weights in the connectivity matrix
-    n = len(outlist) / 3
+def get_local_conn_cache_path(func_file, clust_mask_img, local_corr, r_thresh, cache_dir=None):
+    """
+    Content-addressed path of a cached local connectivity matrix. The key covers the BOLD data (by file
+    fingerprint), the cleaned clustering mask, the local connectivity type and the correlation threshold, but not
+    the number of clusters or the clustering method, so that every k and clust_type of a subject share one matrix.
 
-    # Reshape the 1D vector read in from infile in to a 3xN array
-    outlist = np.reshape(outlist, (3, int(n)))
+    Parameters
+    ----------
+    func_file : str
+        File path to a 4D Nifti1Image containing fMRI data.
+    clust_mask_img : Nifti1Image
+        3D NIFTI file containing the cleaned clustering mask.
+    local_corr : str
+        Type of local connectivity (tcorr or scorr).
+    r_thresh : float
+        Correlation threshold of the local connectivity matrix.
+    cache_dir : str
+        Directory of cached matrices. Default is ~/.pynets/cache/local_conn.
+
+    Returns
+    -------
+    local_conn_mat_path : str
+        File path to the .npz sparse matrix.
+    """
+    import os
+    import hashlib
+    from pynets.core.utils import file_fingerprint
 
-    m = max(max(outlist[0, :]), max(outlist[1, :])) + 1
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.pynets', 'cache', 'local_conn')
 
-    W = csc_matrix((outlist[2, :], (outlist[0, :], outlist[1, :])), shape=(int(m), int(m)), dtype=np.float32)
+    key = hashlib.sha256()
+    key.update(file_fingerprint(func_file).encode())
+    key.update(np.asarray(clust_mask_img.shape[:3], dtype='int64').tobytes())
+    key.update(np.asarray(clust_mask_img.affine, dtype='float64').tobytes())
+    key.update(np.packbits(np.asarray(clust_mask_img.dataobj).ravel() > 0).tobytes())
+    key.update(np.float64(r_thresh).tobytes())
+    return "%s%s%s%s%s%s" % (cache_dir, '/', local_corr, '_', key.hexdigest(), '_conn.npz')
 
-    del imdat, msk, mskdat, outlist, m, sparse_i, sparse_j, sparse_w
 
-    return W
+def get_clean_mask_cache_path(func_file, clust_mask, mask=None, num_std_dev=1.5, cache_dir=None):
+    """
+    Content-addressed path of a cached subject-refined clustering mask (see `NiParcellate.create_clean_mask`). The
+    key covers the BOLD data, the clustering mask and brain mask (by file fingerprint) and the intensity threshold,
+    so that every k and clust_type of a subject share one mask.
+
+    Parameters
+    ----------
+    func_file : str
+        File path to a 4D Nifti1Image containing fMRI data.
+    clust_mask : str
+        File path to a 3D NIFTI file containing the clustering mask.
+    mask : str
+        File path to a 3D NIFTI file containing a brain mask. Default is None.
+    num_std_dev : float
+        Number of standard deviations below the mean BOLD intensity under which voxels are excluded. Default is 1.5.
+    cache_dir : str
+        Directory of cached masks. Default is ~/.pynets/cache/clust_mask.
+
+    Returns
+    -------
+    clean_mask_path : str
+        File path to the cached .nii.gz mask.
+    """
+    import os
+    import hashlib
+    from pynets.core.utils import file_fingerprint
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.pynets', 'cache', 'clust_mask')
+
+    key = hashlib.sha256()
+    key.update(file_fingerprint(func_file).encode())
+    key.update(file_fingerprint(clust_mask).encode())
+    key.update(file_fingerprint(mask).encode() if mask is not None else b'None')
+    key.update(np.float64(num_std_dev).tobytes())
+    return "%s%s%s%s%s%s" % (cache_dir, '/', os.path.basename(clust_mask).split('.nii')[0], '_clean-',
+                             key.hexdigest(), '.nii.gz')
+
+
+def _save_img_atomic(img, out_file):
+    """
+    Save a Nifti1Image to a temporary file beside out_file and rename it into place, so that concurrent readers of
+    a cache never see a partial file.
+    """
+    import os
+    import tempfile
+
+    os.makedirs(os.path.dirname(out_file), exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(suffix='.nii.gz', dir=os.path.dirname(out_file))
+    os.close(fd)
+    nib.save(img, tmp_file)
+    os.replace(tmp_file, out_file)
 
 
 class NiParcellate(object):
     """
     Class for implementing various clustering routines.
     """
-    def __init__(self, func_file, clust_mask, k, clust_type, local_corr, conf=None, mask=None):
+    def __init__(self, func_file, clust_mask, k, clust_type, local_corr, conf=None, mask=None, cache_dir=None,
+                 k_list=None):
         """
         Parameters
         ----------
@@ -632,7 +957,18 @@ class NiParcellate(object):
         mask : str
             File path to a 3D NIFTI file containing a mask, which restricts the
             voxels used in the analysis.
+        cache_dir : str
+            Directory of the caches of local connectivity matrices and cleaned clustering masks shared across k and
+            clustering methods (see `get_local_conn_cache_path` and `get_clean_mask_cache_path`). Default is
+            ~/.pynets/cache/local_conn and ~/.pynets/cache/clust_mask, respectively.
+        k_list : list
+            Numbers of clusters of every parcellation of this subject, mask and clustering method in the run. For
+            ncut, the eigenbasis of the largest is computed once and cached beside the local connectivity matrix, so
+            that the parcellations at every k share it. Likewise for ward, complete, average and single linkage, one
+            agglomerative tree is fit, cached and cut at each k. Default is None.
         """
+        from pynets.fmri.fmri_utils import load_bold
+
         self.func_file = func_file
         self.clust_mask = clust_mask
         self.k = int(k)
@@ -643,10 +979,13 @@ class NiParcellate(object):
         self.atlas = None
         self._detrending = True
         self._standardize = True
-        self._func_img = nib.load(self.func_file)
+        self._func_img = load_bold(self.func_file)
         self.mask = mask
+        self.cache_dir = cache_dir
+        self.k_list = k_list
         self._mask_img = None
         self._local_conn_mat_path = None
+        self._clean_mask_path = None
         self._dir_path = None
         self._clust_est = None
         self._local_conn = None
@@ -658,23 +997,49 @@ class NiParcellate(object):
 
     def create_clean_mask(self, num_std_dev=1.5):
         """
-        Create a subject-refined version of the clustering mask.
+        Create a subject-refined version of the clustering mask, or load it from the cache shared by every k and
+        clust_type of the subject (see `get_clean_mask_cache_path`).
         """
         import os
-        from pynets.core import utils
-        from nilearn.masking import intersect_masks
-        from nilearn.image import index_img, math_img, resample_img
+        from pynets.fmri.clustools import get_clean_mask_cache_path, _save_img_atomic
         mask_name = os.path.basename(self.clust_mask).split('.nii')[0]
-        self.atlas = "%s%s%s%s%s" % (mask_name, '_', self.clust_type, '_k', str(self.k))
-        print("%s%s%s%s%s%s%s" % ('\nCreating atlas using ', self.clust_type, ' at cluster level ', str(self.k),
-                                  ' for ', str(self.atlas), '...\n'))
-        self._dir_path = utils.do_dir_path(self.atlas, self.func_file)
-        self.uatlas = "%s%s%s%s%s%s%s%s" % (self._dir_path, '/', mask_name, '_clust-', self.clust_type, '_k',
-                                            str(self.k), '.nii.gz')
+        self._set_k(self.k)
+        self._func_img.set_data_dtype(np.float32)
+
+        self._clean_mask_path = get_clean_mask_cache_path(self.func_file, self.clust_mask, self.mask, num_std_dev,
+                                                          self.cache_dir)
+        self._clust_mask_corr_img = None
+        if os.path.isfile(self._clean_mask_path):
+            try:
+                clean_mask_img = nib.load(self._clean_mask_path)
+                self._clust_mask_corr_img = nib.Nifti1Image(np.asarray(clean_mask_img.dataobj).astype('uint16'),
+                                                            clean_mask_img.affine)
+            except (OSError, ValueError, EOFError):
+                self._clust_mask_corr_img = None
+
+        if self._clust_mask_corr_img is None:
+            self._clust_mask_corr_img = self._refine_clust_mask(num_std_dev)
+            try:
+                _save_img_atomic(self._clust_mask_corr_img, self._clean_mask_path)
+            except OSError:
+                print("%s%s" % ('Warning: could not cache clustering mask in ', os.path.dirname(
+                    self._clean_mask_path)))
+                self._clean_mask_path = None
+        nib.save(self._clust_mask_corr_img, "%s%s%s%s" % (self._dir_path, '/', mask_name, '.nii.gz'))
+
+        return self.atlas
+
+    def _refine_clust_mask(self, num_std_dev):
+        """
+        Intersect the clustering mask (and brain mask) resampled to BOLD space with the voxels of a BOLD volume whose
+        intensity is above num_std_dev standard deviations below its mean.
+        """
+        from nilearn.masking import intersect_masks
+        from nilearn.image import math_img, resample_img
+        from pynets.fmri.fmri_utils import get_volume
 
         # Load clustering mask
-        self._func_img.set_data_dtype(np.float32)
-        func_vol_img = index_img(self._func_img, 1)
+        func_vol_img = get_volume(self._func_img, 1)
         func_vol_img.set_data_dtype(np.uint16)
         clust_mask_res_img = resample_img(nib.load(self.clust_mask), target_affine=func_vol_img.affine,
                                           target_shape=func_vol_img.shape, interpolation='nearest')
@@ -699,26 +1064,69 @@ class NiParcellate(object):
                                                          math_img('img > 0.01', img=clust_mask_res_img)],
                                                         threshold=1, connected=False)
             self._clust_mask_corr_img.set_data_dtype(np.uint16)
-        nib.save(self._clust_mask_corr_img, "%s%s%s%s" % (self._dir_path, '/', mask_name, '.nii.gz'))
 
         del func_data
         func_vol_img.uncache()
         clust_mask_res_img.uncache()
 
+        return self._clust_mask_corr_img
+
+    def _set_k(self, k):
+        """
+        Set the number of clusters, along with the atlas name, directory and file path that depend on it.
+        """
+        import os
+        from pynets.core import utils
+        self.k = int(k)
+        mask_name = os.path.basename(self.clust_mask).split('.nii')[0]
+        self.atlas = "%s%s%s%s%s" % (mask_name, '_', self.clust_type, '_k', str(self.k))
+        print("%s%s%s%s%s%s%s" % ('\nCreating atlas using ', self.clust_type, ' at cluster level ', str(self.k),
+                                  ' for ', str(self.atlas), '...\n'))
+        self._dir_path = utils.do_dir_path(self.atlas, self.func_file)
+        self.uatlas = "%s%s%s%s%s%s%s%s" % (self._dir_path, '/', mask_name, '_clust-', self.clust_type, '_k',
+                                            str(self.k), '.nii.gz')
         return self.atlas
 
     def create_local_clustering(self, overwrite, r_thresh, min_region_size=80):
         """
         API for performing any of a variety of clustering routines available through NiLearn.
         """
+        import os
         import os.path as op
+        import tempfile
         from scipy.sparse import save_npz, load_npz
         from nilearn.regions import connected_regions
-
-        conn_comps = connected_regions(self._clust_mask_corr_img, extract_type='connected_components',
-                                       min_region_size=min_region_size)
-        self._conn_comps = conn_comps[0]
-        self.num_conn_comps = len(conn_comps[1])
+        from pynets.fmri.clustools import get_local_conn_cache_path, _save_img_atomic
+
+        # Connected components of the clean mask are cached beside it as a label volume
+        comps_path = None
+        if self._clean_mask_path is not None:
+            comps_path = "%s%s%s%s" % (self._clean_mask_path.split('.nii')[0], '_conn-comps-', min_region_size,
+                                       '.nii.gz')
+        comp_labels = None
+        if comps_path is not None and op.isfile(comps_path):
+            try:
+                comp_labels = np.asarray(nib.load(comps_path).dataobj).astype('int64')
+            except (OSError, ValueError, EOFError):
+                comp_labels = None
+        if comp_labels is None:
+            conn_comps = connected_regions(self._clust_mask_corr_img, extract_type='connected_components',
+                                           min_region_size=min_region_size)
+            comp_labels = np.zeros(self._clust_mask_corr_img.shape[:3], dtype='int64')
+            # No component survives min_region_size, leaving an empty label volume
+            if conn_comps[0] is not None:
+                comp_data = np.asarray(conn_comps[0].dataobj) > 0
+                for i in range(comp_data.shape[3] if comp_data.ndim == 4 else 0):
+                    comp_labels[comp_data[..., i]] = i + 1
+            if comps_path is not None:
+                try:
+                    _save_img_atomic(nib.Nifti1Image(comp_labels.astype('uint16'),
+                                                     self._clust_mask_corr_img.affine), comps_path)
+                except OSError:
+                    print("%s%s" % ('Warning: could not cache connected components in ', op.dirname(comps_path)))
+        self.num_conn_comps = int(comp_labels.max())
+        self._conn_comps = nib.Nifti1Image((comp_labels[..., np.newaxis] == np.arange(1, self.num_conn_comps + 1)
+                                            ).astype('uint8'), self._clust_mask_corr_img.affine)
 
         if self.clust_type == 'complete' or self.clust_type == 'average' or self.clust_type == 'single':
             if self.num_conn_comps > 1:
@@ -730,10 +1138,19 @@ class NiParcellate(object):
                 raise ValueError('k must minimally be greater than the total number of connected components in '
                                  'the mask in the case of agglomerative clustering.')
             if self.local_corr == 'tcorr' or self.local_corr == 'scorr':
-                self._local_conn_mat_path = "%s%s%s%s" % (self.uatlas.split('.nii')[0], '_', self.local_corr,
-                                                          '_conn.npz')
-
-                if (not op.isfile(self._local_conn_mat_path)) or (overwrite is True):
+                self._local_conn_mat_path = get_local_conn_cache_path(self.func_file, self._clust_mask_corr_img,
+                                                                      self.local_corr, r_thresh, self.cache_dir)
+
+                self._local_conn = None
+                if op.isfile(self._local_conn_mat_path) and (overwrite is False):
+                    try:
+                        self._local_conn = load_npz(self._local_conn_mat_path)
+                        print("%s%s" % ('Loading cached spatially constrained connectivity structure from: ',
+                                        self._local_conn_mat_path))
+                    except (OSError, ValueError):
+                        self._local_conn = None
+
+                if self._local_conn is None:
                     from pynets.fmri.clustools import make_local_connectivity_tcorr, make_local_connectivity_scorr
                     if self.local_corr == 'tcorr':
                         self._local_conn = make_local_connectivity_tcorr(self._func_img, self._clust_mask_corr_img,
@@ -746,9 +1163,18 @@ class NiParcellate(object):
 
                     print("%s%s" % ('Saving spatially constrained connectivity structure to: ',
                                     self._local_conn_mat_path))
-                    save_npz(self._local_conn_mat_path, self._local_conn)
-                elif op.isfile(self._local_conn_mat_path):
-                    self._local_conn = load_npz(self._local_conn_mat_path)
+                    try:
+                        os.makedirs(op.dirname(self._local_conn_mat_path), exist_ok=True)
+                        fd, tmp_path = tempfile.mkstemp(suffix='.npz', dir=op.dirname(self._local_conn_mat_path))
+                        os.close(fd)
+                        save_npz(tmp_path, self._local_conn)
+                        os.replace(tmp_path, self._local_conn_mat_path)
+                    except OSError:
+                        print("%s%s" % ('Warning: could not cache local connectivity structure in ',
+                                        op.dirname(self._local_conn_mat_path)))
+                        self._local_conn_mat_path = "%s%s%s%s" % (self.uatlas.split('.nii')[0], '_',
+                                                                  self.local_corr, '_conn.npz')
+                        save_npz(self._local_conn_mat_path, self._local_conn)
             elif self.local_corr == 'allcorr':
                 self._local_conn = 'auto'
             else:
@@ -758,15 +1184,22 @@ class NiParcellate(object):
             self._local_conn = 'auto'
         return
 
-    def parcellate(self):
+    def parcellate(self, n_jobs=1):
         """
         API for performing any of a variety of clustering routines available through NiLearn.
+
+        Parameters
+        ----------
+        n_jobs : int
+            Number of processes over which the connected components of the mask are clustered by rena and kmeans.
+            Default is 1.
         """
         import gc
         import time
         import os
         from nilearn.regions import Parcellations
-        from pynets.fmri.estimation import fill_confound_nans
+        from pynets.fmri.estimation import load_confounds
+        from pynets.fmri.clustools import parcellate_ncut_k_list, cut_tree
 
         start = time.time()
 
@@ -777,8 +1210,21 @@ class NiParcellate(object):
             else:
                 raise FileNotFoundError('File containing sparse matrix of local connectivity structure not found.')
 
-        if self.clust_type == 'complete' or self.clust_type == 'average' or self.clust_type == 'single' or \
-            self.clust_type == 'ward' or (self.clust_type == 'rena' and self.num_conn_comps == 1) or \
+        # rena and kmeans cluster each connected component of the mask separately
+        if (self.clust_type == 'rena' or self.clust_type == 'kmeans') and self.num_conn_comps == 0:
+            raise ValueError("%s%s%s" % ('\nERROR: No connected component of the clustering mask survives the minimum '
+                                         'region size, leaving nothing to cluster with ', self.clust_type, '.'))
+
+        if self.k_list and (self.clust_type == 'complete' or self.clust_type == 'average' or
+                            self.clust_type == 'single' or self.clust_type == 'ward'):
+            # Cut the tree shared by the parcellations at every k
+            mskdat = np.asarray(self._clust_mask_corr_img.dataobj) > 0
+            children, n_leaves = self._agglomerative_tree(mskdat)
+            labels_data = np.zeros(mskdat.shape, dtype='uint16')
+            labels_data[mskdat] = cut_tree(children, n_leaves, self.k) + 1
+            nib.save(nib.Nifti1Image(labels_data, self._clust_mask_corr_img.affine), self.uatlas)
+        elif self.clust_type == 'complete' or self.clust_type == 'average' or self.clust_type == 'single' or \
+                self.clust_type == 'ward' or (self.clust_type == 'rena' and self.num_conn_comps == 1) or \
                 (self.clust_type == 'kmeans' and self.num_conn_comps == 1):
             self._clust_est = Parcellations(method=self.clust_type, standardize=self._standardize,
                                             detrend=self._detrending,
@@ -787,97 +1233,387 @@ class NiParcellate(object):
                                             random_state=42)
 
             if self.conf is not None:
-                import pandas as pd
-                confounds = pd.read_csv(self.conf, sep='\t')
-                if confounds.isnull().values.any():
-                    conf_corr = fill_confound_nans(confounds, self._dir_path)
-                    self._clust_est.fit(self._func_img, confounds=conf_corr)
-                else:
-                    self._clust_est.fit(self._func_img, confounds=self.conf)
+                self._clust_est.fit(self._func_img, confounds=np.array(load_confounds(self.conf)))
             else:
                 self._clust_est.fit(self._func_img)
 
             self._clust_est.labels_img_.set_data_dtype(np.uint16)
             nib.save(self._clust_est.labels_img_, self.uatlas)
         elif self.clust_type == 'ncut':
-            out_img = parcellate_ncut(self._local_conn, self.k, self._clust_mask_corr_img)
+            n_eigen = max([int(k) for k in self.k_list]) if self.k_list else None
+            out_img = parcellate_ncut_k_list(self._local_conn, [self.k], self._clust_mask_corr_img, n_eigen=n_eigen,
+                                             eigen_cache=self._ncut_eigen_cache_path(max(self.k, n_eigen or 0)))[0]
             out_img.set_data_dtype(np.uint16)
             nib.save(out_img, self.uatlas)
-        elif self.clust_type == 'rena' or self.clust_type == 'kmeans' and self.num_conn_comps > 1:
-            from pynets.core import nodemaker
-            from nilearn.regions import connected_regions, Parcellations
-            from nilearn.image import iter_img, new_img_like
-            from pynets.core.utils import flatten, proportional
-
-            mask_img_list = []
-            mask_voxels_dict = dict()
-            for i, mask_img in enumerate(list(iter_img(self._conn_comps))):
-                mask_voxels_dict[i] = np.int(np.sum(np.asarray(mask_img.dataobj)))
-                mask_img_list.append(mask_img)
+        elif (self.clust_type == 'rena' or self.clust_type == 'kmeans') and self.num_conn_comps > 1:
+            import shutil
+            import tempfile
+            from nilearn.image import iter_img
+            from pynets.core.utils import proportional
+            from pynets.fmri.clustools import _cluster_component
+
+            comp_masks = [np.asarray(mask_img.dataobj) > 0 for mask_img in iter_img(self._conn_comps)]
 
             # Allocate k across connected components using Hagenbach-Bischoff Quota based on number of voxels
-            k_list = proportional(self.k, list(mask_voxels_dict.values()))
-
-            conn_comp_atlases = []
-            print("%s%s%s" % ('Building ', len(mask_img_list), ' separate atlases with voxel-proportional nclusters '
-                                                               'for each connected component...'))
-            for i, mask_img in enumerate(mask_img_list):
-                if k_list[i] == 0:
-                    # print('0 voxels in component. Discarding...')
-                    continue
-                self._clust_est = Parcellations(method=self.clust_type, standardize=self._standardize,
-                                                detrend=self._detrending,
-                                                n_parcels=k_list[i], mask=mask_img,
-                                                mask_strategy='background',
-                                                memory_level=2,
-                                                random_state=42)
-                if self.conf is not None:
-                    import pandas as pd
-                    confounds = pd.read_csv(self.conf, sep='\t')
-                    if confounds.isnull().values.any():
-                        conf_corr = fill_confound_nans(confounds, self._dir_path)
-                        self._clust_est.fit(self._func_img, confounds=conf_corr)
-                    else:
-                        self._clust_est.fit(self._func_img, confounds=self.conf)
+            k_list = proportional(self.k, [int(np.sum(comp_mask)) for comp_mask in comp_masks])
+
+            # Stream and clean the time-series of all component voxels once, into a memory-mapped array shared by
+            # the per-component workers
+            union_mask = np.any(comp_masks, axis=0)
+            union_ndx = np.full(union_mask.shape, -1, dtype='int64')
+            union_ndx[union_mask] = np.arange(int(np.sum(union_mask)))
+            tmp_dir = tempfile.mkdtemp(dir=self._dir_path)
+            data_path = "%s%s" % (tmp_dir, '/comp_voxels.npy')
+            np.save(data_path, self._voxel_features(union_mask).astype('float32'))
+
+            print("%s%s%s" % ('Building ', len(comp_masks), ' separate atlases with voxel-proportional nclusters '
+                              'for each connected component...'))
+            jobs = [(data_path, union_ndx[comp_mask], comp_mask, self._clust_mask_corr_img.affine, k_list[i],
+                     self.clust_type) for i, comp_mask in enumerate(comp_masks) if k_list[i] > 0]
+            try:
+                if n_jobs is None or int(n_jobs) <= 1:
+                    comp_labels = [_cluster_component(*job) for job in jobs]
                 else:
-                    self._clust_est.fit(self._func_img)
-                conn_comp_atlases.append(self._clust_est.labels_img_)
+                    from concurrent.futures import ProcessPoolExecutor
+                    with ProcessPoolExecutor(max_workers=int(n_jobs)) as pool:
+                        comp_labels = list(pool.map(_cluster_component, *zip(*jobs)))
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+            # Then combine the atlases of each connected component into a single atlas by offsetting their labels
+            labels_data = np.zeros(union_mask.shape, dtype='uint16')
+            offset = 0
+            for job, labels in zip(jobs, comp_labels):
+                labels_data[job[2]] = labels + 1 + offset
+                offset += int(labels.max()) + 1
+
+            nib.save(nib.Nifti1Image(labels_data, self._clust_mask_corr_img.affine), self.uatlas)
+            del comp_masks, comp_labels, labels_data
+
+        print("%s%s%s" % (self.clust_type, self.k, " clusters: %.2fs" % (time.time() - start)))
+
+        self._clust_est = None
+        self._func_img.uncache()
+        self._clust_mask_corr_img.uncache()
+        gc.collect()
 
-            # Then combine the multiple atlases, corresponding to each connected component, into a single atlas
-            atlas_of_atlases = []
-            for atlas in conn_comp_atlases:
-                bna_data = np.around(np.asarray(atlas.dataobj)).astype('uint16')
+        return self.uatlas
 
-                # Get an array of unique parcels
-                bna_data_for_coords_uniq = np.unique(bna_data)
+    def _ncut_eigen_cache_path(self, n_eigen, solver='arpack'):
+        """
+        Path of the cached ncut eigenbasis, beside the local connectivity matrix it is computed from.
+        """
+        if self._local_conn_mat_path is None:
+            return None
+        return "%s%s%s%s%s%s" % (self._local_conn_mat_path.split('_conn.npz')[0], '_ncut-', solver, '-', int(n_eigen),
+                                 '.npz')
 
-                # Number of parcels:
-                par_max = len(bna_data_for_coords_uniq) - 1
-                img_stack = []
-                for idx in range(1, par_max + 1):
-                    roi_img = bna_data == bna_data_for_coords_uniq[idx].astype('uint16')
-                    img_stack.append(roi_img.astype('uint16'))
-                img_stack = np.array(img_stack)
+    def _tree_cache_path(self):
+        """
+        Path of the cached agglomerative tree, beside the local connectivity matrix that constrains it, or beside the
+        cleaned clustering mask when the tree is constrained by the voxel grid. The tree is also fit to the
+        confound-regressed time-series, so the confounds file is part of its key.
+        """
+        import hashlib
+        from scipy.sparse import issparse
+        from pynets.core.utils import file_fingerprint
+
+        if issparse(self._local_conn) and self._local_conn_mat_path is not None:
+            base = self._local_conn_mat_path.split('_conn.npz')[0]
+        elif self._clean_mask_path is not None:
+            base = "%s%s" % (self._clean_mask_path.split('.nii')[0], '_grid')
+        else:
+            return None
+        conf_key = hashlib.sha256(file_fingerprint(self.conf).encode()).hexdigest()[:16] if self.conf is not None \
+            else 'none'
+        return "%s%s%s%s%s%s" % (base, '_tree-', self.clust_type, '-', conf_key, '.npz')
 
-                img_list = []
-                for idy in range(par_max):
-                    img_list.append(new_img_like(atlas, img_stack[idy]))
-                atlas_of_atlases.append(img_list)
-                del img_list, img_stack, bna_data
+    def _agglomerative_tree(self, mskdat):
+        """
+        Agglomerative tree of the clustering mask's voxels for the linkage of clust_type, cached on disk (see
+        `_tree_cache_path`) so that the parcellations at every k share one fit.
+        """
+        from pynets.fmri.clustools import hierarchical_tree, _locked_npz_cache
 
-            atlas_of_atlases = list(flatten(atlas_of_atlases))
+        def _tree():
+            children, n_leaves = hierarchical_tree(self._voxel_features(mskdat),
+                                                   connectivity=self._voxel_connectivity(mskdat),
+                                                   linkage=self.clust_type)
+            return {'children': children, 'n_leaves': np.array(n_leaves)}
 
-            [super_atlas_ward, _] = nodemaker.create_parcel_atlas(atlas_of_atlases)
-            super_atlas_ward.set_data_dtype(np.uint16)
+        tree = _locked_npz_cache(self._tree_cache_path(), _tree, 'agglomerative tree')
+        return tree['children'], int(tree['n_leaves'])
 
-            nib.save(super_atlas_ward, self.uatlas)
-            del atlas_of_atlases, super_atlas_ward, conn_comp_atlases, mask_img_list, mask_voxels_dict
+    def _voxel_features(self, mskdat):
+        """
+        Detrended, confound-regressed and standardized time-series of the clustering mask's voxels, as an
+        n_voxels x n_timepoints array.
+        """
+        from pynets.fmri.fmri_utils import bold_voxel_matrix
+        from pynets.fmri.estimation import clean_node_signals
 
-        print("%s%s%s" % (self.clust_type, self.k, " clusters: %.2fs" % (time.time() - start)))
+        voxel_signals = bold_voxel_matrix(self._func_img, np.flatnonzero(mskdat)).T
+        return clean_node_signals(voxel_signals, self.conf, self._detrending, None, None).T
 
-        del self._clust_est
-        self._func_img.uncache()
-        self._clust_mask_corr_img.uncache()
-        gc.collect()
+    def _voxel_connectivity(self, mskdat):
+        """
+        Spatial connectivity constraint between the clustering mask's voxels: the local connectivity matrix of
+        tcorr/scorr, or the voxel grid adjacency otherwise.
+        """
+        from scipy.sparse import issparse, coo_matrix
+        from sklearn.feature_extraction.image import grid_to_graph
+
+        n_voxels = int(np.sum(mskdat))
+        if issparse(self._local_conn):
+            local_conn = coo_matrix(self._local_conn)
+            return coo_matrix((local_conn.data, (local_conn.row, local_conn.col)),
+                              shape=(n_voxels, n_voxels)).tocsr()
+        return grid_to_graph(*mskdat.shape, mask=mskdat)
+
+    def parcellate_k_list(self, k_list, ncut_solver='arpack'):
+        """
+        Parcellate at every number of clusters in k_list in a single run, after `create_clean_mask` and
+        `create_local_clustering`. For ncut, the eigenbasis of the local connectivity LaPlacian is computed once for
+        the largest k and discretised for each k. For ward, complete, average and single linkage, one
+        connectivity-constrained tree is fit to the cleaned voxel time-series, cached, and cut at each k. Other
+        methods are parcellated once per k.
+
+        Parameters
+        ----------
+        k_list : list
+            Numbers of clusters that will be generated.
+        ncut_solver : str
+            Eigensolver used for ncut ('arpack' or 'lobpcg'). Default is 'arpack'.
+
+        Returns
+        -------
+        atlases : list
+            Atlas names, in the order of k_list.
+        uatlases : list
+            File paths to the atlases, in the order of k_list.
+        """
+        import time
+        from pynets.fmri.clustools import parcellate_ncut_k_list, cut_tree
+
+        atlases = []
+        uatlases = []
+        if self.clust_type == 'ncut':
+            if min(k_list) < self.num_conn_comps:
+                raise ValueError('k must minimally be greater than the total number of connected components in '
+                                 'the mask in the case of agglomerative clustering.')
+            start = time.time()
+            n_eigen = max([int(k) for k in list(k_list) + list(self.k_list or [])])
+            out_imgs = parcellate_ncut_k_list(self._local_conn, k_list, self._clust_mask_corr_img, solver=ncut_solver,
+                                              n_eigen=n_eigen,
+                                              eigen_cache=self._ncut_eigen_cache_path(n_eigen, ncut_solver))
+            for k, out_img in zip(k_list, out_imgs):
+                atlases.append(self._set_k(k))
+                out_img.set_data_dtype(np.uint16)
+                nib.save(out_img, self.uatlas)
+                uatlases.append(self.uatlas)
+            print("%s%s%s" % (self.clust_type, list(k_list), " clusters: %.2fs" % (time.time() - start)))
+        elif self.clust_type == 'ward' or self.clust_type == 'complete' or self.clust_type == 'average' or \
+                self.clust_type == 'single':
+            if min(k_list) < self.num_conn_comps:
+                raise ValueError('k must minimally be greater than the total number of connected components in '
+                                 'the mask in the case of agglomerative clustering.')
+            start = time.time()
+            mskdat = np.asarray(self._clust_mask_corr_img.dataobj) > 0
+            children, n_leaves = self._agglomerative_tree(mskdat)
+            for k in k_list:
+                atlases.append(self._set_k(k))
+                labels_data = np.zeros(mskdat.shape, dtype='uint16')
+                labels_data[mskdat] = cut_tree(children, n_leaves, k) + 1
+                nib.save(nib.Nifti1Image(labels_data, self._clust_mask_corr_img.affine), self.uatlas)
+                uatlases.append(self.uatlas)
+            print("%s%s%s" % (self.clust_type, list(k_list), " clusters: %.2fs" % (time.time() - start)))
+        else:
+            for k in k_list:
+                atlases.append(self._set_k(k))
+                uatlases.append(self.parcellate())
+        return atlases, uatlases
+
+
+class GroupParcellate(object):
+    """
+    Class for group-level parcellation. Each subject's BOLD data is streamed through the memory-mapped chunk reader
+    to build its local connectivity graph, and the graphs are averaged incrementally so that only one subject is
+    held in memory at a time. The clustering step then runs once on the group graph (by ncut, or by ward on its
+    spectral embedding), and the resulting atlases can be shared by every subject's extraction.
+    """
+    def __init__(self, func_files, clust_mask, k_list, out_dir, clust_type='ncut', local_corr='tcorr', mask=None,
+                 r_thresh=0.4, cache_dir=None):
+        """
+        Parameters
+        ----------
+        func_files : list
+            File paths to 4D Nifti1Images containing each subject's fMRI data, on a common grid.
+        clust_mask : str
+            File path to a 3D NIFTI file containing a mask, which restricts the
+            voxels used in the clustering.
+        k_list : list
+            Numbers of clusters that will be generated.
+        out_dir : str
+            Directory in which the group atlases are written.
+        clust_type : str
+            Type of clustering to be performed on the group graph ('ncut' or 'ward'). Default is 'ncut'.
+        local_corr : str
+            Type of local connectivity (tcorr or scorr). Default is tcorr.
+        mask : str
+            File path to a 3D NIFTI file containing a mask, which restricts the
+            voxels used in the analysis.
+        r_thresh : float
+            Correlation threshold of the subjects' local connectivity graphs. Default is 0.4.
+        cache_dir : str
+            Directory of the cache of subject local connectivity matrices (see `get_local_conn_cache_path`), which
+            is shared with single-subject clustering. Default is ~/.pynets/cache/local_conn.
+        """
+        self.func_files = list(func_files)
+        self.clust_mask = clust_mask
+        self.k_list = [int(k) for k in k_list]
+        self.out_dir = out_dir
+        self.clust_type = clust_type
+        self.local_corr = local_corr
+        self.mask = mask
+        self.r_thresh = r_thresh
+        self.cache_dir = cache_dir
+        self.uatlases = None
+        self._group_mask_img = None
+        self._group_conn = None
+
+    def create_group_mask(self):
+        """
+        Resample the clustering mask (and brain mask) to the common grid of the subjects' BOLD data.
+        """
+        import os
+        from nilearn.image import resample_img
+        from pynets.fmri.fmri_utils import load_bold
+
+        func_img = load_bold(self.func_files[0])
+        grid_shape = func_img.shape[:3]
+        grid_affine = func_img.affine
+        for func_file in self.func_files[1:]:
+            subj_img = load_bold(func_file)
+            if subj_img.shape[:3] != grid_shape or not np.allclose(subj_img.affine, grid_affine):
+                raise ValueError("%s%s" % ('\nERROR: Group clustering requires all subjects on a common grid: ',
+                                           func_file))
+
+        mskdat = np.asarray(resample_img(nib.load(self.clust_mask), target_affine=grid_affine,
+                                         target_shape=grid_shape, interpolation='nearest').dataobj) > 0.01
+        if self.mask is not None:
+            mskdat &= np.asarray(resample_img(nib.load(self.mask), target_affine=grid_affine,
+                                              target_shape=grid_shape, interpolation='nearest').dataobj) > 0.01
+        self._group_mask_img = nib.Nifti1Image(mskdat.astype('uint16'), grid_affine)
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        nib.save(self._group_mask_img, "%s%s%s%s" % (self.out_dir, '/',
+                                                     os.path.basename(self.clust_mask).split('.nii')[0],
+                                                     '_group.nii.gz'))
+        return self._group_mask_img
+
+    def create_group_local_connectivity(self):
+        """
+        Average the subjects' local connectivity graphs over the group mask, streaming one subject at a time and
+        reusing any subject graph already in the local connectivity cache.
+        """
+        import os
+        import tempfile
+        from scipy.sparse import csr_matrix, load_npz, save_npz
+        from pynets.fmri.fmri_utils import load_bold
+        from pynets.fmri.clustools import get_local_conn_cache_path, make_local_connectivity_tcorr, \
+            make_local_connectivity_scorr
+
+        if self.local_corr == 'tcorr':
+            make_local_connectivity = make_local_connectivity_tcorr
+        elif self.local_corr == 'scorr':
+            make_local_connectivity = make_local_connectivity_scorr
+        else:
+            raise ValueError('Local connectivity type not available')
+
+        n_voxels = int(np.sum(np.asarray(self._group_mask_img.dataobj) > 0))
+        self._group_conn = csr_matrix((n_voxels, n_voxels), dtype=np.float64)
+        for i, func_file in enumerate(self.func_files):
+            print("%s%s%s%s%s" % ('Local connectivity of subject ', i + 1, ' of ', len(self.func_files), '...'))
+            local_conn_path = get_local_conn_cache_path(func_file, self._group_mask_img, self.local_corr,
+                                                        self.r_thresh, self.cache_dir)
+            local_conn = None
+            if os.path.isfile(local_conn_path):
+                try:
+                    local_conn = load_npz(local_conn_path)
+                except (OSError, ValueError):
+                    local_conn = None
+            if local_conn is None:
+                local_conn = make_local_connectivity(load_bold(func_file), self._group_mask_img,
+                                                     thresh=self.r_thresh)
+                try:
+                    os.makedirs(os.path.dirname(local_conn_path), exist_ok=True)
+                    fd, tmp_path = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(local_conn_path))
+                    os.close(fd)
+                    save_npz(tmp_path, local_conn)
+                    os.replace(tmp_path, local_conn_path)
+                except OSError:
+                    print("%s%s" % ('Warning: could not cache local connectivity structure in ',
+                                    os.path.dirname(local_conn_path)))
+
+            # Subject graphs end at their last voxel with variance, so they are padded to the group mask
+            local_conn = local_conn.tocoo()
+            self._group_conn += csr_matrix((local_conn.data, (local_conn.row, local_conn.col)),
+                                           shape=(n_voxels, n_voxels))
+        self._group_conn /= len(self.func_files)
+        save_npz("%s%s%s%s" % (self.out_dir, '/group_', self.local_corr, '_conn.npz'), self._group_conn)
+        return self._group_conn
+
+    def parcellate(self, ncut_solver='arpack', n_eigen=None):
+        """
+        Cluster the group graph at every k in k_list. For ncut, the group graph is partitioned directly from a
+        shared eigenbasis. Group ward is spectral-embedding ward, not the voxel-feature ward of `NiParcellate`:
+        the subjects' time series are not aligned in time, so there are no group voxel features to cluster. Instead,
+        each voxel is represented by its coordinates in the leading `n_eigen` eigenvectors of the group graph's
+        normalized LaPlacian, and a ward tree constrained by the group graph is fit to that embedding and cut at
+        each k.
+
+        Parameters
+        ----------
+        ncut_solver : str
+            Eigensolver used by `ncut`. Default is 'arpack'.
+        n_eigen : int
+            Dimension of the spectral embedding clustered by group ward. Larger values keep more of the graph's
+            structure but cost more to compute. Default is max(k_list).
+
+        Returns
+        -------
+        uatlases : list
+            File paths to the group atlases, in the order of k_list.
+        """
+        import os
+        import time
+        from pynets.fmri.clustools import parcellate_ncut_k_list, ncut, hierarchical_parcellations
+
+        start = time.time()
+        mskdat = np.asarray(self._group_mask_img.dataobj) > 0
+        if self.clust_type == 'ncut':
+            out_imgs = parcellate_ncut_k_list(self._group_conn, self.k_list, self._group_mask_img,
+                                              solver=ncut_solver)
+        elif self.clust_type == 'ward':
+            n_eigen = max(self.k_list) if n_eigen is None else int(n_eigen)
+            [_, embedding] = ncut(self._group_conn, n_eigen, solver=ncut_solver)
+            out_imgs = []
+            for labels in hierarchical_parcellations(embedding, self.k_list, connectivity=self._group_conn,
+                                                     linkage='ward'):
+                labels_data = np.zeros(mskdat.shape, dtype='uint16')
+                labels_data[mskdat] = labels + 1
+                out_imgs.append(nib.Nifti1Image(labels_data, self._group_mask_img.affine))
+        else:
+            raise ValueError("%s%s" % ('\nERROR: Group clustering method not recognized: ', self.clust_type))
+
+        mask_name = os.path.basename(self.clust_mask).split('.nii')[0]
+        self.uatlases = []
+        for k, out_img in zip(self.k_list, out_imgs):
+            uatlas = "%s%s%s%s%s%s%s%s" % (self.out_dir, '/', mask_name, '_clust-', self.clust_type, '_k', k,
+                                           '_group.nii.gz')
+            out_img.set_data_dtype(np.uint16)
+            nib.save(out_img, uatlas)
+            self.uatlases.append(uatlas)
+        print("%s%s%s" % (self.clust_type, self.k_list, " group clusters: %.2fs" % (time.time() - start)))
+        return self.uatlases
 
-        return self.uatlas
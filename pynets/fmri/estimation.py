@@ -12,7 +12,7 @@ warnings.filterwarnings("ignore")
 
 def get_conn_matrix(time_series, conn_model, dir_path, node_size, smooth, dens_thresh, network, ID, roi, min_span_tree,
                     disp_filt, parc, prune, atlas, uatlas, labels, coords, c_boot, norm, binary,
-                    hpass):
+                    hpass, n_jobs=1):
     """
     Computes a functional connectivity matrix based on a node-extracted time-series array.
     Includes a library of routines across Nilearn, scikit-learn, and skggm packages, among others.
@@ -70,6 +70,9 @@ def get_conn_matrix(time_series, conn_model, dir_path, node_size, smooth, dens_t
         unweighted graph.
     hpass : bool
         High-pass filter values (Hz) to apply to node-extracted time-series.
+    n_jobs : int
+        Number of processes used by the shrinkage search that runs if sparse inverse covariance estimation fails.
+        Default is 1.
 
     Returns
     -------
@@ -124,50 +127,87 @@ def get_conn_matrix(time_series, conn_model, dir_path, node_size, smooth, dens_t
     hpass : bool
         High-pass filter values (Hz) to apply to node-extracted time-series.
     """
-    from nilearn.connectome import ConnectivityMeasure
+    from pynets.fmri.estimation import estimate_conn_matrix
+
+    conn_matrix = estimate_conn_matrix(time_series, conn_model, n_jobs=n_jobs)
+
+    coords = np.array(coords)
+    labels = np.array(labels)
+
+    del time_series
+
+    return (conn_matrix, conn_model, dir_path, node_size, smooth, dens_thresh, network, ID, roi, min_span_tree,
+            disp_filt, parc, prune, atlas, uatlas, labels, coords, c_boot, norm, binary, hpass)
+
+
+def estimate_conn_matrix(time_series, conn_model, stats=None, n_jobs=1):
+    """
+    Estimates a single functional connectivity matrix from a node-extracted time-series array.
+
+    Parameters
+    ----------
+    time_series : array
+        2D m x n array consisting of the time-series signal for each ROI node where m = number of scans and
+        n = number of ROI's.
+    conn_model : str
+       Connectivity estimation model (e.g. corr for correlation, cov for covariance, sps for precision covariance,
+       partcorr for partial correlation).
+    stats : dict
+        Cache of the statistics shared between models of the same time-series (see `covariance_stats`, and the
+        graphical lasso fit underlying covariance and precision). Filled in place. Default is None.
+    n_jobs : int
+        Number of processes used by the shrinkage search that runs if sparse inverse covariance estimation fails.
+        Default is 1.
+
+    Returns
+    -------
+    conn_matrix : array
+        Symmetric adjacency matrix stored as an n x n array of nodes and edges.
+    """
+    from nilearn.connectome import cov_to_corr, prec_to_partial
     from sklearn.covariance import GraphicalLassoCV
+    from pynets.fmri.estimation import fit_shrunk_graphical_lasso, covariance_stats, ledoit_wolf_covariance
+
+    if stats is None:
+        stats = {}
 
     conn_matrix = None
-    if conn_model == 'corr' or conn_model == 'cor' or conn_model == 'correlation':
-        # credit: nilearn
-        print('\nComputing correlation matrix...\n')
-        conn_measure = ConnectivityMeasure(kind='correlation')
-        conn_matrix = conn_measure.fit_transform([time_series])[0]
-    elif conn_model == 'partcorr' or conn_model == 'parcorr' or conn_model == 'partialcorrelation':
-        # credit: nilearn
-        print('\nComputing partial correlation matrix...\n')
-        conn_measure = ConnectivityMeasure(kind='partial correlation')
-        conn_matrix = conn_measure.fit_transform([time_series])[0]
+    if conn_model == 'corr' or conn_model == 'cor' or conn_model == 'correlation' or conn_model == 'partcorr' or \
+        conn_model == 'parcorr' or conn_model == 'partialcorrelation':
+        # credit: nilearn. As ConnectivityMeasure estimates them, correlation is derived from the Ledoit-Wolf
+        # covariance of the standardized series, and partial correlation from that of the raw series. Both
+        # covariances are derived from the empirical covariance of the series, computed once.
+        if 'empirical_covariance' not in stats:
+            stats.update(covariance_stats(time_series))
+        if conn_model == 'corr' or conn_model == 'cor' or conn_model == 'correlation':
+            print('\nComputing correlation matrix...\n')
+            scale = np.outer(stats['std'], stats['std'])
+            conn_matrix = cov_to_corr(ledoit_wolf_covariance(stats['empirical_covariance'] / scale,
+                                                             stats['sq_norms_std']))
+        else:
+            print('\nComputing partial correlation matrix...\n')
+            conn_matrix = prec_to_partial(np.linalg.inv(ledoit_wolf_covariance(stats['empirical_covariance'],
+                                                                               stats['sq_norms'])))
     elif conn_model == 'cov' or conn_model == 'covariance' or conn_model == 'covar' or conn_model == 'sps' or \
         conn_model == 'sparse' or conn_model == 'precision':
-        # Fit estimator to matrix to get sparse matrix
-        estimator_shrunk = None
-        estimator = GraphicalLassoCV(cv=5)
-        try:
-            print('\nComputing covariance...\n')
-            estimator.fit(time_series)
-        except:
-            print('Unstable Lasso estimation--Attempting to re-run by first applying shrinkage...')
+        # Fit estimator to matrix to get sparse matrix. One fit serves both covariance and precision models.
+        if 'graphical_lasso' not in stats:
+            estimator_shrunk = None
+            estimator = GraphicalLassoCV(cv=5)
             try:
-                from sklearn.covariance import GraphicalLasso, empirical_covariance, shrunk_covariance
-                emp_cov = empirical_covariance(time_series)
-                for i in np.arange(0.8, 0.99, 0.01):
-                    shrunk_cov = shrunk_covariance(emp_cov, shrinkage=i)
-                    alphaRange = 10.0 ** np.arange(-8, 0)
-                    for alpha in alphaRange:
-                        try:
-                            estimator_shrunk = GraphicalLasso(alpha)
-                            estimator_shrunk.fit(shrunk_cov)
-                            print("Retrying covariance matrix estimate with alpha=%s" % alpha)
-                            if estimator_shrunk is None:
-                                pass
-                            else:
-                                break
-                        except:
-                            print("Covariance estimation failed with shrinkage at alpha=%s" % alpha)
-                            continue
-            except ValueError:
-                print('Unstable Lasso estimation! Shrinkage failed. A different connectivity model may be needed.')
+                print('\nComputing covariance...\n')
+                estimator.fit(time_series)
+            except:
+                print('Unstable Lasso estimation--Attempting to re-run by first applying shrinkage...')
+                estimator = None
+                if 'empirical_covariance' not in stats:
+                    stats.update(covariance_stats(time_series))
+                estimator_shrunk = fit_shrunk_graphical_lasso(stats['empirical_covariance'], n_jobs=n_jobs)
+                if estimator_shrunk is None:
+                    print('Unstable Lasso estimation! Shrinkage failed. A different connectivity model may be '
+                          'needed.')
+            stats['graphical_lasso'] = (estimator, estimator_shrunk)
+        estimator, estimator_shrunk = stats['graphical_lasso']
         if estimator is None and estimator_shrunk is None:
             raise RuntimeError('\nERROR: Covariance estimation failed.')
         if conn_model == 'sps' or conn_model == 'sparse' or conn_model == 'precision':
@@ -257,16 +297,356 @@ def get_conn_matrix(time_series, conn_model, dir_path, node_size, smooth, dens_t
         raise RuntimeError('\nERROR! Matrix estimation selection yielded an empty or 1-dimensional graph. '
                            'Check time-series for errors or try using a different atlas')
 
-    coords = np.array(coords)
-    labels = np.array(labels)
+    return conn_matrix
 
-    del time_series
 
-    return (conn_matrix, conn_model, dir_path, node_size, smooth, dens_thresh, network, ID, roi, min_span_tree,
-            disp_filt, parc, prune, atlas, uatlas, labels, coords, c_boot, norm, binary, hpass)
+def covariance_stats(time_series):
+    """
+    Statistics of a node-extracted time-series shared by its connectivity models: its empirical covariance, the
+    standard deviation of each node, and the squared norm of each centered sample, raw and standardized. These
+    suffice to reproduce the Ledoit-Wolf covariances of both the raw and the standardized series (see
+    `ledoit_wolf_covariance`) without another pass over the samples.
+
+    Parameters
+    ----------
+    time_series : array
+        2D m x n array consisting of the time-series signal for each ROI node where m = number of scans and
+        n = number of ROI's.
+
+    Returns
+    -------
+    stats : dict
+        `empirical_covariance` (n x n, maximum likelihood), `std` (n, with one degree of freedom, as nilearn
+        standardizes signals), and `sq_norms` and `sq_norms_std` (m).
+    """
+    centered = np.asarray(time_series, dtype=np.float64)
+    centered = centered - centered.mean(axis=0)
+    std = centered.std(axis=0, ddof=1)
+    std[std < np.finfo(np.float64).eps] = 1.
+    sq_centered = centered ** 2
+    return {'empirical_covariance': centered.T.dot(centered) / len(centered), 'std': std,
+            'sq_norms': sq_centered.sum(axis=1), 'sq_norms_std': (sq_centered / std ** 2).sum(axis=1)}
+
+
+def ledoit_wolf_covariance(emp_cov, sq_norms):
+    """
+    Ledoit-Wolf shrunk covariance, as sklearn's LedoitWolf estimates it from a series, computed instead from the
+    series' empirical covariance and the squared norm of each of its centered samples.
+
+    Parameters
+    ----------
+    emp_cov : array
+        n x n empirical (maximum likelihood) covariance matrix.
+    sq_norms : array
+        Squared norm of each of the m centered samples.
+
+    Returns
+    -------
+    covariance : array
+        n x n shrunk covariance matrix.
+    """
+    n_samples = len(sq_norms)
+    n_features = len(emp_cov)
+    if n_features == 1:
+        return emp_cov.copy()
+
+    mu = np.trace(emp_cov) / n_features
+    delta_ = np.sum(emp_cov ** 2)
+    beta = (np.sum(sq_norms ** 2) / n_samples - delta_) / (n_features * n_samples)
+    delta = (delta_ - 2. * mu * np.trace(emp_cov) + n_features * mu ** 2) / n_features
+    beta = min(beta, delta)
+    shrinkage = 0. if beta == 0 else beta / delta
+
+    covariance = (1. - shrinkage) * emp_cov
+    covariance.flat[::n_features + 1] += shrinkage * mu
+    return covariance
+
+
+def get_conn_matrices(time_series, conn_model_list, n_jobs=1):
+    """
+    Estimates several functional connectivity matrices from the same node-extracted time-series array, computing
+    their shared sufficient statistics once. Each model is estimated once, and covariance and precision models share
+    one graphical lasso fit.
+
+    Parameters
+    ----------
+    time_series : array
+        2D m x n array consisting of the time-series signal for each ROI node where m = number of scans and
+        n = number of ROI's.
+    conn_model_list : list
+        List of connectivity estimation models (see `get_conn_matrix`).
+    n_jobs : int
+        Number of processes used by the shrinkage search that runs if sparse inverse covariance estimation fails.
+        Default is 1.
+
+    Returns
+    -------
+    conn_matrices : dict
+        Adjacency matrices keyed by connectivity model.
+    """
+    from pynets.fmri.estimation import estimate_conn_matrix
+
+    stats = {}
+    return dict([(conn_model, estimate_conn_matrix(time_series, conn_model, stats=stats, n_jobs=n_jobs)) for
+                 conn_model in conn_model_list])
+
+
+class OnlineConnectivityEstimator(object):
+    """
+    Incremental estimator of correlation, covariance and partial correlation connectomes from a time-series that
+    arrives in chunks of timepoints, so that very long or real-time acquisitions are processed in bounded memory.
+
+    The running mean and co-moment matrix of the nodes are merged chunk by chunk with weighted Welford (Chan et al.)
+    updates, and a connectome can be read at any point. With exponential forgetting, the weight of each timepoint
+    decays by `forgetting` per subsequent timepoint, giving a sliding-window dynamic connectome without re-reading
+    past data.
+
+    Parameters
+    ----------
+    forgetting : float
+        Forgetting factor in (0, 1]. The effective window is about 1 / (1 - forgetting) timepoints. Default is 1
+        (no forgetting), in which case estimates equal those of the concatenated time-series.
+    shrinkage : float
+        Shrinkage in [0, 1] of the covariance toward a scaled identity (as in scikit-learn's shrunk_covariance),
+        which stabilises partial correlation when windows are short. Default is 0.
+
+    References
+    ----------
+    .. [1] Chan, T. F., Golub, G. H., & LeVeque, R. J. (1983). Algorithms for computing the sample variance:
+      Analysis and recommendations. The American Statistician, 37(3), 242-247.
+    """
+    def __init__(self, forgetting=1., shrinkage=0.):
+        if not 0 < float(forgetting) <= 1:
+            raise ValueError("%s%s" % ('\nERROR: Forgetting factor must lie in (0, 1], got ', forgetting))
+        self.forgetting = float(forgetting)
+        self.shrinkage = float(shrinkage)
+        self.n_samples_ = 0
+        self.weight_ = 0.
+        self.mean_ = None
+        self._comoment = None
 
+    def partial_fit(self, time_series):
+        """
+        Update the running statistics with a chunk of timepoints.
+
+        Parameters
+        ----------
+        time_series : array
+            2D m x n array of m new timepoints for each of n ROI nodes.
+
+        Returns
+        -------
+        self : OnlineConnectivityEstimator
+        """
+        X = np.asarray(time_series, dtype='float64')
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        n_timepoints, n_nodes = X.shape
+        if self.mean_ is None:
+            self.mean_ = np.zeros(n_nodes)
+            self._comoment = np.zeros((n_nodes, n_nodes))
+        elif n_nodes != len(self.mean_):
+            raise ValueError("%s%s%s%s" % ('\nERROR: Expected time-series chunks of ', len(self.mean_),
+                                           ' nodes, got ', n_nodes))
+        if n_timepoints == 0:
+            return self
+
+        # Weight of each new timepoint, and decay of everything seen before the chunk
+        weights = self.forgetting ** np.arange(n_timepoints - 1, -1, -1)
+        decay = self.forgetting ** n_timepoints
+
+        chunk_weight = weights.sum()
+        chunk_mean = weights.dot(X) / chunk_weight
+        Xc = X - chunk_mean
+        chunk_comoment = (Xc * weights[:, np.newaxis]).T.dot(Xc)
+
+        prior_weight = self.weight_ * decay
+        self.weight_ = prior_weight + chunk_weight
+        delta = chunk_mean - self.mean_
+        self.mean_ = self.mean_ + delta * (chunk_weight / self.weight_)
+        self._comoment = self._comoment * decay + chunk_comoment + \
+            np.outer(delta, delta) * (prior_weight * chunk_weight / self.weight_)
+        self.n_samples_ += n_timepoints
+        return self
+
+    @property
+    def covariance_(self):
+        """(Weighted, shrunk) empirical covariance of the timepoints seen so far."""
+        if self.n_samples_ < 2:
+            raise ValueError('\nERROR: At least two timepoints are needed to estimate connectivity.')
+        covariance = self._comoment / self.weight_
+        if self.shrinkage > 0:
+            mu = np.trace(covariance) / covariance.shape[0]
+            covariance = (1. - self.shrinkage) * covariance
+            covariance.flat[::covariance.shape[0] + 1] += self.shrinkage * mu
+        return covariance
+
+    def get_conn_matrix(self, conn_model='corr'):
+        """
+        Current connectome of the timepoints seen so far.
+
+        Parameters
+        ----------
+        conn_model : str
+           Connectivity estimation model: corr for correlation, cov for covariance or partcorr for partial
+           correlation. Default is corr.
 
-def timeseries_bootstrap(tseries, block_size):
+        Returns
+        -------
+        conn_matrix : array
+            Symmetric adjacency matrix stored as an n x n array of nodes and edges.
+        """
+        from nilearn.connectome import cov_to_corr, prec_to_partial
+
+        if conn_model == 'corr' or conn_model == 'cor' or conn_model == 'correlation':
+            conn_matrix = cov_to_corr(self.covariance_)
+        elif conn_model == 'cov' or conn_model == 'covariance' or conn_model == 'covar':
+            conn_matrix = self.covariance_
+        elif conn_model == 'partcorr' or conn_model == 'parcorr' or conn_model == 'partialcorrelation':
+            conn_matrix = prec_to_partial(np.linalg.inv(self.covariance_))
+        else:
+            raise ValueError("%s%s" % ('\nERROR: Unsupported online connectivity model: ', conn_model))
+        return (conn_matrix + conn_matrix.T) / 2
+
+
+def iter_dynamic_conn_matrices(time_series_chunks, conn_model='corr', forgetting=0.95, shrinkage=0.):
+    """
+    Emit a dynamic connectome after each chunk of a streamed time-series, using exponential forgetting in place of
+    re-estimating every sliding window from scratch.
+
+    Parameters
+    ----------
+    time_series_chunks : iterable
+        Iterable of 2D m x n arrays of consecutive timepoints for each of n ROI nodes (e.g. the windows' step).
+    conn_model : str
+       Connectivity estimation model (see `OnlineConnectivityEstimator.get_conn_matrix`). Default is corr.
+    forgetting : float
+        Forgetting factor in (0, 1]. Default is 0.95.
+    shrinkage : float
+        Shrinkage of the covariance toward a scaled identity. Default is 0.
+
+    Yields
+    ------
+    conn_matrix : array
+        Connectome after each chunk, once at least two timepoints have been seen.
+    """
+    from pynets.fmri.estimation import OnlineConnectivityEstimator
+
+    estimator = OnlineConnectivityEstimator(forgetting=forgetting, shrinkage=shrinkage)
+    for chunk in time_series_chunks:
+        estimator.partial_fit(chunk)
+        if estimator.n_samples_ >= 2:
+            yield estimator.get_conn_matrix(conn_model)
+
+
+def _graphical_lasso(emp_cov, alpha, cov_init=None):
+    """
+    Fit a graphical lasso to a covariance matrix, warm-started from a previous covariance estimate where
+    scikit-learn's public graphical_lasso still accepts one (it was removed in 1.4, after which each fit starts cold).
+    """
+    from sklearn.covariance import graphical_lasso
+    if cov_init is not None:
+        try:
+            return graphical_lasso(emp_cov, alpha, cov_init=cov_init)[:2]
+        except TypeError:
+            pass
+    return graphical_lasso(emp_cov, alpha)[:2]
+
+
+def _shrunk_graphical_lasso_path(emp_cov, shrinkage, alphas):
+    """
+    Fit graphical lassos to a shrunk covariance matrix from the largest to the smallest alpha, warm-starting each fit
+    from the previous one where `_graphical_lasso` supports it, and return (covariance, precision, alpha) of the
+    smallest alpha reached before the first unstable fit, or None if even the largest alpha fails.
+    """
+    import warnings
+    from sklearn.covariance import shrunk_covariance
+
+    shrunk_cov = shrunk_covariance(emp_cov, shrinkage=shrinkage)
+    stable = None
+    cov_init = None
+    for alpha in sorted(alphas, reverse=True):
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                covariance, precision = _graphical_lasso(shrunk_cov, alpha, cov_init=cov_init)
+        except (FloatingPointError, ValueError, np.linalg.LinAlgError):
+            break
+        if not (np.all(np.isfinite(covariance)) and np.all(np.isfinite(precision))):
+            break
+        stable = (covariance, precision, alpha)
+        cov_init = covariance
+    return stable
+
+
+class ShrunkGraphicalLasso(object):
+    """
+    Result of `fit_shrunk_graphical_lasso`, exposing `covariance_` and `precision_` like a fitted scikit-learn
+    covariance estimator.
+    """
+    def __init__(self, covariance, precision, shrinkage, alpha):
+        self.covariance_ = covariance
+        self.precision_ = precision
+        self.shrinkage = shrinkage
+        self.alpha = alpha
+
+
+def fit_shrunk_graphical_lasso(emp_cov, shrinkages=None, alphas=None, n_jobs=1):
+    """
+    Search a grid of shrinkage levels and graphical lasso penalties for a stable sparse inverse covariance estimate,
+    for time-series whose cross-validated graphical lasso fails.
+
+    Shrinkage levels are tried from the lowest, each along a warm-started path of decreasing alphas (see
+    `_shrunk_graphical_lasso_path`). The first level yielding any stable fit is returned; with `n_jobs` > 1, levels
+    are evaluated in a process pool and pending levels are cancelled once that level is known.
+
+    Parameters
+    ----------
+    emp_cov : array
+        N x N empirical covariance matrix.
+    shrinkages : list
+        Shrinkage levels. Default is 0.80 to 0.98 in steps of 0.01.
+    alphas : list
+        Graphical lasso penalties. Default is 1e-8 to 1e-1 in powers of ten.
+    n_jobs : int
+        Number of worker processes. Default is 1.
+
+    Returns
+    -------
+    estimator : ShrunkGraphicalLasso
+        The selected estimate, or None if every shrinkage level failed.
+    """
+    from pynets.fmri.estimation import _shrunk_graphical_lasso_path, ShrunkGraphicalLasso
+
+    if shrinkages is None:
+        shrinkages = np.arange(0.8, 0.99, 0.01)
+    if alphas is None:
+        alphas = 10.0 ** np.arange(-8, 0)
+
+    if n_jobs is None or int(n_jobs) <= 1:
+        for shrinkage in shrinkages:
+            stable = _shrunk_graphical_lasso_path(emp_cov, shrinkage, alphas)
+            if stable is not None:
+                print("%s%s%s%s" % ('Shrunk covariance estimate found with shrinkage=', np.round(shrinkage, 2),
+                                    ' and alpha=', stable[2]))
+                return ShrunkGraphicalLasso(stable[0], stable[1], shrinkage, stable[2])
+        return None
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=int(n_jobs)) as pool:
+        futures = [pool.submit(_shrunk_graphical_lasso_path, emp_cov, shrinkage, alphas) for shrinkage in shrinkages]
+        for shrinkage, future in zip(shrinkages, futures):
+            stable = future.result()
+            if stable is not None:
+                for pending in futures:
+                    pending.cancel()
+                print("%s%s%s%s" % ('Shrunk covariance estimate found with shrinkage=', np.round(shrinkage, 2),
+                                    ' and alpha=', stable[2]))
+                return ShrunkGraphicalLasso(stable[0], stable[1], shrinkage, stable[2])
+    return None
+
+
+def timeseries_bootstrap(tseries, block_size, random_state=42):
     """
     Generates a bootstrap sample derived from the input time-series.
     Utilizes Circular-block-bootstrap method described in [1]_.
@@ -277,11 +657,15 @@ def timeseries_bootstrap(tseries, block_size):
         A matrix of shapes (`M`, `N`) with `M` timepoints and `N` variables
     block_size : integer
         Size of the bootstrapped blocks
+    random_state : int or RandomState
+        Seed or random number generator used to draw the block offsets. Default is 42.
 
     Returns
     -------
     bseries : array_like
         Bootstrap sample of the input timeseries
+    block_mask : array_like
+        Time-point indices of the bootstrap sample
 
     References
     ----------
@@ -290,35 +674,254 @@ def timeseries_bootstrap(tseries, block_size):
        special issue on Statistical Challenges and Advances in Brain Science,
        2008, 18: 1253-1268.
     """
-    np.random.seed(int(42))
+    if isinstance(random_state, np.random.RandomState):
+        rng = random_state
+    else:
+        rng = np.random.RandomState(random_state)
 
     # calculate number of blocks
     k = int(np.ceil(float(tseries.shape[0]) / block_size))
 
     # generate random indices of blocks
-    r_ind = np.floor(np.random.rand(1, k) * tseries.shape[0])
+    r_ind = np.floor(rng.rand(1, k) * tseries.shape[0])
     blocks = np.dot(np.arange(0, block_size)[:, np.newaxis], np.ones([1, k]))
 
     block_offsets = np.dot(np.ones([block_size, 1]), r_ind)
     block_mask = (blocks + block_offsets).flatten('F')[:tseries.shape[0]]
-    block_mask = np.mod(block_mask, tseries.shape[0])
+    block_mask = np.mod(block_mask, tseries.shape[0]).astype('int64')
+
+    return tseries[block_mask, :], block_mask
+
+
+def bootstrap_block_indices(n_timepoints, block_size, n_boot, random_state=42):
+    """
+    Draw the time-point indices of many circular-block bootstrap replicates at once, each from its own independent
+    random stream.
+
+    Parameters
+    ----------
+    n_timepoints : int
+        Number of time-points in the series.
+    block_size : int
+        Size of the bootstrapped blocks.
+    n_boot : int
+        Number of bootstrap replicates.
+    random_state : int
+        Seed from which the independent per-replicate streams are spawned. Default is 42.
+
+    Returns
+    -------
+    block_masks : array
+        n_boot x n_timepoints array of time-point indices.
+    """
+    block_size = int(block_size)
+    k = int(np.ceil(float(n_timepoints) / block_size))
+    streams = np.random.SeedSequence(random_state).spawn(int(n_boot))
+    offsets = np.stack([np.random.default_rng(stream).integers(0, n_timepoints, k) for stream in streams])
+    block_masks = (offsets[:, :, np.newaxis] + np.arange(block_size)).reshape(int(n_boot), -1)[:, :n_timepoints]
+    return np.mod(block_masks, n_timepoints)
+
+
+def bootstrap_connectome_ensemble(tseries, block_size, n_boot, kind='correlation', ci=0.95, random_state=42,
+                                  batch_size=None, chunk_mb=256):
+    """
+    Estimate the distribution of a correlation or covariance connectome over circular-block bootstrap replicates of
+    a time-series, without materialising the resampled series.
+
+    Parameters
+    ----------
+    tseries : array_like
+        A matrix of shapes (`M`, `N`) with `M` timepoints and `N` variables.
+    block_size : int
+        Size of the bootstrapped blocks.
+    n_boot : int
+        Number of bootstrap replicates.
+    kind : str
+        'correlation' or 'covariance'. Default is 'correlation'.
+    ci : float
+        Coverage of the per-edge percentile confidence intervals. Default is 0.95.
+    random_state : int
+        Seed from which the independent per-replicate streams are spawned. Default is 42.
+    batch_size : int
+        Number of replicates whose connectomes are computed together in one einsum. Default is derived from
+        `chunk_mb`.
+    chunk_mb : int
+        Memory budget per batch in megabytes, covering the resampled series and the N x N connectome of each
+        replicate in the batch along with its upper triangle. Default is 256. The per-edge samples kept for the
+        percentile intervals (n_boot x N(N+1)/2 float32 values) are not part of the budget.
+
+    Returns
+    -------
+    conn_mean : array
+        N x N mean connectome over replicates.
+    conn_var : array
+        N x N per-edge variance over replicates.
+    conn_ci_lower : array
+        N x N lower percentile bound of each edge.
+    conn_ci_upper : array
+        N x N upper percentile bound of each edge.
+    """
+    from pynets.fmri.estimation import bootstrap_block_indices
+
+    if kind not in ['correlation', 'covariance']:
+        raise ValueError("%s%s" % ('\nERROR: Unsupported bootstrap connectome kind: ', kind))
 
-    return tseries[block_mask.astype('uint8'), :], block_mask.astype('uint8')
+    tseries = np.asarray(tseries, dtype='float64')
+    n_timepoints, n_nodes = tseries.shape
 
+    # Standardize once so that each replicate only needs re-centering
+    scale = tseries.std(axis=0)
+    scale[scale == 0] = 1
+    z = (tseries - tseries.mean(axis=0)) / scale
 
-def fill_confound_nans(confounds, dir_path):
+    n_boot = int(n_boot)
+    block_masks = bootstrap_block_indices(n_timepoints, block_size, n_boot, random_state)
+    triu = np.triu_indices(n_nodes)
+    if batch_size is None:
+        batch_size = max(1, int((chunk_mb * 1048576) // ((n_timepoints * n_nodes + n_nodes ** 2 + len(triu[0])) * 8)))
+
+    edges = np.empty((n_boot, len(triu[0])), dtype='float32')
+    edge_sum = np.zeros(len(triu[0]))
+    edge_sq_sum = np.zeros(len(triu[0]))
+    for b0 in range(0, n_boot, batch_size):
+        zb = z[block_masks[b0:b0 + batch_size]]
+        zb -= zb.mean(axis=1, keepdims=True)
+        conn = np.einsum('btn,btm->bnm', zb, zb, optimize=True) / (n_timepoints - 1)
+        if kind == 'correlation':
+            d = np.sqrt(np.einsum('bnn->bn', conn))
+            d[d == 0] = 1
+            conn /= d[:, :, np.newaxis] * d[:, np.newaxis, :]
+        else:
+            conn *= scale[:, np.newaxis] * scale[np.newaxis, :]
+        conn = conn[:, triu[0], triu[1]]
+        edge_sum += conn.sum(axis=0)
+        edge_sq_sum += np.einsum('be,be->e', conn, conn)
+        edges[b0:b0 + batch_size] = conn
+
+    def _to_matrix(values):
+        mat = np.zeros((n_nodes, n_nodes))
+        mat[triu] = values
+        return mat + np.triu(mat, 1).T
+
+    edge_mean = edge_sum / n_boot
+    edge_var = np.maximum(edge_sq_sum - n_boot * edge_mean ** 2, 0) / max(n_boot - 1, 1)
+    alpha = (1. - ci) / 2.
+    lower, upper = np.percentile(edges, [100. * alpha, 100. * (1. - alpha)], axis=0)
+    return _to_matrix(edge_mean), _to_matrix(edge_var), _to_matrix(lower), _to_matrix(upper)
+
+
+def fill_confound_nans(confounds):
     """Fill the NaN values of a confounds dataframe with mean values"""
-    import uuid
-    import os
-    from time import strftime
-    run_uuid = '%s_%s' % (strftime('%Y%m%d_%H%M%S'), uuid.uuid4())
     print('Warning: NaN\'s detected in confound regressor file. Filling these with mean values, but the '
           'regressor file should be checked manually.')
-    confounds_nonan = confounds.apply(lambda x: x.fillna(x.mean()), axis=0)
-    os.makedirs("%s%s" % (dir_path, '/confounds_tmp'), exist_ok=True)
-    conf_corr = "%s%s%s%s" % (dir_path, '/confounds_tmp/confounds_mean_corrected_', run_uuid, '.tsv')
-    confounds_nonan.to_csv(conf_corr, sep='\t')
-    return conf_corr
+    return confounds.apply(lambda x: x.fillna(x.mean()), axis=0)
+
+
+_confounds_cache = {}
+
+
+def load_confounds(conf):
+    """
+    Load a confound regressor file as a NaN-free matrix, once per file and process.
+
+    Parameters
+    ----------
+    conf : str
+        File path to a confound regressor .tsv file with a header row.
+
+    Returns
+    -------
+    confounds : array
+        Read-only m x k float64 array of m scans and k regressors, with NaN's replaced by column means.
+    """
+    import os
+    import pandas as pd
+    from pynets.core.utils import file_fingerprint
+    from pynets.fmri.estimation import fill_confound_nans
+
+    key = (os.path.realpath(conf), file_fingerprint(conf))
+    if key not in _confounds_cache:
+        confounds = pd.read_csv(conf, sep='\t')
+        if confounds.isnull().values.any():
+            confounds = fill_confound_nans(confounds)
+        confounds = np.asarray(confounds.values, dtype='float64')
+        confounds.setflags(write=False)
+        _confounds_cache[key] = confounds
+    return _confounds_cache[key]
+
+
+def get_confound_projector(conf, detrend, high_pass, t_r):
+    """
+    Orthonormal basis of the confound regressors of a run, after the same detrending and high-pass filtering that is
+    applied to the signals they are regressed from, and centering. Bases are cached per file and cleaning parameters.
+
+    Parameters
+    ----------
+    conf : str
+        File path to a confound regressor .tsv file with a header row.
+    detrend : bool
+        Whether signals are linearly detrended.
+    high_pass : float
+        High-pass filter cutoff (Hz), or None.
+    t_r : float
+        Repetition time (s), or None.
+
+    Returns
+    -------
+    Q : array
+        m x r array whose orthonormal columns span the r linearly independent cleaned regressors.
+    """
+    import os
+    from nilearn.signal import clean
+    from pynets.core.utils import file_fingerprint
+    from pynets.fmri.estimation import load_confounds
+
+    key = (os.path.realpath(conf), file_fingerprint(conf), bool(detrend), high_pass, t_r)
+    if key not in _confounds_cache:
+        confounds = clean(np.array(load_confounds(conf)), detrend=detrend, standardize=False, t_r=t_r,
+                          high_pass=high_pass)
+        confounds -= confounds.mean(axis=0)
+        U, S, _ = np.linalg.svd(confounds, full_matrices=False)
+        Q = U[:, S > S.max() * max(confounds.shape) * np.finfo('float64').eps] if S.size and S.max() > 0 else \
+            U[:, :0]
+        Q.setflags(write=False)
+        _confounds_cache[key] = Q
+    return _confounds_cache[key]
+
+
+def clean_node_signals(node_signals, conf, detrend, high_pass, t_r):
+    """
+    Detrend or high-pass filter, regress confounds from, and standardize node time-series, as NiftiLabelsMasker and
+    NiftiSpheresMasker would, reusing the cached confound basis of the run.
+
+    Parameters
+    ----------
+    node_signals : array
+        2D m x n array of m scans and n nodes.
+    conf : str
+        File path to a confound regressor .tsv file with a header row, or None.
+    detrend : bool
+        Whether to linearly detrend the signals.
+    high_pass : float
+        High-pass filter cutoff (Hz), or None.
+    t_r : float
+        Repetition time (s), or None.
+
+    Returns
+    -------
+    ts_within_nodes : array
+        2D m x n array of cleaned, standardized node time-series.
+    """
+    from nilearn.signal import clean
+    from pynets.fmri.estimation import get_confound_projector
+
+    if conf is None:
+        return clean(node_signals, detrend=detrend, standardize=True, t_r=t_r, high_pass=high_pass)
+
+    node_signals = clean(node_signals, detrend=detrend, standardize=False, t_r=t_r, high_pass=high_pass)
+    Q = get_confound_projector(conf, detrend, high_pass, t_r)
+    node_signals -= Q.dot(Q.T.dot(node_signals))
+    return clean(node_signals, detrend=False, standardize=True)
 
 
 class TimeseriesExtraction(object):
@@ -326,7 +929,7 @@ class TimeseriesExtraction(object):
     Class for implementing various time-series extracting routines.
     """
     def __init__(self, net_parcels_nii_path, node_size, conf, func_file, coords, roi, dir_path, ID, network, smooth,
-                 atlas, uatlas, labels, c_boot, block_size, hpass, mask):
+                 atlas, uatlas, labels, c_boot, block_size, hpass, mask, cache_dir=None):
         self.net_parcels_nii_path = net_parcels_nii_path
         self.node_size = node_size
         self.conf = conf
@@ -344,6 +947,7 @@ class TimeseriesExtraction(object):
         self.block_size = block_size
         self.mask = mask
         self.hpass = hpass
+        self.cache_dir = cache_dir
         self.ts_within_nodes = None
         self._mask_img = None
         self._mask_path = None
@@ -352,14 +956,15 @@ class TimeseriesExtraction(object):
         self._detrending = True
         self._net_parcels_nii_temp_path = None
         self._net_parcels_map_nifti = None
-        self._spheres_masker = None
-        self._parcel_masker = None
+        self._spheres_operator = None
+        self._parcel_operator = None
 
     def prepare_inputs(self):
         """Helper function to creating temporary nii's and prepare inputs from time-series extraction"""
         import os.path as op
         import nibabel as nib
         from nilearn.image import math_img
+        from pynets.fmri.fmri_utils import load_bold
         if not op.isfile(self.func_file):
             raise ValueError('\nERROR: Functional data input not found! Check that the file(s) specified with the -i '
                              'flag exist(s)')
@@ -369,7 +974,7 @@ class TimeseriesExtraction(object):
                 raise ValueError('\nERROR: Confound regressor file not found! Check that the file(s) specified with '
                                  'the -conf flag exist(s)')
 
-        self._func_img = nib.load(self.func_file)
+        self._func_img = load_bold(self.func_file)
         self._func_img.set_data_dtype(np.float32)
         hdr = self._func_img.header
 
@@ -410,30 +1015,23 @@ class TimeseriesExtraction(object):
 
     def extract_ts_coords(self):
         """
-        API for employing Nilearn's NiftiSpheresMasker to extract fMRI time-series data from spherical ROI's based on a
-        given list of seed coordinates. The resulting time-series can then optionally be resampled using circular-block
-        bootrapping. The final 2D m x n array is ultimately saved to file in .npy format.
+        API for extracting fMRI time-series data from spherical ROI's based on a given list of seed coordinates. Sphere
+        membership is applied as a cached sparse averaging operator (see `get_spheres_operator`), with the same
+        smoothing and cleaning as Nilearn's NiftiSpheresMasker. The resulting time-series can then optionally be
+        resampled using circular-block bootrapping. The final 2D m x n array is ultimately saved to file in .npy format.
         """
-        from nilearn import input_data
-        from pynets.fmri.estimation import fill_confound_nans
+        from pynets.fmri.estimation import clean_node_signals, get_spheres_operator
+        from pynets.fmri.fmri_utils import bold_operator_signals
 
         print("%s%s%s" % ('Using node radius: ', self.node_size, ' mm'))
-        self._spheres_masker = input_data.NiftiSpheresMasker(seeds=self.coords, radius=float(self.node_size),
-                                                             allow_overlap=True, standardize=True,
-                                                             smoothing_fwhm=float(self.smooth),
-                                                             high_pass=self.hpass, detrend=self._detrending,
-                                                             t_r=self._t_r, verbose=2, dtype='auto',
-                                                             mask_img=self._mask_img)
-        if self.conf is not None:
-            import pandas as pd
-            confounds = pd.read_csv(self.conf, sep='\t')
-            if confounds.isnull().values.any():
-                conf_corr = fill_confound_nans(confounds, self.dir_path)
-                self.ts_within_nodes = self._spheres_masker.fit_transform(self._func_img, confounds=conf_corr)
-            else:
-                self.ts_within_nodes = self._spheres_masker.fit_transform(self._func_img, confounds=self.conf)
-        else:
-            self.ts_within_nodes = self._spheres_masker.fit_transform(self._func_img)
+        self._spheres_operator = get_spheres_operator(self.coords, float(self.node_size), self._func_img,
+                                                      self._mask_img, self.cache_dir)
+        voxels = np.flatnonzero(np.diff(self._spheres_operator.tocsc().indptr))
+
+        node_signals = bold_operator_signals(self._func_img, self._spheres_operator[:, voxels], voxels,
+                                             self.smooth).T
+
+        self.ts_within_nodes = clean_node_signals(node_signals, self.conf, self._detrending, self.hpass, self._t_r)
 
         self._func_img.uncache()
 
@@ -447,31 +1045,24 @@ class TimeseriesExtraction(object):
 
     def extract_ts_parc(self):
         """
-        API for employing Nilearn's NiftiLabelsMasker to extract fMRI time-series data from spherical ROI's based on a
-        given 3D atlas image of integer-based voxel intensities. The resulting time-series can then optionally be
-        resampled using circular-block bootrapping. The final 2D m x n array is ultimately saved to file in .npy format.
+        API for extracting fMRI time-series data from parcel ROI's based on a given 3D atlas image of integer-based
+        voxel intensities. Parcel membership is applied as a sparse averaging operator (see `labels_operator`), with
+        the same smoothing and cleaning as Nilearn's NiftiLabelsMasker. The resulting time-series can then optionally
+        be resampled using circular-block bootrapping. The final 2D m x n array is ultimately saved to file in .npy
+        format.
         """
         import nibabel as nib
-        from nilearn import input_data
-        from pynets.fmri.estimation import fill_confound_nans
+        from pynets.fmri.estimation import clean_node_signals, labels_operator
+        from pynets.fmri.fmri_utils import bold_operator_signals
 
         self._net_parcels_map_nifti = nib.load(self.net_parcels_nii_path)
         self._net_parcels_map_nifti.set_data_dtype(np.uint8)
-        self._parcel_masker = input_data.NiftiLabelsMasker(labels_img=self._net_parcels_map_nifti, background_label=0,
-                                                           standardize=True, smoothing_fwhm=float(self.smooth),
-                                                           high_pass=self.hpass, detrend=self._detrending,
-                                                           t_r=self._t_r, verbose=2, resampling_target='data',
-                                                           dtype='auto', mask_img=self._mask_img)
-        if self.conf is not None:
-            import pandas as pd
-            confounds = pd.read_csv(self.conf, sep='\t')
-            if confounds.isnull().values.any():
-                conf_corr = fill_confound_nans(confounds, self.dir_path)
-                self.ts_within_nodes = self._parcel_masker.fit_transform(self._func_img, confounds=conf_corr)
-            else:
-                self.ts_within_nodes = self._parcel_masker.fit_transform(self._func_img, confounds=self.conf)
-        else:
-            self.ts_within_nodes = self._parcel_masker.fit_transform(self._func_img)
+        self._parcel_operator = labels_operator(self._net_parcels_map_nifti, self._func_img, self._mask_img)[0]
+        voxels = np.flatnonzero(np.diff(self._parcel_operator.tocsc().indptr))
+
+        node_signals = bold_operator_signals(self._func_img, self._parcel_operator[:, voxels], voxels,
+                                             self.smooth).T
+        self.ts_within_nodes = clean_node_signals(node_signals, self.conf, self._detrending, self.hpass, self._t_r)
 
         self._func_img.uncache()
 
@@ -500,11 +1091,334 @@ class TimeseriesExtraction(object):
         if self._mask_path is not None:
             self._mask_img.uncache()
 
-        if self._spheres_masker is not None:
-            del self._spheres_masker
+        if self._spheres_operator is not None:
+            self._spheres_operator = None
 
-        if self._parcel_masker is not None:
-            del self._parcel_masker
+        if self._parcel_operator is not None:
+            self._parcel_operator = None
             self._net_parcels_map_nifti.uncache()
         gc.collect()
         return
+
+
+def labels_operator(labels_img, func_img, mask_img=None, background_label=0):
+    """
+    Build a sparse operator that averages voxel signals within each region of a labels atlas.
+
+    Parameters
+    ----------
+    labels_img : Nifti1Image
+        3D atlas image of integer-based voxel intensities.
+    func_img : Nifti1Image
+        4D fMRI image whose grid the operator is defined on. The atlas is resampled to it with nearest-neighbour
+        interpolation, as in NiftiLabelsMasker with `resampling_target='data'`.
+    mask_img : Nifti1Image
+        Binary brain mask. Atlas voxels outside the mask are treated as background. Default is None.
+    background_label : int
+        Atlas value denoting an absence of region. Default is 0.
+
+    Returns
+    -------
+    operator : csr_matrix
+        n_regions x n_voxels averaging operator over the C-ordered voxels of the fMRI grid. As in NiftiLabelsMasker,
+        regions lying entirely outside the mask are dropped.
+    labels : array
+        Atlas value of each row of the operator.
+    """
+    from scipy.sparse import csr_matrix
+    from nilearn.image import resample_to_img
+
+    labels_img = resample_to_img(labels_img, func_img, interpolation='nearest')
+    labels_data = np.asarray(labels_img.dataobj).ravel()
+
+    if mask_img is not None:
+        mask_img = resample_to_img(mask_img, func_img, interpolation='nearest')
+        labels_data = np.where(np.asarray(mask_img.dataobj).ravel() > 0, labels_data, background_label)
+
+    # Regions without any voxel in the mask are dropped
+    labels = np.unique(labels_data)
+    labels = labels[labels != background_label]
+
+    voxels = np.flatnonzero(np.isin(labels_data, labels))
+    rows = np.searchsorted(labels, labels_data[voxels])
+    counts = np.bincount(rows, minlength=len(labels)).astype('float64')
+    operator = csr_matrix((1. / counts[rows], (rows, voxels)), shape=(len(labels), labels_data.size),
+                          dtype='float64')
+    return operator, labels
+
+
+def spheres_operator(coords, radius, func_img, mask_img=None):
+    """
+    Build a sparse operator that averages voxel signals within spheres centered on a list of seed coordinates.
+
+    Parameters
+    ----------
+    coords : list
+        List of (x, y, z) tuples in mm corresponding to the seed coordinates.
+    radius : float
+        Sphere radius in mm.
+    func_img : Nifti1Image
+        4D fMRI image whose grid the operator is defined on.
+    mask_img : Nifti1Image
+        Binary brain mask restricting the voxels of each sphere. Default is None.
+
+    Returns
+    -------
+    operator : csr_matrix
+        n_coords x n_voxels averaging operator over the C-ordered voxels of the fMRI grid. As in
+        NiftiSpheresMasker, each sphere also includes the in-mask voxel nearest to its seed.
+    """
+    from scipy.sparse import csr_matrix
+    from sklearn.neighbors import NearestNeighbors
+    from nilearn.image import resample_to_img
+    from nibabel.affines import apply_affine
+
+    shape = func_img.shape[:3]
+    if mask_img is not None:
+        mask_img = resample_to_img(mask_img, func_img, interpolation='nearest')
+        mask_voxels = np.flatnonzero(np.asarray(mask_img.dataobj).ravel() > 0)
+    else:
+        mask_voxels = np.arange(np.prod(shape))
+
+    seeds = np.asarray(coords, dtype='float64').reshape(-1, 3)
+    ijk = np.column_stack(np.unravel_index(mask_voxels, shape))
+    neighbors = NearestNeighbors(radius=float(radius)).fit(apply_affine(func_img.affine, ijk))
+    A = neighbors.radius_neighbors_graph(seeds).tolil()
+
+    nearests = np.round(apply_affine(np.linalg.inv(func_img.affine), seeds)).astype(int)
+    in_grid = np.all((nearests >= 0) & (nearests < np.array(shape)), axis=1)
+    nearest_voxels = np.full(len(seeds), -1)
+    nearest_voxels[in_grid] = np.ravel_multi_index(nearests[in_grid].T, shape)
+    columns = np.searchsorted(mask_voxels, nearest_voxels)
+    for i in np.flatnonzero(in_grid):
+        if columns[i] < len(mask_voxels) and mask_voxels[columns[i]] == nearest_voxels[i]:
+            A[i, columns[i]] = 1
+
+    A = A.tocsr()
+    A.data[:] = 1
+    if np.any(np.diff(A.indptr) == 0):
+        raise ValueError("%s%s" % ('\nERROR: These spheres are empty: ',
+                                   np.flatnonzero(np.diff(A.indptr) == 0).tolist()))
+    counts = np.diff(A.indptr).astype('float64')
+    rows = np.repeat(np.arange(len(seeds)), np.diff(A.indptr))
+    operator = csr_matrix((1. / counts[rows], (rows, mask_voxels[A.indices])),
+                          shape=(len(seeds), int(np.prod(shape))), dtype='float64')
+    return operator
+
+
+def get_spheres_operator(coords, radius, func_img, mask_img=None, cache_dir=None):
+    """
+    Fetch the sphere-averaging operator of `spheres_operator` from a disk cache, building and caching it on a miss.
+
+    Parameters
+    ----------
+    coords : list
+        List of (x, y, z) tuples in mm corresponding to the seed coordinates.
+    radius : float
+        Sphere radius in mm.
+    func_img : Nifti1Image
+        4D fMRI image whose grid the operator is defined on.
+    mask_img : Nifti1Image
+        Binary brain mask restricting the voxels of each sphere. Default is None.
+    cache_dir : str
+        Directory of cached operators. Operators are keyed by the coordinates, radius, grid shape, affine and mask,
+        so subjects sharing a template space share them. Default is ~/.pynets/cache/spheres. If the directory cannot
+        be written to, the operator is built without caching.
+
+    Returns
+    -------
+    operator : csr_matrix
+        n_coords x n_voxels averaging operator over the C-ordered voxels of the fMRI grid.
+    """
+    import os
+    import hashlib
+    import tempfile
+    from scipy.sparse import load_npz, save_npz
+    from nilearn.image import resample_to_img
+    from pynets.fmri.estimation import spheres_operator
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.pynets', 'cache', 'spheres')
+
+    key = hashlib.sha256()
+    key.update(np.asarray(coords, dtype='float64').reshape(-1, 3).tobytes())
+    key.update(np.float64(radius).tobytes())
+    key.update(np.asarray(func_img.shape[:3], dtype='int64').tobytes())
+    key.update(np.asarray(func_img.affine, dtype='float64').tobytes())
+    if mask_img is not None:
+        mask_img = resample_to_img(mask_img, func_img, interpolation='nearest')
+        key.update(np.packbits(np.asarray(mask_img.dataobj).ravel() > 0).tobytes())
+    op_path = "%s%s%s%s" % (cache_dir, '/spheres_', key.hexdigest(), '.npz')
+
+    if os.path.isfile(op_path):
+        try:
+            return load_npz(op_path).tocsr()
+        except (OSError, ValueError):
+            pass
+
+    operator = spheres_operator(coords, radius, func_img, mask_img)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix='.npz', dir=cache_dir)
+        os.close(fd)
+        save_npz(tmp_path, operator)
+        os.replace(tmp_path, op_path)
+    except OSError:
+        print("%s%s" % ('Warning: could not cache sphere operator in ', cache_dir))
+    return operator
+
+
+class MultiTimeseriesExtraction(object):
+    """
+    Class for extracting time-series for many parcellations, node sizes, smoothing and high-pass values in a single
+    pass over the fMRI data.
+
+    The 4D image is loaded once, and every parcellation or set of spheres is applied as a precomputed sparse
+    averaging operator to each chunk of volumes of the union of their supports. Node signals are then cleaned
+    once per combination of smoothing and high-pass values, so that the cost of extraction scales with the number of
+    distinct smoothing values rather than with the size of the full extraction grid. Cleaning acts on each node
+    signal independently, so results match those of `TimeseriesExtraction`.
+    """
+    def __init__(self, func_file, conf, dir_path, ID, network, roi, smooth_list, hpass_list, mask, c_boot=0,
+                 block_size=None, cache_dir=None):
+        self.func_file = func_file
+        self.conf = conf
+        self.dir_path = dir_path
+        self.ID = ID
+        self.network = network
+        self.roi = roi
+        self.smooth_list = smooth_list if isinstance(smooth_list, list) else [smooth_list]
+        self.hpass_list = hpass_list if isinstance(hpass_list, list) else [hpass_list]
+        self.mask = mask
+        self.c_boot = c_boot
+        self.block_size = block_size
+        self.cache_dir = cache_dir
+        self.targets = []
+        self.ts_within_nodes = {}
+        self._func_img = None
+        self._mask_img = None
+        self._t_r = None
+        self._operator = None
+        self._voxels = None
+        self._splits = None
+
+    def add_parcellation(self, net_parcels_nii_path, dir_path=None):
+        """Add a labels atlas to extract parcel time-series from. Returns the index of the new target. Once inputs are
+        prepared, the atlas values of the regions extracted (those with voxels in the mask) are stored in the
+        target's 'labels'."""
+        self.targets.append({'net_parcels_nii_path': net_parcels_nii_path, 'coords': None, 'node_size': 'parc',
+                             'labels': None, 'dir_path': dir_path if dir_path is not None else self.dir_path})
+        return len(self.targets) - 1
+
+    def add_spheres(self, coords, node_size, dir_path=None):
+        """Add a set of seed coordinates and sphere radius to extract time-series from. Returns the index of the new
+        target."""
+        self.targets.append({'net_parcels_nii_path': None, 'coords': coords, 'node_size': node_size,
+                             'dir_path': dir_path if dir_path is not None else self.dir_path})
+        return len(self.targets) - 1
+
+    def prepare_inputs(self):
+        """Load the fMRI data, mask and confounds once and build the stacked averaging operator of all targets"""
+        import os.path as op
+        import nibabel as nib
+        from scipy.sparse import vstack
+        from nilearn.image import math_img
+        from pynets.fmri.estimation import labels_operator, get_spheres_operator, load_confounds
+        from pynets.fmri.fmri_utils import load_bold
+
+        if not op.isfile(self.func_file):
+            raise ValueError('\nERROR: Functional data input not found! Check that the file(s) specified with the -i '
+                             'flag exist(s)')
+
+        if self.conf:
+            if not op.isfile(self.conf):
+                raise ValueError('\nERROR: Confound regressor file not found! Check that the file(s) specified with '
+                                 'the -conf flag exist(s)')
+            load_confounds(self.conf)
+
+        if len(self.targets) == 0:
+            raise ValueError('\nERROR: No parcellations or coordinates were added for extraction!')
+
+        self._func_img = load_bold(self.func_file)
+        hdr = self._func_img.header
+        if len(hdr.get_zooms()) == 4:
+            self._t_r = float(hdr.get_zooms()[-1])
+
+        if self.mask is not None:
+            self._mask_img = math_img('img > 0', img=nib.load(self.mask))
+
+        operators = []
+        for target in self.targets:
+            if target['net_parcels_nii_path'] is not None:
+                operator, labels = labels_operator(nib.load(target['net_parcels_nii_path']), self._func_img,
+                                                   self._mask_img)
+                target['labels'] = labels.tolist()
+                operators.append(operator)
+            else:
+                operators.append(get_spheres_operator(target['coords'], float(target['node_size']),
+                                                      self._func_img, self._mask_img, self.cache_dir))
+        self._splits = np.cumsum([operator.shape[0] for operator in operators])[:-1]
+
+        # Restrict the stacked operator to the union of all target supports
+        operator = vstack(operators, format='csc')
+        self._voxels = np.flatnonzero(np.diff(operator.indptr))
+        self._operator = operator[:, self._voxels].tocsr()
+        return
+
+    def _node_signals(self, smooth):
+        """Time x node matrix of all targets, optionally smoothed, reduced from the voxel signals chunk by chunk."""
+        from pynets.fmri.fmri_utils import bold_operator_signals
+        return bold_operator_signals(self._func_img, self._operator, self._voxels, smooth).T
+
+    def extract(self):
+        """
+        Extract the time-series of every target at every combination of smoothing and high-pass values. Results are
+        stored in `ts_within_nodes`, keyed by (target index, smooth, hpass).
+        """
+        from pynets.fmri.estimation import clean_node_signals
+
+        for smooth in self.smooth_list:
+            if smooth is not None and float(smooth) > 0:
+                print("%s%s%s" % ('Smoothing FWHM: ', smooth, ' mm\n'))
+            node_signals = self._node_signals(smooth)
+            for hpass in self.hpass_list:
+                if hpass is not None and float(hpass) > 0:
+                    print("%s%s%s" % ('Applying high-pass filter: ', hpass, ' Hz\n'))
+                    high_pass = float(hpass)
+                else:
+                    high_pass = None
+                ts_all = clean_node_signals(node_signals.copy(), self.conf, high_pass is None, high_pass,
+                                            self._t_r if high_pass is not None else None)
+                for i, ts_within_nodes in enumerate(np.split(ts_all, self._splits, axis=1)):
+                    self.ts_within_nodes[(i, smooth, hpass)] = ts_within_nodes
+
+        self._func_img.uncache()
+        print("%s%s%d%s%d%s" % ('\nTime series has {0} samples'.format(node_signals.shape[0]),
+                                ' mean extracted from ', len(self.targets), ' targets at ',
+                                len(self.smooth_list) * len(self.hpass_list), ' smoothing/high-pass combinations'))
+        return
+
+    def save_and_cleanup(self):
+        """
+        Bootstrap (if requested) and save every extracted time-series.
+
+        Returns
+        -------
+        out_paths : dict
+            Paths of the saved .npy files, keyed by (target index, smooth, hpass).
+        """
+        import gc
+        from pynets.core import utils
+
+        out_paths = {}
+        for (i, smooth, hpass), ts_within_nodes in self.ts_within_nodes.items():
+            if self.c_boot and int(self.c_boot) > 0:
+                ts_within_nodes = timeseries_bootstrap(ts_within_nodes, self.block_size)[0]
+            out_paths[(i, smooth, hpass)] = utils.save_ts_to_file(self.roi, self.network, self.ID,
+                                                                  self.targets[i]['dir_path'], ts_within_nodes,
+                                                                  self.c_boot, smooth, hpass,
+                                                                  self.targets[i]['node_size'])
+
+        self._operator = None
+        gc.collect()
+        return out_paths
@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 2026
+Copyright (C) 2017
+@author: Derek Pisner (dPys)
+"""
+import warnings
+import nibabel as nib
+import numpy as np
+warnings.filterwarnings("ignore")
+
+CHUNK_MB = 256
+CACHE_GB = 20
+
+
+def get_bold_cache_dir():
+    """
+    Directory of uncompressed BOLD caches. Set by bold_cache_dir in runconfig.yaml or the PYNETS_BOLD_CACHE
+    environment variable, and otherwise a pynets_bold_cache folder in the system's temporary directory.
+    """
+    import os
+    import tempfile
+    return os.environ.get('PYNETS_BOLD_CACHE', os.path.join(tempfile.gettempdir(), 'pynets_bold_cache'))
+
+
+class _BoldCacheLock(object):
+    """
+    Advisory lock on a BOLD cache directory. Readers hold it shared from the cache lookup until the image's file
+    handle is open, and `prune_bold_cache` only evicts while holding it exclusively, so an image cannot be removed
+    between being found and being opened. Where the directory or lock file cannot be created, no lock is taken.
+    """
+
+    def __init__(self, cache_dir, exclusive=False, blocking=True):
+        self.cache_dir = cache_dir
+        self.exclusive = exclusive
+        self.blocking = blocking
+        self.acquired = False
+        self._lock = None
+
+    def __enter__(self):
+        import os
+        import fcntl
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._lock = open("%s%s" % (self.cache_dir, '/.lock'), 'a')
+        except OSError:
+            return self
+        flags = fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH
+        try:
+            fcntl.flock(self._lock, flags if self.blocking else flags | fcntl.LOCK_NB)
+            self.acquired = True
+        except OSError:
+            pass
+        return self
+
+    def __exit__(self, *args):
+        if self._lock is not None:
+            self._lock.close()
+        return False
+
+
+def prune_bold_cache(cache_dir=None, max_gb=None, keep=()):
+    """
+    Evict the least recently used images of a BOLD cache until it fits in a size budget. Cache hits refresh the
+    modification time of an image, so it orders images by last use. Eviction only happens under an exclusive lock
+    on the cache (see `_BoldCacheLock`). If another process is opening an image at that moment, the prune is
+    skipped and left to the next write to the cache.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory of the cache. Default is given by `get_bold_cache_dir`.
+    max_gb : float
+        Size budget in gigabytes. Set by bold_cache_gb in runconfig.yaml or the PYNETS_BOLD_CACHE_GB environment
+        variable, and otherwise 20.
+    keep : list
+        File paths that are never evicted (e.g. an image that was just written).
+
+    Returns
+    -------
+    removed : list
+        File paths of the evicted images.
+    """
+    import os
+
+    if cache_dir is None:
+        cache_dir = get_bold_cache_dir()
+    if max_gb is None:
+        max_gb = float(os.environ.get('PYNETS_BOLD_CACHE_GB', CACHE_GB))
+    keep = [os.path.abspath(path) for path in keep]
+
+    removed = []
+    with _BoldCacheLock(cache_dir, exclusive=True, blocking=False) as lock:
+        if not lock.acquired:
+            return removed
+
+        entries = []
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            # Partially written images (and the lock file) are hidden until they are moved into place
+            if name.startswith('.') or not name.endswith('.nii') or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum([entry[1] for entry in entries])
+
+        for _, size, path in sorted(entries):
+            if total <= max_gb * 1073741824:
+                break
+            if os.path.abspath(path) in keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed.append(path)
+    return removed
+
+
+def _touch(path):
+    import os
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _open_bold(path):
+    """
+    Memory-map an image and open its file handle right away, so that reads keep working if the cache evicts the
+    file afterwards.
+    """
+    img = nib.load(path, mmap=True, keep_file_open=True)
+    img.dataobj[(0,) * len(img.shape)]
+    return img
+
+
+def _decompress_bold(func_file, cache_dir):
+    """
+    Look up or write the uncompressed cache of a gzipped image (see `decompress_bold`), without pruning.
+
+    Returns
+    -------
+    out_file : str
+        File path to the uncompressed .nii image, or func_file itself if the cache cannot be written to.
+    written : bool
+        True if the image was decompressed by this call.
+    """
+    import os
+    import gzip
+    import shutil
+    import tempfile
+    from pynets.core.utils import file_fingerprint
+
+    out_file = "%s%s%s%s%s%s" % (cache_dir, '/', os.path.basename(func_file).split('.nii')[0], '_',
+                                 file_fingerprint(func_file)[:16], '.nii')
+    if os.path.isfile(out_file):
+        _touch(out_file)
+        return out_file, False
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(prefix='.partial-', suffix='.nii', dir=cache_dir)
+        with os.fdopen(fd, 'wb') as f_out, gzip.open(func_file, 'rb') as f_in:
+            shutil.copyfileobj(f_in, f_out, 16 * 1048576)
+        os.replace(tmp_file, out_file)
+    except OSError:
+        print("%s%s" % ('Warning: could not decompress fMRI data into ', cache_dir))
+        return func_file, False
+    return out_file, True
+
+
+def decompress_bold(func_file, cache_dir=None):
+    """
+    Decompress a gzipped 4D fMRI image once into an on-disk cache, so that it can be memory-mapped and read in
+    chunks by every consumer of the same run.
+
+    Parameters
+    ----------
+    func_file : str
+        File path to a 4D Nifti1Image containing fMRI data.
+    cache_dir : str
+        Directory to decompress into. Default is given by `get_bold_cache_dir`.
+
+    Returns
+    -------
+    out_file : str
+        File path to the uncompressed .nii image, or func_file itself if it is not gzipped or the cache cannot be
+        written to. In that case nibabel reads the gzipped file, which is only random-access (avoiding a full
+        decompression on every read) if indexed_gzip is installed. The path is not protected from eviction once
+        returned; use `load_bold` to open the image safely.
+    """
+    if not func_file.endswith('.gz'):
+        return func_file
+
+    if cache_dir is None:
+        cache_dir = get_bold_cache_dir()
+    with _BoldCacheLock(cache_dir):
+        out_file, written = _decompress_bold(func_file, cache_dir)
+    if written:
+        prune_bold_cache(cache_dir, keep=[out_file])
+    return out_file
+
+
+def load_bold(func_file, cache_dir=None):
+    """
+    Load a 4D fMRI image from its uncompressed cache (see `decompress_bold`), memory-mapped so that only the chunks
+    read by a consumer are brought into memory. The file handle is opened under the cache lock, so a concurrent
+    prune of the cache cannot pull the image from under the consumer.
+    """
+    if not func_file.endswith('.gz'):
+        return nib.load(func_file, mmap=True)
+
+    if cache_dir is None:
+        cache_dir = get_bold_cache_dir()
+    with _BoldCacheLock(cache_dir):
+        out_file, written = _decompress_bold(func_file, cache_dir)
+        func_img = _open_bold(out_file) if out_file != func_file else nib.load(func_file, mmap=True)
+    if written:
+        prune_bold_cache(cache_dir, keep=[out_file])
+    return func_img
+
+
+def _unscaled_bold(func_img):
+    """
+    On-disk memory map of an uncompressed image file with its scaling, as (data, slope, inter), or None if the image
+    is in memory or compressed.
+    """
+    dataobj = func_img.dataobj
+    func_file = func_img.get_filename()
+    if not nib.is_proxy(dataobj) or not hasattr(dataobj, 'get_unscaled') or func_file is None or \
+            func_file.endswith('.gz'):
+        return None
+    data = dataobj.get_unscaled()
+    if not isinstance(data, np.memmap):
+        return None
+    return data, dataobj.slope, dataobj.inter
+
+
+def volumes_per_chunk(func_img, chunk_mb=CHUNK_MB):
+    """
+    Number of volumes of a 4D image that fit in a chunk budget of `chunk_mb` megabytes of float32 data.
+    """
+    return int(max(1, min(func_img.shape[3], (chunk_mb * 1048576) // (np.prod(func_img.shape[:3]) * 4))))
+
+
+def iter_bold_chunks(func_img, chunk_mb=CHUNK_MB):
+    """
+    Stream a 4D fMRI image as consecutive blocks of volumes.
+
+    Parameters
+    ----------
+    func_img : Nifti1Image
+        4D Nifti1Image containing fMRI data.
+    chunk_mb : int
+        Memory budget per chunk in megabytes of float32 data. Default is 256.
+
+    Yields
+    ------
+    t0, t1 : int
+        First and one-past-last volume of the chunk.
+    chunk : array
+        X x Y x Z x (t1 - t0) float32 array.
+    """
+    n_vols = func_img.shape[3]
+    step = volumes_per_chunk(func_img, chunk_mb)
+    # Memory-mapped files are read in their on-disk dtype and scaled per chunk in float32, rather than through
+    # nibabel's scaling, which promotes integer data to float64.
+    unscaled = _unscaled_bold(func_img)
+    for t0 in range(0, n_vols, step):
+        t1 = min(t0 + step, n_vols)
+        if unscaled is None:
+            yield t0, t1, np.asarray(func_img.dataobj[..., t0:t1], dtype=np.float32)
+            continue
+        data, slope, inter = unscaled
+        chunk = np.array(data[..., t0:t1], dtype=np.float32)
+        if slope != 1:
+            chunk *= np.float32(slope)
+        if inter != 0:
+            chunk += np.float32(inter)
+        yield t0, t1, chunk
+
+
+def get_volume(func_img, index):
+    """
+    Extract a single volume of a 4D image as a 3D Nifti1Image without loading the rest of the series.
+    """
+    return nib.Nifti1Image(np.asarray(func_img.dataobj[..., index], dtype=np.float32), func_img.affine)
+
+
+def smooth_chunk(chunk, affine, fwhm):
+    """
+    Smooth a block of volumes in place with a Gaussian kernel, as three separable 1D passes along the spatial axes
+    (the same kernel as nilearn's smooth_img).
+
+    Parameters
+    ----------
+    chunk : array
+        X x Y x Z x T float32 array, smoothed in place unless it is read-only. Non-finite values are set to zero.
+    affine : array
+        4 x 4 affine of the image.
+    fwhm : float
+        Smoothing width (mm fwhm).
+
+    Returns
+    -------
+    chunk : array
+        The smoothed array.
+    """
+    from scipy.ndimage import gaussian_filter1d
+
+    if not chunk.flags.writeable:
+        chunk = np.array(chunk)
+    chunk[~np.isfinite(chunk)] = 0
+    vox_size = np.sqrt(np.sum(np.asarray(affine)[:3, :3] ** 2, axis=0))
+    for axis, sigma in enumerate(float(fwhm) / (np.sqrt(8 * np.log(2)) * vox_size)):
+        if sigma > 0:
+            gaussian_filter1d(chunk, sigma, axis=axis, output=chunk)
+    return chunk
+
+
+def smooth_bold(func_img, fwhm, cache_dir=None, chunk_mb=CHUNK_MB):
+    """
+    Smooth a 4D fMRI image once per kernel width into an uncompressed, memory-mappable cache shared by every
+    extraction at that width. Volumes are smoothed chunk by chunk, so memory use is bounded by the chunk budget.
+
+    Parameters
+    ----------
+    func_img : Nifti1Image
+        4D Nifti1Image containing fMRI data, loaded from file.
+    fwhm : float
+        Smoothing width (mm fwhm).
+    cache_dir : str
+        Directory of the cache. Default is given by `get_bold_cache_dir`.
+    chunk_mb : int
+        Memory budget per chunk in megabytes of float32 data. Default is 256.
+
+    Returns
+    -------
+    smooth_img : Nifti1Image
+        Memory-mapped smoothed image.
+    """
+    import os
+    from pynets.core.utils import file_fingerprint
+
+    if cache_dir is None:
+        cache_dir = get_bold_cache_dir()
+    func_file = func_img.get_filename()
+    out_file = "%s%s%s%s%s%s%s%s" % (cache_dir, '/', os.path.basename(func_file).split('.nii')[0], '_',
+                                     file_fingerprint(func_file)[:16], '_smooth-', float(fwhm), 'fwhm.nii')
+    with _BoldCacheLock(cache_dir):
+        if os.path.isfile(out_file):
+            _touch(out_file)
+            return _open_bold(out_file)
+        smooth_img = _smooth_bold(func_img, fwhm, cache_dir, chunk_mb, out_file)
+    prune_bold_cache(cache_dir, keep=[out_file])
+    return smooth_img
+
+
+def _smooth_bold(func_img, fwhm, cache_dir, chunk_mb, out_file):
+    """
+    Write the smoothing cache of `smooth_bold` to out_file and open it, without pruning.
+    """
+    import os
+    import tempfile
+
+    hdr = nib.Nifti1Header()
+    hdr.set_data_shape(func_img.shape)
+    hdr.set_data_dtype(np.float32)
+    hdr.set_zooms(func_img.header.get_zooms())
+    hdr.set_xyzt_units(*func_img.header.get_xyzt_units())
+    hdr.set_qform(func_img.affine, code=1)
+    hdr.set_sform(func_img.affine, code=1)
+    hdr.set_data_offset(352)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(prefix='.partial-', suffix='.nii', dir=cache_dir)
+    with os.fdopen(fd, 'wb') as f:
+        hdr.write_to(f)
+        f.write(b'\x00' * (352 - f.tell()))
+    smoothed = np.memmap(tmp_file, dtype=np.float32, mode='r+', offset=352, shape=func_img.shape, order='F')
+    for t0, t1, chunk in iter_bold_chunks(func_img, chunk_mb):
+        smoothed[..., t0:t1] = smooth_chunk(chunk, func_img.affine, fwhm)
+    smoothed.flush()
+    del smoothed
+    os.replace(tmp_file, out_file)
+    return _open_bold(out_file)
+
+
+def iter_voxel_chunks(func_img, voxels=None, smooth=None, chunk_mb=CHUNK_MB, cache_dir=None):
+    """
+    Stream the time-series of a subset of voxels of a 4D fMRI image as consecutive blocks of volumes.
+
+    Parameters
+    ----------
+    func_img : Nifti1Image
+        4D Nifti1Image containing fMRI data.
+    voxels : array
+        C-ordered flat indices of the voxels to extract. Default is all voxels.
+    smooth : float
+        Smoothing width (mm fwhm) applied to each volume before extraction. If func_img was loaded from file, the
+        smoothed series is read from (and on first use written to) the cache of `smooth_bold`. Default is None.
+    chunk_mb : int
+        Memory budget per chunk in megabytes of float32 data. Default is 256.
+    cache_dir : str
+        Directory of the smoothing cache. Default is given by `get_bold_cache_dir`.
+
+    Yields
+    ------
+    t0, t1 : int
+        First and one-past-last volume of the chunk.
+    chunk : array
+        n_voxels x (t1 - t0) float32 array.
+    """
+    smooth = float(smooth) if smooth is not None and float(smooth) > 0 else None
+    if smooth is not None and func_img.get_filename() is not None:
+        try:
+            func_img = smooth_bold(func_img, smooth, cache_dir, chunk_mb)
+            smooth = None
+        except OSError:
+            print("%s%s" % ('Warning: could not cache smoothed fMRI data in ',
+                            cache_dir if cache_dir is not None else get_bold_cache_dir()))
+
+    if voxels is None:
+        voxels = np.arange(np.prod(func_img.shape[:3]))
+    ijk = np.unravel_index(voxels, func_img.shape[:3])
+    for t0, t1, chunk in iter_bold_chunks(func_img, chunk_mb):
+        if smooth is not None:
+            chunk = smooth_chunk(chunk, func_img.affine, smooth)
+        yield t0, t1, chunk[ijk]
+
+
+def bold_voxel_matrix(func_img, voxels=None, smooth=None, chunk_mb=CHUNK_MB, cache_dir=None):
+    """
+    Assemble the voxel x time matrix of a subset of voxels of a 4D fMRI image, streaming it chunk by chunk so that
+    the full 4D series is never materialised. Only the read is bounded by `chunk_mb`: the returned matrix holds the
+    whole series of the selected voxels. Consumers that only need a linear reduction of the voxel signals should use
+    `bold_operator_signals` instead.
+
+    Parameters
+    ----------
+    func_img : Nifti1Image
+        4D Nifti1Image containing fMRI data.
+    voxels : array
+        C-ordered flat indices of the voxels to extract. Default is all voxels.
+    smooth : float
+        Smoothing width (mm fwhm) applied to each volume before extraction (see `iter_voxel_chunks`). Default is
+        None.
+    chunk_mb : int
+        Memory budget per chunk in megabytes of float32 data. Default is 256.
+    cache_dir : str
+        Directory of the smoothing cache. Default is given by `get_bold_cache_dir`.
+
+    Returns
+    -------
+    X : array
+        n_voxels x n_volumes float32 array.
+    """
+    n_voxels = int(np.prod(func_img.shape[:3])) if voxels is None else len(voxels)
+    X = np.empty((n_voxels, func_img.shape[3]), dtype=np.float32)
+    for t0, t1, chunk in iter_voxel_chunks(func_img, voxels, smooth, chunk_mb, cache_dir):
+        X[:, t0:t1] = chunk
+    return X
+
+
+def bold_operator_signals(func_img, operator, voxels=None, smooth=None, chunk_mb=CHUNK_MB, cache_dir=None):
+    """
+    Apply a (sparse) linear operator, such as the averaging operators of parcels or spheres, to the voxel signals of a
+    4D fMRI image one chunk of volumes at a time, so that memory use is bounded by the chunk budget and the size of
+    the output rather than by the voxel x time matrix.
+
+    Parameters
+    ----------
+    func_img : Nifti1Image
+        4D Nifti1Image containing fMRI data.
+    operator : sparse matrix
+        n_rows x n_voxels operator over the voxels in `voxels`.
+    voxels : array
+        C-ordered flat indices of the voxels the columns of the operator refer to. Default is all voxels.
+    smooth : float
+        Smoothing width (mm fwhm) applied to each volume before extraction (see `iter_voxel_chunks`). Default is
+        None.
+    chunk_mb : int
+        Memory budget per chunk in megabytes of float32 data. Default is 256.
+    cache_dir : str
+        Directory of the smoothing cache. Default is given by `get_bold_cache_dir`.
+
+    Returns
+    -------
+    signals : array
+        n_rows x n_volumes array of operator outputs.
+    """
+    signals = None
+    for t0, t1, chunk in iter_voxel_chunks(func_img, voxels, smooth, chunk_mb, cache_dir):
+        out = np.asarray(operator.dot(chunk))
+        if signals is None:
+            signals = np.empty((out.shape[0], func_img.shape[3]), dtype=out.dtype)
+        signals[:, t0:t1] = out
+    return signals
@@ -98,6 +98,7 @@ def build_embedded_connectome(est_path_iterlist, ID, multimodal, embed):
     import yaml
     from pathlib import Path
     from pynets.stats.embeddings import _mase_embed, _omni_embed
+    from pynets.core.thresholding import load_thresholded
     # Available functional and structural connectivity models
     with open("%s%s" % (str(Path(__file__).parent.parent), '/runconfig.yaml'), 'r') as stream:
         hardcoded_params = yaml.load(stream)
@@ -167,7 +168,7 @@ def build_embedded_connectome(est_path_iterlist, ID, multimodal, embed):
                     for rsn in rsns:
                         pop_rsn_list = []
                         for graph in pop_ref[rsn]:
-                            pop_list.append(np.load(graph))
+                            pop_list.append(load_thresholded(graph))
                         if len(pop_rsn_list) > 1:
                             if len(list(set([i.shape for i in pop_rsn_list]))) > 1:
                                 raise RuntimeWarning('ERROR: Inconsistent number of vertices in graph population '
@@ -184,7 +185,7 @@ def build_embedded_connectome(est_path_iterlist, ID, multimodal, embed):
                             pass
                         i = i + 1
                 else:
-                    pop_list.append(np.load(pop_ref))
+                    pop_list.append(load_thresholded(pop_ref))
             if len(pop_list) > 1:
                 if len(list(set([i.shape for i in pop_list]))) > 1:
                     raise RuntimeWarning('ERROR: Inconsistent number of vertices in graph population that '
@@ -209,7 +210,7 @@ def build_embedded_connectome(est_path_iterlist, ID, multimodal, embed):
                     for rsn in rsns:
                         pop_rsn_list = []
                         for graph in pop_ref[rsn]:
-                            pop_list.append(np.load(graph))
+                            pop_list.append(load_thresholded(graph))
                         if len(pop_rsn_list) > 1:
                             if len(list(set([i.shape for i in pop_rsn_list]))) > 1:
                                 raise RuntimeWarning('ERROR: Inconsistent number of vertices in graph population '
@@ -226,7 +227,7 @@ def build_embedded_connectome(est_path_iterlist, ID, multimodal, embed):
                             pass
                         i = i + 1
                 else:
-                    pop_list.append(np.load(pop_ref))
+                    pop_list.append(load_thresholded(pop_ref))
             if len(pop_list) > 1:
                 if len(list(set([i.shape for i in pop_list]))) > 1:
                     raise RuntimeWarning('ERROR: Inconsistent number of vertices in graph population that '
@@ -273,7 +274,7 @@ def build_embedded_connectome(est_path_iterlist, ID, multimodal, embed):
                     for rsn in rsns:
                         pop_rsn_list = []
                         for graph in pop_ref[rsn]:
-                            pop_list.append(np.load(graph))
+                            pop_list.append(load_thresholded(graph))
                         if len(pop_rsn_list) > 1:
                             if len(list(set([i.shape for i in pop_rsn_list]))) > 1:
                                 raise RuntimeWarning('ERROR: Inconsistent number of vertices in graph population '
@@ -284,7 +285,7 @@ def build_embedded_connectome(est_path_iterlist, ID, multimodal, embed):
                             pass
                         i = i + 1
                 else:
-                    pop_list.append(np.load(pop_ref))
+                    pop_list.append(load_thresholded(pop_ref))
             if len(pop_list) > 1:
                 if len(list(set([i.shape for i in pop_list]))) > 1:
                     raise RuntimeWarning('ERROR: Inconsistent number of vertices in graph population that '
@@ -869,7 +869,7 @@ class CleanGraphs(object):
         if self._est_path_fmt == '.txt':
             self.in_mat_raw = np.array(np.genfromtxt(self.est_path))
         else:
-            self.in_mat_raw = np.array(np.load(self.est_path))
+            self.in_mat_raw = np.array(thresholding.load_thresholded(self.est_path))
 
         # De-diagnal and remove nan's and inf's, ensure edge weights are positive
         self.in_mat = np.array(np.abs(np.array(thresholding.autofix(self.in_mat_raw))))
@@ -957,8 +957,8 @@ class CleanGraphs(object):
         G_bin = nx.from_numpy_matrix(in_mat_bin)
         return in_mat_bin, G_bin
 
-    def create_length_matrix(self):
-        in_mat_len = thresholding.weight_conversion(self.in_mat, 'lengths')
+    def create_length_matrix(self, method='inv'):
+        in_mat_len = thresholding.distance_transform(self.in_mat, method=method)
 
         # Load numpy matrix as networkx graph
         G_len = nx.from_numpy_matrix(in_mat_len)
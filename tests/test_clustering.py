@@ -75,6 +75,463 @@ def test_make_local_connectivity_scorr():
     assert W is not None
 
 
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_make_local_connectivity_tcorr_neighbourhoods(n_jobs):
+    """
+    Test make_local_connectivity_tcorr against per-voxel neighbourhood correlations
+    """
+    from itertools import product
+    rng = np.random.RandomState(42)
+    data = rng.randn(6, 7, 5, 40).astype('float32')
+    data[..., 20:] += data[:1, :1, :1, 20:]
+    data[2, 2, 2] = 1
+    mask = np.zeros((6, 7, 5), dtype='uint8')
+    mask[:, 1:6, :4] = 1
+    mask[3, 3, 1] = 0
+    func_img = nib.Nifti1Image(data, np.eye(4))
+    mask_img = nib.Nifti1Image(mask, np.eye(4))
+
+    W = clustools.make_local_connectivity_tcorr(func_img, mask_img, thresh=0.1, n_jobs=n_jobs, chunk_mb=0)
+
+    coords = np.argwhere(mask)
+    index = dict([(tuple(c), i) for i, c in enumerate(coords)])
+    expected = np.zeros((len(coords), len(coords)))
+    for j, c in enumerate(coords):
+        if np.var(data[tuple(c)]) == 0:
+            continue
+        for offset in product((-1, 0, 1), repeat=3):
+            i = index.get(tuple(c + np.array(offset)))
+            if i is not None and np.var(data[tuple(coords[i])]) > 0:
+                r = np.corrcoef(data[tuple(coords[i])], data[tuple(c)])[0, 1]
+                expected[i, j] = r if r >= 0.1 else 0
+    assert W.shape == expected.shape
+    assert np.allclose(W.toarray(), expected, atol=1e-5)
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_make_local_connectivity_scorr_fc_maps(n_jobs):
+    """
+    Test make_local_connectivity_scorr against correlations between explicit whole-mask FC maps
+    """
+    from itertools import product
+    rng = np.random.RandomState(42)
+    data = rng.randn(6, 7, 5, 40).astype('float32')
+    data[..., 20:] += data[:1, :1, :1, 20:]
+    data[2, 2, 2] = 1
+    mask = np.zeros((6, 7, 5), dtype='uint8')
+    mask[:, 1:6, :4] = 1
+    mask[3, 3, 1] = 0
+    func_img = nib.Nifti1Image(data, np.eye(4))
+    mask_img = nib.Nifti1Image(mask, np.eye(4))
+
+    W = clustools.make_local_connectivity_scorr(func_img, mask_img, thresh=0.1, n_jobs=n_jobs, chunk_mb=0)
+
+    coords = np.argwhere(mask)
+    ts = data[mask.astype('bool')].astype('float64')
+    ts -= ts.mean(axis=1, keepdims=True)
+    std = ts.std(axis=1)
+    ts[std > 0] /= std[std > 0, np.newaxis]
+    fc_maps = ts.dot(ts.T)
+    index = dict([(tuple(c), i) for i, c in enumerate(coords)])
+    expected = np.zeros((len(coords), len(coords)))
+    for j, c in enumerate(coords):
+        if std[j] == 0:
+            continue
+        for offset in product((-1, 0, 1), repeat=3):
+            i = index.get(tuple(c + np.array(offset)))
+            if i is not None and std[i] > 0:
+                r = np.corrcoef(fc_maps[i], fc_maps[j])[0, 1]
+                expected[i, j] = r if r >= 0.1 else 0
+    assert W.shape == expected.shape
+    assert np.allclose(W.toarray(), expected, atol=1e-5)
+
+
+def test_ncut_solvers():
+    """
+    Test that the LOBPCG and ARPACK ncut eigenbases agree
+    """
+    from scipy.sparse import csc_matrix
+    rng = np.random.RandomState(42)
+    data = rng.randn(8, 8, 8, 40).astype('float32')
+    labels = (np.arange(8) >= 4).astype('int')
+    data += 2 * rng.randn(2, 40)[labels[:, np.newaxis, np.newaxis] * np.ones((8, 8, 8), dtype='int')]
+    W = clustools.make_local_connectivity_tcorr(nib.Nifti1Image(data, np.eye(4)),
+                                                nib.Nifti1Image(np.ones((8, 8, 8), dtype='uint8'), np.eye(4)),
+                                                thresh=0.2)
+    W = csc_matrix(W)
+    eigen_val, eigen_vec = clustools.ncut(W, 4)
+    eigen_val_lobpcg, eigen_vec_lobpcg = clustools.ncut(W, 4, solver='lobpcg')
+    assert np.allclose(eigen_val, eigen_val_lobpcg, atol=1e-4)
+
+    # Leading eigenvectors span the same subspace
+    q, _ = np.linalg.qr(eigen_vec[:, :2])
+    q_lobpcg, _ = np.linalg.qr(eigen_vec_lobpcg[:, :2])
+    assert np.allclose(np.linalg.svd(q.T.dot(q_lobpcg))[1], 1, atol=1e-3)
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_discretisation(n_jobs):
+    """
+    Test that discretisation recovers well separated clusters reproducibly
+    """
+    from sklearn.metrics import adjusted_rand_score
+    rng = np.random.RandomState(42)
+    truth = rng.randint(0, 5, 400)
+    eigen_vec = np.eye(5)[truth] + 0.1 * rng.randn(400, 5)
+
+    eigen_vec_discrete = clustools.discretisation(eigen_vec, n_restarts=4, n_jobs=n_jobs)
+    assert eigen_vec_discrete.shape == (400, 5)
+    assert np.array_equal(np.asarray(eigen_vec_discrete.sum(axis=1)).ravel(), np.ones(400))
+    labels = np.asarray(eigen_vec_discrete.argmax(axis=1)).ravel()
+    assert adjusted_rand_score(truth, labels) == 1
+    assert (clustools.discretisation(eigen_vec, n_restarts=4, n_jobs=n_jobs) != eigen_vec_discrete).nnz == 0
+
+
+def test_parcellate_ncut_k_list():
+    """
+    Test ncut parcellations of planted parcels at several k from a shared eigenbasis
+    """
+    from sklearn.metrics import adjusted_rand_score
+    rng = np.random.RandomState(42)
+    truth = np.zeros((8, 8, 8), dtype='int')
+    truth[4:] = 1
+    truth[:, 4:] += 2
+    data = rng.randn(8, 8, 8, 60) + 3 * rng.randn(4, 60)[truth]
+    mask_img = nib.Nifti1Image(np.ones((8, 8, 8), dtype='uint8'), np.eye(4))
+    W = clustools.make_local_connectivity_tcorr(nib.Nifti1Image(data.astype('float32'), np.eye(4)), mask_img,
+                                                thresh=0.3)
+
+    out_imgs = clustools.parcellate_ncut_k_list(W, [4, 8], mask_img)
+    labels = np.asarray(out_imgs[0].dataobj)
+    assert adjusted_rand_score(truth.ravel(), labels.ravel()) == 1
+    assert adjusted_rand_score(labels.ravel(), np.asarray(clustools.parcellate_ncut(W, 4, mask_img).dataobj).ravel()) \
+        == 1
+    assert np.unique(np.asarray(out_imgs[1].dataobj)).min() == 1
+
+
+@pytest.mark.parametrize("linkage", ['ward', 'average'])
+def test_hierarchical_parcellations(linkage):
+    """
+    Test that cuts of a single agglomerative tree match per-k agglomerative clustering
+    """
+    from sklearn.cluster import AgglomerativeClustering
+    from sklearn.feature_extraction.image import grid_to_graph
+    from sklearn.metrics import adjusted_rand_score
+    rng = np.random.RandomState(42)
+    mask = np.zeros((8, 8, 6), dtype='bool')
+    mask[1:7, 1:7, 1:5] = True
+    X = rng.randn(int(mask.sum()), 20)
+    connectivity = grid_to_graph(*mask.shape, mask=mask)
+    k_list = [2, 5, 20, 60]
+
+    labels_list = clustools.hierarchical_parcellations(X, k_list, connectivity=connectivity, linkage=linkage)
+    for k, labels in zip(k_list, labels_list):
+        assert len(np.unique(labels)) == k
+        expected = AgglomerativeClustering(n_clusters=k, connectivity=connectivity, linkage=linkage).fit(X).labels_
+        assert adjusted_rand_score(labels, expected) == 1
+
+
+def test_parcellate_k_list_ward(tmp_path):
+    """
+    Test NiParcellate.parcellate_k_list for ward clustering over several k
+    """
+    rng = np.random.RandomState(42)
+    affine = np.diag([2., 2., 2., 1.])
+    data = (rng.randn(10, 10, 10, 30) + 100).astype('float32')
+    func_file = str(tmp_path / 'func.nii.gz')
+    clust_mask = str(tmp_path / 'clust_mask.nii.gz')
+    mask = np.zeros((10, 10, 10), dtype='uint8')
+    mask[2:8, 2:8, 2:8] = 1
+    nib.save(nib.Nifti1Image(data, affine), func_file)
+    nib.save(nib.Nifti1Image(mask, affine), clust_mask)
+
+    nip = clustools.NiParcellate(func_file=func_file, clust_mask=clust_mask, k=5, clust_type='ward',
+                                 local_corr='allcorr', cache_dir=str(tmp_path / 'cache'))
+    nip.create_clean_mask()
+    nip.create_local_clustering(overwrite=False, r_thresh=0.2)
+    atlases, uatlases = nip.parcellate_k_list([5, 10, 20])
+    assert atlases == ['clust_mask_ward_k5', 'clust_mask_ward_k10', 'clust_mask_ward_k20']
+    for k, uatlas in zip([5, 10, 20], uatlases):
+        labels = np.asarray(nib.load(uatlas).dataobj)
+        assert np.array_equal(np.unique(labels), np.arange(k + 1))
+        assert np.array_equal(labels > 0, np.asarray(nip._clust_mask_corr_img.dataobj) > 0)
+
+
+
+def test_ncut_eigenbasis_shared_across_k(tmp_path, monkeypatch):
+    """
+    Test that the ncut parcellations of every k of a run share one cached eigendecomposition
+    """
+    import os
+    rng = np.random.RandomState(42)
+    affine = np.diag([2., 2., 2., 1.])
+    data = (rng.randn(10, 10, 10, 30) + 100).astype('float32')
+    func_file = str(tmp_path / 'func.nii.gz')
+    clust_mask = str(tmp_path / 'clust_mask.nii.gz')
+    mask = np.zeros((10, 10, 10), dtype='uint8')
+    mask[2:8, 2:8, 2:8] = 1
+    nib.save(nib.Nifti1Image(data, affine), func_file)
+    nib.save(nib.Nifti1Image(mask, affine), clust_mask)
+    cache_dir = str(tmp_path / 'cache')
+
+    ncut = clustools.ncut
+    calls = []
+    monkeypatch.setattr(clustools, 'ncut', lambda W, n, solver='arpack': calls.append(n) or ncut(W, n, solver))
+
+    k_list = [4, 8, 12]
+    labels_list = []
+    for k in k_list:
+        nip = clustools.NiParcellate(func_file=func_file, clust_mask=clust_mask, k=k, clust_type='ncut',
+                                     local_corr='tcorr', cache_dir=cache_dir, k_list=k_list)
+        nip.create_clean_mask()
+        nip.create_local_clustering(overwrite=False, r_thresh=0.2)
+        labels_list.append(np.asarray(nib.load(nip.parcellate()).dataobj))
+    assert calls == [12]
+    assert os.path.isfile(nip._ncut_eigen_cache_path(12))
+
+    # The same parcellations as those of all k at once from the cached eigenbasis
+    _, uatlases = nip.parcellate_k_list(k_list)
+    assert calls == [12]
+    for labels, uatlas in zip(labels_list, uatlases):
+        assert np.array_equal(labels, np.asarray(nib.load(uatlas).dataobj))
+
+
+@pytest.mark.parametrize("clust_type", ['ward', 'average'])
+def test_agglomerative_tree_shared_across_k(tmp_path, monkeypatch, clust_type):
+    """
+    Test that the agglomerative parcellations of every k of a run cut one cached tree
+    """
+    import os
+    rng = np.random.RandomState(42)
+    affine = np.diag([2., 2., 2., 1.])
+    data = (rng.randn(10, 10, 10, 30) + 100).astype('float32')
+    func_file = str(tmp_path / 'func.nii.gz')
+    clust_mask = str(tmp_path / 'clust_mask.nii.gz')
+    mask = np.zeros((10, 10, 10), dtype='uint8')
+    mask[2:8, 2:8, 2:8] = 1
+    nib.save(nib.Nifti1Image(data, affine), func_file)
+    nib.save(nib.Nifti1Image(mask, affine), clust_mask)
+    cache_dir = str(tmp_path / 'cache')
+
+    hierarchical_tree = clustools.hierarchical_tree
+    calls = []
+    monkeypatch.setattr(clustools, 'hierarchical_tree',
+                        lambda X, connectivity=None, linkage='ward': calls.append(linkage) or
+                        hierarchical_tree(X, connectivity, linkage))
+
+    k_list = [4, 8, 12]
+    labels_list = []
+    for k in k_list:
+        nip = clustools.NiParcellate(func_file=func_file, clust_mask=clust_mask, k=k, clust_type=clust_type,
+                                     local_corr='tcorr', cache_dir=cache_dir, k_list=k_list)
+        nip.create_clean_mask()
+        nip.create_local_clustering(overwrite=False, r_thresh=0.2)
+        labels = np.asarray(nib.load(nip.parcellate()).dataobj)
+        assert np.array_equal(np.unique(labels), np.arange(k + 1))
+        labels_list.append(labels)
+    assert calls == [clust_type]
+    assert os.path.isfile(nip._tree_cache_path())
+
+    # The same parcellations as those of all k at once from the cached tree
+    _, uatlases = nip.parcellate_k_list(k_list)
+    assert calls == [clust_type]
+    for labels, uatlas in zip(labels_list, uatlases):
+        assert np.array_equal(labels, np.asarray(nib.load(uatlas).dataobj))
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+@pytest.mark.parametrize("clust_type", ['kmeans', 'rena'])
+def test_parcellate_connected_components(tmp_path, clust_type, n_jobs):
+    """
+    Test per-component clustering of a mask with several connected components
+    """
+    rng = np.random.RandomState(42)
+    affine = np.diag([2., 2., 2., 1.])
+    data = (rng.randn(12, 12, 12, 30) + 100).astype('float32')
+    func_file = str(tmp_path / 'func.nii.gz')
+    clust_mask = str(tmp_path / 'clust_mask.nii.gz')
+    mask = np.zeros((12, 12, 12), dtype='uint8')
+    mask[1:5, 1:5, 1:5] = 1
+    mask[6:11, 6:11, 6:11] = 1
+    nib.save(nib.Nifti1Image(data, affine), func_file)
+    nib.save(nib.Nifti1Image(mask, affine), clust_mask)
+
+    nip = clustools.NiParcellate(func_file=func_file, clust_mask=clust_mask, k=12, clust_type=clust_type,
+                                 local_corr='allcorr', cache_dir=str(tmp_path / 'cache'))
+    nip.create_clean_mask()
+    nip.create_local_clustering(overwrite=False, r_thresh=0.2, min_region_size=8)
+    assert nip.num_conn_comps == 2
+    uatlas = nip.parcellate(n_jobs=n_jobs)
+
+    labels = np.asarray(nib.load(uatlas).dataobj)
+    assert np.array_equal(np.unique(labels), np.arange(13))
+    comps = np.asarray(nip._conn_comps.dataobj)
+    assert np.array_equal(labels > 0, np.any(comps > 0, axis=3))
+
+    # Parcels never straddle connected components
+    for label in range(1, 13):
+        assert len(np.unique(np.argmax(comps[labels == label], axis=1))) == 1
+
+
+def test_local_clustering_no_components(tmp_path):
+    """
+    Test a mask without any connected component above min_region_size
+    """
+    import os
+    rng = np.random.RandomState(42)
+    affine = np.diag([2., 2., 2., 1.])
+    data = (rng.randn(12, 12, 12, 30) + 100).astype('float32')
+    func_file = str(tmp_path / 'func.nii.gz')
+    clust_mask = str(tmp_path / 'clust_mask.nii.gz')
+    mask = np.zeros((12, 12, 12), dtype='uint8')
+    mask[1:4, 1:4, 1:4] = 1
+    mask[7:10, 7:10, 7:10] = 1
+    nib.save(nib.Nifti1Image(data, affine), func_file)
+    nib.save(nib.Nifti1Image(mask, affine), clust_mask)
+
+    nip = clustools.NiParcellate(func_file=func_file, clust_mask=clust_mask, k=4, clust_type='kmeans',
+                                 local_corr='allcorr', cache_dir=str(tmp_path / 'cache'))
+    nip.create_clean_mask()
+    nip.create_local_clustering(overwrite=False, r_thresh=0.2, min_region_size=1000)
+    assert nip.num_conn_comps == 0
+    assert nip._conn_comps.shape[3] == 0
+
+    # The empty label volume is cached and reused
+    comps_path = "%s%s" % (nip._clean_mask_path.split('.nii')[0], '_conn-comps-1000.nii.gz')
+    assert os.path.isfile(comps_path)
+    assert not np.any(np.asarray(nib.load(comps_path).dataobj))
+    nip.create_local_clustering(overwrite=False, r_thresh=0.2, min_region_size=1000)
+    assert nip.num_conn_comps == 0
+
+    # Neither kmeans nor rena has a component to cluster
+    for clust_type in ['kmeans', 'rena']:
+        nip.clust_type = clust_type
+        with pytest.raises(ValueError, match='No connected component'):
+            nip.parcellate()
+    assert not os.path.isfile(nip.uatlas)
+
+
+@pytest.mark.parametrize("local_corr", ['tcorr', 'scorr'])
+def test_local_conn_cache(tmp_path, local_corr):
+    """
+    Test that the local connectivity matrix is shared across k and clustering methods
+    """
+    import os
+    rng = np.random.RandomState(42)
+    affine = np.diag([2., 2., 2., 1.])
+    data = (rng.randn(10, 10, 10, 30) + 100).astype('float32')
+    func_file = str(tmp_path / 'func.nii.gz')
+    clust_mask = str(tmp_path / 'clust_mask.nii.gz')
+    mask = np.zeros((10, 10, 10), dtype='uint8')
+    mask[2:8, 2:8, 2:8] = 1
+    nib.save(nib.Nifti1Image(data, affine), func_file)
+    nib.save(nib.Nifti1Image(mask, affine), clust_mask)
+    cache_dir = str(tmp_path / 'cache')
+
+    local_conn_paths = []
+    for k, clust_type in [(5, 'ward'), (10, 'ward'), (10, 'ncut')]:
+        nip = clustools.NiParcellate(func_file=func_file, clust_mask=clust_mask, k=k, clust_type=clust_type,
+                                     local_corr=local_corr, cache_dir=cache_dir)
+        nip.create_clean_mask()
+        nip.create_local_clustering(overwrite=False, r_thresh=0.2)
+        local_conn_paths.append(nip._local_conn_mat_path)
+        if k == 5:
+            mtime = os.path.getmtime(nip._local_conn_mat_path)
+            W = nip._local_conn
+    assert len(set(local_conn_paths)) == 1
+    assert [f for f in os.listdir(cache_dir) if f.endswith('_conn.npz')] == [os.path.basename(local_conn_paths[0])]
+    assert os.path.getmtime(local_conn_paths[0]) == mtime
+    assert (nip._local_conn != W).nnz == 0
+
+    # A different threshold is a different cache entry
+    nip.create_local_clustering(overwrite=False, r_thresh=0.3)
+    assert nip._local_conn_mat_path != local_conn_paths[0]
+
+
+def test_clean_mask_cache(tmp_path):
+    """
+    Test that the cleaned clustering mask and its connected components are shared across k and clustering methods
+    """
+    import os
+    rng = np.random.RandomState(42)
+    affine = np.diag([2., 2., 2., 1.])
+    data = (rng.randn(12, 12, 12, 20) + 100).astype('float32')
+    func_file = str(tmp_path / 'func.nii.gz')
+    clust_mask = str(tmp_path / 'clust_mask.nii.gz')
+    mask = np.zeros((12, 12, 12), dtype='uint8')
+    mask[1:5, 1:5, 1:5] = 1
+    mask[6:11, 6:11, 6:11] = 1
+    nib.save(nib.Nifti1Image(data, affine), func_file)
+    nib.save(nib.Nifti1Image(mask, affine), clust_mask)
+    cache_dir = str(tmp_path / 'cache')
+
+    clean_masks = []
+    for k, clust_type in [(5, 'kmeans'), (10, 'kmeans'), (10, 'rena')]:
+        nip = clustools.NiParcellate(func_file=func_file, clust_mask=clust_mask, k=k, clust_type=clust_type,
+                                     local_corr='allcorr', cache_dir=cache_dir)
+        nip.create_clean_mask()
+        nip.create_local_clustering(overwrite=False, r_thresh=0.2, min_region_size=8)
+        assert nip.num_conn_comps == 2
+        assert os.path.isfile("%s%s%s%s" % (nip._dir_path, '/', 'clust_mask', '.nii.gz'))
+        clean_masks.append(np.asarray(nip._clust_mask_corr_img.dataobj))
+        if k == 5:
+            clean_mask_path = nip._clean_mask_path
+            mtime = os.path.getmtime(clean_mask_path)
+            comps = np.asarray(nip._conn_comps.dataobj)
+    assert nip._clean_mask_path == clean_mask_path
+    assert os.path.getmtime(clean_mask_path) == mtime
+    assert len(os.listdir(cache_dir)) == 2
+    assert all([np.array_equal(clean_mask, clean_masks[0]) for clean_mask in clean_masks])
+    assert np.array_equal(np.asarray(nip._conn_comps.dataobj), comps)
+
+    # A different intensity threshold is a different cache entry
+    nip.create_clean_mask(num_std_dev=1.)
+    assert nip._clean_mask_path != clean_mask_path
+
+
+@pytest.mark.parametrize("clust_type", ['ncut', 'ward'])
+def test_group_parcellate(tmp_path, clust_type):
+    """
+    Test group parcellation of planted parcels shared by several subjects
+    """
+    import os
+    from sklearn.metrics import adjusted_rand_score
+    rng = np.random.RandomState(42)
+    affine = np.diag([2., 2., 2., 1.])
+    truth = np.zeros((8, 8, 8), dtype='int')
+    truth[4:] = 1
+    truth[:, 4:] += 2
+    func_files = []
+    for subj in range(3):
+        data = rng.randn(8, 8, 8, 40) + 1.5 * rng.randn(4, 40)[truth] + 100
+        func_files.append(str(tmp_path / ("%s%s%s" % ('sub-', subj, '.nii.gz'))))
+        nib.save(nib.Nifti1Image(data.astype('float32'), affine), func_files[-1])
+    clust_mask = str(tmp_path / 'clust_mask.nii.gz')
+    nib.save(nib.Nifti1Image(np.ones((8, 8, 8), dtype='uint8'), affine), clust_mask)
+    out_dir = str(tmp_path / 'group')
+
+    gp = clustools.GroupParcellate(func_files, clust_mask, [4, 8], out_dir, clust_type=clust_type,
+                                   r_thresh=0.2, cache_dir=str(tmp_path / 'cache'))
+    gp.create_group_mask()
+    group_conn = gp.create_group_local_connectivity()
+    assert group_conn.shape == (512, 512)
+    uatlases = gp.parcellate()
+    assert len(uatlases) == 2
+    labels = np.asarray(nib.load(uatlases[0]).dataobj)
+    assert adjusted_rand_score(truth.ravel(), labels.ravel()) == 1
+    assert len(np.unique(np.asarray(nib.load(uatlases[1]).dataobj))) == 8
+
+    # Group ward clusters an embedding of n_eigen dimensions, which may be smaller than the largest k
+    if clust_type == 'ward':
+        uatlases = gp.parcellate(n_eigen=4)
+        assert adjusted_rand_score(truth.ravel(), np.asarray(nib.load(uatlases[0]).dataobj).ravel()) == 1
+        assert len(np.unique(np.asarray(nib.load(uatlases[1]).dataobj))) == 8
+
+    # Subject graphs are taken from the local connectivity cache on a re-run
+    assert len(os.listdir(str(tmp_path / 'cache'))) == 3
+    assert (gp.create_group_local_connectivity() != group_conn).nnz == 0
+
+
 @pytest.mark.parametrize("local_corr", ['scorr', 'tcorr', 'allcorr'])
 @pytest.mark.parametrize("clust_type", ['kmeans', 'ward', 'rena', pytest.param('single', marks=pytest.mark.xfail),
                                         pytest.param('average', marks=pytest.mark.xfail),
@@ -97,3 +554,19 @@ def test_ni_parcellate(local_corr, clust_type, k):
     uatlas = nip.parcellate()
     assert atlas is not None
     assert uatlas is not None
+
+
+def test_clustering_benchmark():
+    """
+    Test that every clustering stage of the benchmark runs and recovers the planted parcels of synthetic BOLD data.
+    """
+    from benchmarks import bench_clustering
+
+    results = bench_clustering.run_benchmarks(sizes=[8], repeats=2)
+    assert len(results) == len(bench_clustering.get_methods())
+    for result in results:
+        assert result['status'] == 'ok', result
+        assert result['seconds'] is not None
+        if result['method'] in ['clust_ncut', 'clust_ward', 'discretisation']:
+            assert result['ari'] > 0.9, result
+            assert result['stability'] > 0.9, result
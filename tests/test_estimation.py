@@ -170,3 +170,279 @@ def test_extract_ts_rsn_coords(node_size, smooth, c_boot):
     assert te.smooth is not None
     assert te.dir_path is not None
     assert te.c_boot is not None
+
+
+@pytest.mark.parametrize("use_mask", [True, False])
+def test_multi_timeseries_extraction(tmp_path, use_mask):
+    """
+    Test for MultiTimeseriesExtraction functionality
+    """
+    import nibabel as nib
+    dir_path = str(tmp_path)
+    rng = np.random.RandomState(42)
+    affine = np.diag([2., 2., 2., 1.])
+    affine[:3, 3] = -10
+    func_img = nib.Nifti1Image(rng.randn(10, 10, 10, 40).astype('float32') + 100, affine)
+    func_img.header.set_zooms((2., 2., 2., 2.))
+    func_file = dir_path + '/func.nii.gz'
+    nib.save(func_img, func_file)
+    parcels = rng.randint(0, 5, (10, 10, 10)).astype('int16')
+    net_parcels_nii_path = dir_path + '/parcels.nii.gz'
+    nib.save(nib.Nifti1Image(parcels, affine), net_parcels_nii_path)
+    mask_data = np.zeros((10, 10, 10), dtype='uint8')
+    mask_data[1:9, 1:9, 1:9] = 1
+    mask = dir_path + '/mask.nii.gz'
+    nib.save(nib.Nifti1Image(mask_data, affine), mask)
+    mask = mask if use_mask else None
+    coords = [(0, 0, 0), (-4, 2, 4), (3.1, -2.2, 1)]
+
+    # The labels operator reproduces per-parcel means
+    operator, labels = fmri_estimation.labels_operator(nib.load(net_parcels_nii_path), func_img)
+    data = func_img.get_fdata().reshape(-1, 40)
+    assert np.array_equal(labels, np.arange(1, 5))
+    assert np.allclose(operator.dot(data)[0], data[parcels.ravel() == 1].mean(axis=0))
+
+    mte = fmri_estimation.MultiTimeseriesExtraction(func_file=func_file, conf=None, dir_path=dir_path, ID='002',
+                                                    network=None, roi=None, smooth_list=[0, 4],
+                                                    hpass_list=[None, 0.05], mask=mask,
+                                                    cache_dir=dir_path + '/cache')
+    mte.add_parcellation(net_parcels_nii_path)
+    mte.add_spheres(coords, 2)
+    mte.add_spheres(coords, 6)
+    mte.prepare_inputs()
+    mte.extract()
+    assert len(mte.ts_within_nodes) == 12
+
+    # Stacking targets over the union of their supports matches extracting each target alone
+    for i, target in enumerate(mte.targets):
+        single = fmri_estimation.MultiTimeseriesExtraction(func_file=func_file, conf=None, dir_path=dir_path,
+                                                           ID='002', network=None, roi=None, smooth_list=[4],
+                                                           hpass_list=[0.05], mask=mask,
+                                                           cache_dir=dir_path + '/cache')
+        if target['net_parcels_nii_path'] is not None:
+            single.add_parcellation(net_parcels_nii_path)
+        else:
+            single.add_spheres(coords, target['node_size'])
+        single.prepare_inputs()
+        single.extract()
+        assert np.allclose(single.ts_within_nodes[(0, 4, 0.05)], mte.ts_within_nodes[(i, 4, 0.05)], atol=1e-6)
+
+    out_paths = mte.save_and_cleanup()
+    assert len(set(out_paths.values())) == 12
+    assert np.load(out_paths[(0, 0, None)]).shape == (40, 4)
+    assert mte.targets[0]['labels'] == [1, 2, 3, 4]
+
+
+def test_labels_operator_outside_mask(tmp_path):
+    """
+    Test that labels_operator drops regions outside the mask, as NiftiLabelsMasker does
+    """
+    import nibabel as nib
+    from nilearn.maskers import NiftiLabelsMasker
+    rng = np.random.RandomState(42)
+    affine = np.diag([2., 2., 2., 1.])
+    func_img = nib.Nifti1Image(rng.randn(10, 10, 10, 30).astype('float32') + 100, affine)
+    parcels = rng.randint(1, 4, (10, 10, 10)).astype('int16')
+    parcels[:, :, 8:] = 7
+    mask_data = np.zeros((10, 10, 10), dtype='uint8')
+    mask_data[:, :, :8] = 1
+    labels_img = nib.Nifti1Image(parcels, affine)
+    mask_img = nib.Nifti1Image(mask_data, affine)
+
+    operator, labels = fmri_estimation.labels_operator(labels_img, func_img, mask_img)
+    assert np.array_equal(labels, [1, 2, 3])
+    assert operator.shape == (3, 1000)
+    expected = NiftiLabelsMasker(labels_img, mask_img=mask_img, resampling_target='data').fit_transform(func_img)
+    assert np.allclose(operator.dot(func_img.get_fdata().reshape(-1, 30)).T, expected, atol=1e-4)
+
+
+@pytest.mark.parametrize("node_size", [2, 6])
+def test_get_spheres_operator(tmp_path, node_size):
+    """
+    Test for get_spheres_operator functionality
+    """
+    import os
+    import nibabel as nib
+    cache_dir = str(tmp_path / 'cache')
+    affine = np.diag([2., 2., 2., 1.])
+    affine[:3, 3] = -10
+    func_img = nib.Nifti1Image(np.zeros((10, 10, 10, 5), dtype='float32'), affine)
+    mask_data = np.zeros((10, 10, 10), dtype='uint8')
+    mask_data[1:9, 1:9, 1:9] = 1
+    mask_img = nib.Nifti1Image(mask_data, affine)
+    coords = [(0, 0, 0), (-4, 2, 4), (3.1, -2.2, 1)]
+
+    operator = fmri_estimation.get_spheres_operator(coords, node_size, func_img, mask_img, cache_dir)
+    assert operator.shape == (3, 1000)
+    assert np.allclose(operator.sum(axis=1), 1)
+    assert np.all(mask_data.ravel()[operator.indices] == 1)
+    assert len(os.listdir(cache_dir)) == 1
+
+    cached = fmri_estimation.get_spheres_operator(coords, node_size, func_img, mask_img, cache_dir)
+    assert (cached != operator).nnz == 0
+    assert len(os.listdir(cache_dir)) == 1
+
+    # A different mask is a different key
+    fmri_estimation.get_spheres_operator(coords, node_size, func_img, None, cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+
+
+@pytest.mark.parametrize("hpass", [None, 0.05])
+def test_clean_node_signals(tmp_path, hpass):
+    """
+    Test for load_confounds and clean_node_signals functionality
+    """
+    import os
+    import pandas as pd
+    from nilearn.signal import clean
+    rng = np.random.RandomState(42)
+    confounds = pd.DataFrame({'a': rng.randn(40), 'b': np.linspace(0, 1, 40) ** 2, 'c': np.ones(40)})
+    confounds.iloc[0, 0] = np.nan
+    conf = str(tmp_path / 'confounds.tsv')
+    confounds.to_csv(conf, sep='\t', index=False)
+    node_signals = rng.randn(40, 5) + 100
+
+    conf_arr = fmri_estimation.load_confounds(conf)
+    assert conf_arr is fmri_estimation.load_confounds(conf)
+    assert not np.isnan(conf_arr).any()
+    assert conf_arr[0, 0] == pytest.approx(confounds['a'].mean())
+
+    t_r = 2. if hpass is not None else None
+    ts_within_nodes = fmri_estimation.clean_node_signals(node_signals.copy(), conf, hpass is None, hpass, t_r)
+    ts_nilearn = clean(node_signals.copy(), detrend=hpass is None, standardize=True, t_r=t_r, high_pass=hpass,
+                       confounds=np.array(conf_arr))
+    assert np.allclose(ts_within_nodes, ts_nilearn, atol=1e-8)
+    assert os.listdir(str(tmp_path)) == ['confounds.tsv']
+
+
+def test_timeseries_bootstrap():
+    """
+    Test for timeseries_bootstrap functionality on runs longer than 256 volumes
+    """
+    tseries = np.random.RandomState(42).randn(600, 10)
+    bseries, block_mask = fmri_estimation.timeseries_bootstrap(tseries, 20)
+    assert bseries.shape == tseries.shape
+    assert block_mask.max() > 255
+    assert np.array_equal(bseries, tseries[block_mask])
+    assert not np.array_equal(block_mask, fmri_estimation.timeseries_bootstrap(tseries, 20, random_state=0)[1])
+
+
+@pytest.mark.parametrize("kind", ['correlation', 'covariance'])
+def test_bootstrap_connectome_ensemble(kind):
+    """
+    Test for bootstrap_connectome_ensemble functionality
+    """
+    rng = np.random.RandomState(42)
+    tseries = np.dot(rng.randn(300, 8), rng.randn(8, 8))
+    n_boot = 50
+    conn_mean, conn_var, conn_ci_lower, conn_ci_upper = \
+        fmri_estimation.bootstrap_connectome_ensemble(tseries, 10, n_boot, kind=kind, batch_size=7)
+
+    block_masks = fmri_estimation.bootstrap_block_indices(300, 10, n_boot)
+    assert block_masks.shape == (n_boot, 300)
+    assert len(np.unique(block_masks[:, 0])) > 1
+    func = np.corrcoef if kind == 'correlation' else np.cov
+    conns = np.array([func(tseries[block_mask].T) for block_mask in block_masks])
+    assert np.allclose(conn_mean, conns.mean(axis=0))
+    assert np.allclose(conn_var, conns.var(axis=0, ddof=1))
+    assert np.allclose(conn_ci_lower, np.percentile(conns, 2.5, axis=0), rtol=1e-5, atol=1e-6)
+    assert np.all(conn_ci_lower <= conn_ci_upper)
+
+    # A zero memory budget computes one replicate per batch, with the same results
+    for stat, stat_budget in zip((conn_mean, conn_var, conn_ci_lower, conn_ci_upper),
+                                 fmri_estimation.bootstrap_connectome_ensemble(tseries, 10, n_boot, kind=kind,
+                                                                               chunk_mb=0)):
+        assert np.allclose(stat, stat_budget)
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_fit_shrunk_graphical_lasso(n_jobs):
+    """
+    Test for fit_shrunk_graphical_lasso functionality
+    """
+    from sklearn.covariance import empirical_covariance
+    # Fewer samples than variables gives a singular empirical covariance
+    emp_cov = empirical_covariance(np.random.RandomState(42).randn(30, 40))
+    estimator = fmri_estimation.fit_shrunk_graphical_lasso(emp_cov, n_jobs=n_jobs)
+    assert estimator.shrinkage == pytest.approx(0.8)
+    assert estimator.precision_.shape == (40, 40)
+    assert np.all(np.isfinite(estimator.precision_))
+    assert np.allclose(np.dot(estimator.covariance_, estimator.precision_), np.eye(40), atol=1e-3)
+
+
+def test_get_conn_matrices():
+    """
+    Test for get_conn_matrices functionality
+    """
+    time_series = np.dot(np.random.RandomState(42).randn(200, 10), np.random.RandomState(0).randn(10, 10))
+    conn_model_list = ['corr', 'partcorr', 'cov', 'sps']
+    conn_matrices = fmri_estimation.get_conn_matrices(time_series, conn_model_list)
+    assert sorted(conn_matrices.keys()) == sorted(conn_model_list)
+    for conn_model in conn_model_list:
+        conn_matrix = fmri_estimation.estimate_conn_matrix(time_series, conn_model)
+        assert np.allclose(conn_matrices[conn_model], conn_matrix)
+        assert np.array_equal(conn_matrix, conn_matrix.T)
+
+
+@pytest.mark.parametrize("conn_model,kind", [('corr', 'correlation'), ('partcorr', 'partial correlation')])
+def test_estimate_conn_matrix_nilearn(conn_model, kind):
+    """
+    Test that estimate_conn_matrix reproduces nilearn's ConnectivityMeasure, alone and with shared statistics
+    """
+    from nilearn.connectome import ConnectivityMeasure
+    rng = np.random.RandomState(42)
+    time_series = rng.randn(120, 15).dot(rng.randn(15, 15)) * np.linspace(0.1, 10, 15)
+    expected = ConnectivityMeasure(kind=kind).fit_transform([time_series])[0]
+    expected = np.maximum(expected, expected.T)
+    assert np.allclose(fmri_estimation.estimate_conn_matrix(time_series, conn_model), expected, atol=1e-10)
+    conn_matrices = fmri_estimation.get_conn_matrices(time_series, ['corr', 'partcorr'])
+    assert np.allclose(conn_matrices[conn_model], expected, atol=1e-10)
+
+
+def test_ledoit_wolf_covariance():
+    """
+    Test that ledoit_wolf_covariance reproduces sklearn's LedoitWolf from the shared covariance statistics
+    """
+    from sklearn.covariance import LedoitWolf
+    rng = np.random.RandomState(42)
+    for n_samples, n_features in [(50, 10), (20, 40), (100, 1)]:
+        time_series = rng.randn(n_samples, n_features) * rng.rand(n_features) * 10 + 3
+        stats = fmri_estimation.covariance_stats(time_series)
+        assert np.allclose(fmri_estimation.ledoit_wolf_covariance(stats['empirical_covariance'], stats['sq_norms']),
+                           LedoitWolf(store_precision=False).fit(time_series).covariance_)
+        standardized = (time_series - time_series.mean(axis=0)) / time_series.std(axis=0, ddof=1)
+        assert np.allclose(fmri_estimation.ledoit_wolf_covariance(
+            stats['empirical_covariance'] / np.outer(stats['std'], stats['std']), stats['sq_norms_std']),
+            LedoitWolf(store_precision=False).fit(standardized).covariance_)
+
+
+@pytest.mark.parametrize("forgetting", [1., 0.9])
+def test_online_connectivity_estimator(forgetting):
+    """
+    Test OnlineConnectivityEstimator and iter_dynamic_conn_matrices functionality
+    """
+    from nilearn.connectome import cov_to_corr, prec_to_partial
+    rng = np.random.RandomState(42)
+    time_series = rng.randn(200, 6).dot(rng.randn(6, 6)) + 5
+
+    # Reference: weighted statistics of the concatenated time-series
+    weights = forgetting ** np.arange(len(time_series) - 1, -1, -1)
+    mean = weights.dot(time_series) / weights.sum()
+    centered = time_series - mean
+    cov = (centered * weights[:, np.newaxis]).T.dot(centered) / weights.sum()
+
+    estimator = fmri_estimation.OnlineConnectivityEstimator(forgetting=forgetting)
+    for chunk in np.array_split(time_series, [1, 17, 60, 61, 150]):
+        estimator.partial_fit(chunk)
+    assert estimator.n_samples_ == 200
+    assert np.allclose(estimator.mean_, mean)
+    assert np.allclose(estimator.get_conn_matrix('cov'), cov)
+    assert np.allclose(estimator.get_conn_matrix('corr'), cov_to_corr(cov))
+    assert np.allclose(estimator.get_conn_matrix('partcorr'), prec_to_partial(np.linalg.inv(cov)))
+
+    conn_matrices = list(fmri_estimation.iter_dynamic_conn_matrices(np.array_split(time_series, 20), 'corr', forgetting))
+    assert len(conn_matrices) == 20
+    assert np.allclose(conn_matrices[-1], cov_to_corr(cov))
+
+    with pytest.raises(ValueError):
+        estimator.partial_fit(time_series[:, :3])
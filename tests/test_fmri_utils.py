@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Created on Mon Oct 19 2026
+
+@authors: Derek Pisner & Ryan Hammonds
+
+"""
+import pytest
+import numpy as np
+import nibabel as nib
+from pynets.fmri import fmri_utils
+
+
+@pytest.mark.parametrize("chunk_mb", [0, 1])
+@pytest.mark.parametrize("smooth", [None, 4])
+def test_bold_voxel_matrix(tmp_path, chunk_mb, smooth):
+    """
+    Test decompress_bold and bold_voxel_matrix functionality
+    """
+    from nilearn.image import smooth_img
+    rng = np.random.RandomState(42)
+    affine = np.diag([2., 2., 2., 1.])
+    data = rng.randn(20, 20, 20, 50).astype('float32')
+    func_file = str(tmp_path / 'func.nii.gz')
+    nib.save(nib.Nifti1Image(data, affine), func_file)
+    cache_dir = str(tmp_path / 'cache')
+
+    out_file = fmri_utils.decompress_bold(func_file, cache_dir)
+    assert out_file.startswith(cache_dir) and out_file.endswith('.nii')
+    assert fmri_utils.decompress_bold(func_file, cache_dir) == out_file
+    func_img = fmri_utils.load_bold(func_file, cache_dir)
+    assert np.array_equal(np.asarray(func_img.dataobj), data)
+
+    # A zero budget streams one volume at a time
+    assert fmri_utils.volumes_per_chunk(func_img, chunk_mb) == (1 if chunk_mb == 0 else 32)
+    voxels = np.sort(rng.choice(20 ** 3, 500, replace=False))
+    X = fmri_utils.bold_voxel_matrix(func_img, voxels, smooth, chunk_mb, cache_dir)
+    if smooth is not None:
+        data = smooth_img(nib.Nifti1Image(data, affine), smooth).get_fdata()
+    assert X.dtype == np.float32
+    assert np.allclose(X, data.reshape(-1, 50)[voxels], atol=1e-5)
+
+    vol_img = fmri_utils.get_volume(func_img, 1)
+    assert vol_img.shape == (20, 20, 20)
+
+
+@pytest.mark.parametrize("fwhm", [2, 6])
+def test_smooth_bold(tmp_path, fwhm):
+    """
+    Test smooth_bold functionality
+    """
+    from nilearn.image import smooth_img
+    rng = np.random.RandomState(42)
+    affine = np.diag([2., 3., 2., 1.])
+    data = rng.randn(12, 10, 8, 30).astype('float32')
+    func_file = str(tmp_path / 'func.nii')
+    nib.save(nib.Nifti1Image(data, affine), func_file)
+    cache_dir = str(tmp_path / 'cache')
+
+    func_img = nib.load(func_file)
+    smooth_img_cached = fmri_utils.smooth_bold(func_img, fwhm, cache_dir, chunk_mb=0)
+    out_file = smooth_img_cached.get_filename()
+    assert out_file.startswith(cache_dir) and "%s%s" % (float(fwhm), 'fwhm') in out_file
+    assert np.allclose(smooth_img_cached.affine, affine)
+    assert np.allclose(np.asarray(smooth_img_cached.dataobj),
+                       smooth_img(nib.Nifti1Image(data, affine), fwhm).get_fdata(), atol=1e-5)
+
+    # A second request at the same width reuses the cached image
+    assert fmri_utils.smooth_bold(func_img, fwhm, cache_dir).get_filename() == out_file
+
+
+@pytest.mark.parametrize("smooth", [None, 4])
+def test_bold_operator_signals(tmp_path, smooth):
+    """
+    Test that bold_operator_signals reduces each chunk as the operator would reduce the voxel matrix
+    """
+    from scipy.sparse import random as sparse_random
+    rng = np.random.RandomState(42)
+    affine = np.diag([2., 2., 2., 1.])
+    data = rng.randn(10, 10, 10, 40).astype('float32')
+    func_file = str(tmp_path / 'func.nii')
+    nib.save(nib.Nifti1Image(data, affine), func_file)
+    cache_dir = str(tmp_path / 'cache')
+
+    func_img = nib.load(func_file)
+    voxels = np.sort(rng.choice(1000, 200, replace=False))
+    operator = sparse_random(7, 200, density=0.1, format='csr', random_state=0)
+    signals = fmri_utils.bold_operator_signals(func_img, operator, voxels, smooth, 0, cache_dir)
+    X = fmri_utils.bold_voxel_matrix(func_img, voxels, smooth, cache_dir=cache_dir)
+    assert signals.shape == (7, 40)
+    assert np.allclose(signals, operator.dot(X))
+
+
+def test_prune_bold_cache(tmp_path):
+    """
+    Test that prune_bold_cache evicts the least recently used images first and never the ones it is told to keep
+    """
+    import os
+    cache_dir = str(tmp_path / 'cache')
+    os.makedirs(cache_dir)
+    paths = []
+    for i in range(4):
+        path = "%s%s%s%s" % (cache_dir, '/img', i, '.nii')
+        with open(path, 'wb') as f:
+            f.write(b'\x00' * 1024)
+        os.utime(path, (1000 + i, 1000 + i))
+        paths.append(path)
+    with open("%s%s" % (cache_dir, '/.partial-img.nii'), 'wb') as f:
+        f.write(b'\x00' * 4096)
+
+    removed = fmri_utils.prune_bold_cache(cache_dir, max_gb=2048 / 1073741824, keep=[paths[0]])
+    assert removed == paths[1:3]
+    assert sorted(os.listdir(cache_dir)) == ['.lock', '.partial-img.nii', 'img0.nii', 'img3.nii']
+
+
+def test_prune_bold_cache_locked(tmp_path):
+    """
+    Test that prune_bold_cache leaves the cache alone while an image is being opened, and that an opened image stays
+    readable after it is evicted
+    """
+    import os
+    rng = np.random.RandomState(42)
+    data = rng.randn(6, 6, 6, 10).astype('float32')
+    func_file = str(tmp_path / 'func.nii.gz')
+    nib.save(nib.Nifti1Image(data, np.eye(4)), func_file)
+    cache_dir = str(tmp_path / 'cache')
+
+    out_file = fmri_utils.decompress_bold(func_file, cache_dir)
+    with fmri_utils._BoldCacheLock(cache_dir):
+        assert fmri_utils.prune_bold_cache(cache_dir, max_gb=0) == []
+    assert os.path.isfile(out_file)
+
+    func_img = fmri_utils.load_bold(func_file, cache_dir)
+    assert fmri_utils.prune_bold_cache(cache_dir, max_gb=0) == [out_file]
+    assert not os.path.isfile(out_file)
+    assert np.allclose(np.concatenate([chunk for _, _, chunk in fmri_utils.iter_bold_chunks(func_img, 0)], axis=3),
+                       data)
+
+
+def test_iter_bold_chunks_scaled(tmp_path):
+    """
+    Test that iter_bold_chunks reads integer images in their on-disk dtype and applies the scaling per chunk
+    """
+    data = np.arange(4 * 5 * 6 * 7, dtype=np.int16).reshape(4, 5, 6, 7)
+    img = nib.Nifti1Image(data, np.eye(4))
+    img.header.set_data_dtype(np.int16)
+    img.header.set_slope_inter(0.5, 10)
+    func_file = str(tmp_path / 'func.nii')
+    nib.save(img, func_file)
+
+    func_img = nib.load(func_file, mmap=True)
+    assert fmri_utils._unscaled_bold(func_img)[0].dtype == np.int16
+    chunks = list(fmri_utils.iter_bold_chunks(func_img, 0))
+    assert len(chunks) == 7 and all([chunk.dtype == np.float32 for _, _, chunk in chunks])
+    assert np.allclose(np.concatenate([chunk for _, _, chunk in chunks], axis=3), data * 0.5 + 10)
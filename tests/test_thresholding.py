@@ -221,6 +221,23 @@ def test_edge_cases(thr):
     assert conn_mat_edge_one is not None
 
 
+def test_local_thresholding_prop_pruned():
+    """Isolated nodes are pruned and the MST is grown on the remaining nodes to the target density."""
+    x = np.random.RandomState(1).rand(12, 12)
+    x = (x + x.T) / 2
+    np.fill_diagonal(x, 0)
+    x[[3, 7], :] = 0
+    x[:, [3, 7]] = 0
+    coords = [idx for idx, val in enumerate(x)]
+    labels = ['ROI_' + str(idx) for idx, val in enumerate(x)]
+
+    conn_matrix_thr, coords, labels = thresholding.local_thresholding_prop(x, coords, labels, 0.3)
+    assert conn_matrix_thr.shape == (10, 10)
+    assert 'ROI_3' not in labels and 'ROI_7' not in labels
+    assert np.count_nonzero(np.triu(conn_matrix_thr)) == int(0.3 * 45)
+    assert nx.is_connected(nx.from_numpy_array(conn_matrix_thr))
+
+
 @pytest.mark.parametrize("type,parc,all_zero,frag_g",
     [
         pytest.param('func', True, True, True, marks=pytest.mark.xfail),
@@ -348,3 +365,145 @@ def test_thresh_func(type, parc, all_zero, min_span_tree, disp_filt, dens_thresh
     assert streams is not None
     assert directget is not None
 
+
+
+@pytest.mark.parametrize("k", [1, 3, 9, 20])
+def test_knn_mask(k):
+    """ Compare the vectorised kNN mask against a row-by-row reference selection, including NaN handling.
+    """
+    n = 12
+    x = np.random.rand(n, n)
+    x = (x + x.T) / 2
+    x[2, 5] = x[5, 2] = np.nan
+
+    ref = np.zeros((n, n), dtype=bool)
+    for i in range(n):
+        line = x[i].copy()
+        line[i] = np.nan
+        cands = np.where(~np.isnan(line))[0]
+        ref[i, cands[np.argsort(-line[cands])][:k]] = True
+
+    directed = thresholding.knn_mask(x, k, mode='directed', sparse=False)
+    assert np.array_equal(directed, ref)
+    assert not np.any(np.diag(directed))
+    assert not directed[2, 5] and not directed[5, 2]
+
+    symmetric = thresholding.knn_mask(x, k, mode='symmetric')
+    assert np.array_equal(symmetric.toarray(), ref | ref.T)
+    mutual = thresholding.knn_mask(x, k, mode='mutual', sparse=False)
+    assert np.array_equal(mutual, ref & ref.T)
+
+    gra = thresholding.knn(x, k)
+    assert gra.number_of_nodes() == n
+    assert gra.number_of_edges() == np.count_nonzero(np.triu(ref | ref.T))
+
+    with pytest.raises(ValueError):
+        thresholding.knn_mask(x, k, mode='foo')
+
+
+@pytest.mark.parametrize("symmetric", [True, False])
+@pytest.mark.parametrize("compress", [True, False])
+def test_threshold_family(tmp_path, symmetric, compress):
+    """ Materialized variants from a saved threshold family store must match threshold_proportional.
+    """
+    x = np.random.rand(20, 20)
+    if symmetric is True:
+        x = (x + x.T) / 2
+
+    family_path = str(tmp_path / 'family.npz')
+    thresholding.ThresholdFamily(x).save(family_path, compress=compress)
+    family = thresholding.ThresholdFamily.load(family_path, mmap=True)
+    assert isinstance(family.raw, np.memmap) is not compress
+
+    for thr in [0.0, 0.1, 0.35, 0.6, 1.0]:
+        assert np.array_equal(family.materialize(thr), thresholding.threshold_proportional(x, thr))
+
+    est_path = str(tmp_path / '002_est-corr_thrtype-prop_thr-0.35.npy')
+    assert thresholding.get_family_path(est_path) == str(tmp_path / '002_est-corr_thrtype-prop_family.npz')
+    thresholding.ThresholdFamily(x).save(thresholding.get_family_path(est_path))
+    assert np.array_equal(thresholding.load_thresholded(est_path), thresholding.threshold_proportional(x, 0.35))
+
+    with pytest.raises(ValueError):
+        family.materialize(1.5)
+
+
+def test_thresh_func_family(tmp_path):
+    """ Thresholding into a family store must materialize the latest raw matrix at est_path.
+    """
+    import os
+    dir_path = str(tmp_path)
+    coords = [(i, i, i) for i in range(10)]
+    labels = list(range(10))
+    for seed in [1, 2]:
+        x = np.random.RandomState(seed).rand(10, 10)
+        x = (x + x.T) / 2
+        est_path = thresholding.thresh_func(False, 0.3, x, 'corr', None, '002', dir_path, None, 'parc', False, 0,
+                                            False, True, True, 'atlas', None, labels, coords, 0, 1, False, 0,
+                                            thr_family=True)[2]
+        assert not os.path.isfile(est_path)
+        assert os.path.isfile(thresholding.get_family_path(est_path))
+        assert np.array_equal(thresholding.load_thresholded(est_path), thresholding.threshold_proportional(x, 0.3))
+
+
+@pytest.mark.parametrize("method", ['inv', 'emax', 'neglog'])
+def test_distance_transform(method):
+    """ Array-level distance transforms must only touch existing edges and agree with the graph-level conversion.
+    """
+    x = np.random.rand(10, 10)
+    x = thresholding.threshold_proportional((x + x.T) / 2, 0.5)
+
+    # A full-strength edge must remain a connection under every transform
+    x[0, 1] = x[1, 0] = 1.
+    edges = x != 0
+
+    d = thresholding.distance_transform(x, method=method)
+    assert np.array_equal(d != 0, edges)
+    assert np.all(d[edges] > 0)
+    if method == 'inv':
+        assert np.allclose(d[edges], 1. / x[edges])
+        assert np.array_equal(d, thresholding.weight_conversion(x, 'lengths'))
+    elif method == 'emax':
+        assert np.allclose(d[edges], x[edges].max() + 1 / 10. - x[edges])
+        G = thresholding.weight_to_distance(nx.from_numpy_array(x))
+        for u, v, dist in G.edges(data='distance'):
+            assert np.isclose(dist, d[u, v])
+        G.remove_node(3)
+        G = thresholding.weight_to_distance(G)
+        for u, v, dist in G.edges(data='distance'):
+            assert np.isclose(dist, np.max([w for _, _, w in G.edges(data='weight')]) + 1 / 9. - G[u][v]['weight'])
+
+        # Edges of zero weight are at the largest distance, as with the per-edge conversion
+        G.add_edge(0, 2, weight=0.)
+        G = thresholding.weight_to_distance(G)
+        assert np.isclose(G[0][2]['distance'], np.max([w for _, _, w in G.edges(data='weight')]) + 1 / 9.)
+    else:
+        assert np.allclose(d[edges], np.maximum(-np.log(x[edges]), np.finfo(np.float64).eps))
+
+    x_cp = x.copy()
+    thresholding.distance_transform(x_cp, method=method, copy=False)
+    assert np.array_equal(x_cp, d)
+
+    with pytest.raises(ValueError):
+        thresholding.distance_transform(x, method='foo')
+
+
+def test_reference_equivalence():
+    """ Optimized thresholding implementations must reproduce the masks of their reference versions.
+    """
+    from benchmarks import bench_thresholding
+
+    results = bench_thresholding.check_equivalence(sizes=[60])
+    assert len(results) == len(bench_thresholding.get_equivalence_checks())
+    for result in results:
+        assert result['identical_mask'], result
+        assert np.isclose(result['max_abs_diff'], 0), result
+
+
+def test_is_connected():
+    """ Connectivity from scipy connected components must agree with NetworkX.
+    """
+    x = np.random.rand(10, 10)
+    x = (x + x.T) / 2
+    assert thresholding.is_connected(x) is nx.is_connected(nx.from_numpy_array(x)) is True
+    x[0, :] = x[:, 0] = 0
+    assert thresholding.is_connected(x) is nx.is_connected(nx.from_numpy_array(x)) is False
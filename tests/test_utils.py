@@ -344,6 +344,53 @@ def test_save_mat(fmt):
         shutil.move(save_mat_dir + '_tmp', save_mat_dir)
 
 
+@pytest.mark.parametrize("symmetric", [True, False])
+def test_save_mat_npy_roundtrip(tmp_path, symmetric):
+    """
+    Test that the direct-write path of save_mat matches the NetworkX graph round-trip
+    """
+    import networkx as nx
+    conn_matrix = np.random.rand(10, 10)
+    if symmetric is True:
+        conn_matrix = conn_matrix + conn_matrix.T
+    conn_matrix[2, 3] = conn_matrix[3, 2] = 0
+    est_path = str(tmp_path / 'G_out.npy')
+
+    utils.save_mat(conn_matrix, est_path)
+    expected = nx.to_numpy_array(nx.convert_node_labels_to_integers(nx.from_numpy_array(conn_matrix),
+                                                                    first_label=1))
+    assert np.array_equal(np.load(est_path), expected)
+
+
+@pytest.mark.parametrize("link_type", ['auto', 'hardlink', 'symlink', 'copy', 'inplace'])
+def test_stage_input(tmp_path, link_type):
+    """
+    Test stage_input functionality
+    """
+    in_file = str(tmp_path / 'func.nii.gz')
+    with open(in_file, 'wb') as f:
+        f.write(os.urandom(3 * 1048576 + 17))
+    node_dir = tmp_path / 'node'
+    node_dir.mkdir()
+
+    out_file = utils.stage_input(in_file, str(node_dir), link_type=link_type)
+    if link_type == 'inplace':
+        assert out_file == in_file
+    else:
+        assert out_file == str(node_dir / 'func_tmp.nii.gz')
+        assert os.path.islink(out_file) is (link_type == 'symlink')
+        assert os.path.samefile(in_file, out_file) is (link_type in ['auto', 'hardlink', 'symlink'])
+    assert utils.file_fingerprint(out_file) == utils.file_fingerprint(in_file)
+
+    # Re-staging reuses a matching file and replaces a stale one
+    assert utils.stage_input(in_file, str(node_dir), link_type=link_type) == out_file
+    if link_type == 'copy':
+        with open(out_file, 'wb') as f:
+            f.write(b'stale')
+        out_file = utils.stage_input(in_file, str(node_dir), link_type=link_type)
+        assert utils.file_fingerprint(out_file) == utils.file_fingerprint(in_file)
+
+
 @pytest.mark.parametrize("node_size", [6, None])
 @pytest.mark.parametrize("hpass", [100, None])
 @pytest.mark.parametrize("smooth", [6, None])